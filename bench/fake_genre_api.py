@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Endpoint chat-completions factice pour la détection de genre par lots (benchmarks et essais sans clé xAI).
+
+Répond au format de genre_classifier.py : la liste JSON d'albums du message utilisateur reçoit un objet
+{"albums": [{"id", "genre"}]} dont le genre est tiré de façon déterministe de l'artiste et de l'album.
+
+    python3 bench/fake_genre_api.py --port 8089 --latency 0.5 --fail-rate 0.1
+
+puis grok_api.endpoint = "http://127.0.0.1:8089/v1/chat/completions" dans config.json.
+"""
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GENRES = ("Pop", "Rock", "Rap Français", "House", "Electro", "Jazz", "Soul", "Latin")
+
+def fake_genre(artist, album):
+    return GENRES[zlib.crc32(f"{artist}|{album}".encode()) % len(GENRES)]
+
+class FakeGenreApi:
+    """Serveur lancé dans un thread ; compte les requêtes et les albums classés."""
+
+    def __init__(self, port=0, bind='127.0.0.1', latency=0.0, fail_rate=0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.albums = 0
+        self.failures = 0
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, answer = api.answer(body)
+                payload = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((bind, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-genre-api', daemon=True)
+        self.thread.start()
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def answer(self, body):
+        with self.lock:
+            self.requests += 1
+            number = self.requests
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and zlib.crc32(str(number).encode()) % 10000 / 10000 < self.fail_rate:
+            with self.lock:
+                self.failures += 1
+            return 503, {"error": "indisponible (simulé)"}
+        try:
+            request = json.loads(body)
+            content = request["messages"][-1]["content"]
+            albums = json.loads(content[content.index("["):])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return 400, {"error": "requête illisible"}
+        with self.lock:
+            self.albums += len(albums)
+        genres = [{"id": item.get("id"), "genre": fake_genre(item.get("artist"), item.get("album"))} for item in albums]
+        return 200, {"choices": [{"message": {"role": "assistant", "content": json.dumps({"albums": genres}, ensure_ascii=False)}}]}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Endpoint factice de détection de genre par lots.")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--bind', default='127.0.0.1')
+    parser.add_argument('--latency', type=float, default=0.0, help="Durée simulée de chaque requête (secondes).")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Part des requêtes en erreur 503 (entre 0 et 1).")
+    args = parser.parse_args()
+
+    api = FakeGenreApi(args.port, args.bind, args.latency, args.fail_rate)
+    print(f"Endpoint factice : {api.endpoint}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.close()
+        print(f"{api.requests} requête(s), {api.albums} album(s) classé(s), {api.failures} erreur(s) simulée(s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Provider factice (spotdl / zotify) pour les benchmarks : écrit des MP3 synthétiques taggés sans accès réseau.
+
+Appelé par les lanceurs 'spotdl' et 'zotify' générés par run_bench.py ; paramétré par variables d'environnement :
+FAKE_PROVIDER_TRACKS (morceaux par playlist/album), FAKE_PROVIDER_TRACK_BYTES, FAKE_PROVIDER_TRACK_SECONDS
+(durée simulée par morceau), FAKE_PROVIDER_FAIL_RATE et FAKE_PROVIDER_STDERR_RATE (entre 0 et 1).
+"""
+import os
+import sys
+import time
+import zlib
+from urllib.parse import urlsplit
+from synthetic import write_mp3, track_tags
+
+def env_number(name, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def fraction(url, salt):
+    """Tirage déterministe dans [0, 1) : une même URL échoue (ou avertit) à chaque exécution."""
+    return zlib.crc32(f"{salt}:{url}".encode()) % 10000 / 10000
+
+def parse_args(argv):
+    provider = argv[0]
+    url = argv[1] if len(argv) > 1 else ''
+    option = '--output' if provider == 'spotdl' else '--root-path'
+    output = argv[argv.index(option) + 1] if option in argv else '.'
+    return provider, url, output
+
+def main():
+    provider, url, output = parse_args(sys.argv[1:])
+    tracks = env_number('FAKE_PROVIDER_TRACKS', 10, int)
+    track_bytes = env_number('FAKE_PROVIDER_TRACK_BYTES', 4 * 1024 * 1024, int)
+    track_seconds = env_number('FAKE_PROVIDER_TRACK_SECONDS', 0.0)
+    fail_rate = env_number('FAKE_PROVIDER_FAIL_RATE', 0.0)
+    stderr_rate = env_number('FAKE_PROVIDER_STDERR_RATE', 0.1)
+
+    parts = [part for part in urlsplit(url).path.split('/') if part]
+    url_type, item_id = (parts[0], parts[1]) if len(parts) >= 2 else ('track', url)
+    count = 1 if url_type == 'track' else tracks
+
+    print(f"Processing query: {url}", flush=True)
+    if fraction(url, 'fail') < fail_rate:
+        print(f"LookupError: No results found for song: {url}", file=sys.stderr, flush=True)
+        return 1
+    if url_type != 'track':
+        print(f"Found {count} songs in Bench {url_type.capitalize()} {item_id} ({url_type.capitalize()})", flush=True)
+
+    os.makedirs(output, exist_ok=True)
+    for index in range(count):
+        tags = track_tags(item_id, index)
+        if track_seconds:
+            time.sleep(track_seconds)
+        if fraction(f"{url}:{index}", 'stderr') < stderr_rate:
+            print(f"WARNING: YT-DLP rate limited for {tags['title']}, retrying in 1s", file=sys.stderr, flush=True)
+        path = os.path.join(output, f"{tags['artist']} - {tags['title']}.mp3")
+        write_mp3(path, track_bytes, tags)
+        if provider == 'spotdl':
+            print(f"Downloaded \"{tags['artist']} - {tags['title']}\": https://open.spotify.com/track/{item_id}x{index}", flush=True)
+        else:
+            print(f"({index + 1}/{count}) Downloaded \"{tags['title']}\"", flush=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
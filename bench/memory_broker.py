@@ -0,0 +1,65 @@
+import time
+import threading
+from collections import defaultdict, deque
+
+class MemoryMessage:
+    """Message en mémoire exposant les attributs d'un message aio-pika utilisés par le consommateur."""
+
+    def __init__(self, queue, body, headers=None, content_type='application/json'):
+        self.queue = queue
+        self.body = body.encode() if isinstance(body, str) else body
+        self.headers = headers
+        self.content_type = content_type
+        self.timestamp = None
+        self.published_at = time.monotonic()
+
+class MemoryBroker:
+    """Remplace RabbitMQ et l'AmqpBroker du consommateur : files en mémoire, prefetch par file, acquittements comptés.
+
+    Seules les files passées à run() sont consommées ; les autres (statuts, retentatives, file morte) ne font
+    qu'accumuler les messages publiés.
+    """
+
+    def __init__(self, prefetch=1):
+        self.prefetch = prefetch
+        self.queues = defaultdict(deque)
+        self.unacked = defaultdict(int)
+        self.published = defaultdict(int)
+        self.acked = 0
+        self.end_to_end = []  # Secondes entre la publication et l'acquittement de chaque message
+        self.condition = threading.Condition()
+
+    def publish(self, queue, body, headers=None, content_type='application/json', expiration=None, persistent=True):
+        with self.condition:
+            self.queues[queue].append(MemoryMessage(queue, body, headers, content_type))
+            self.published[queue] += 1
+            self.condition.notify_all()
+
+    def ack(self, message):
+        with self.condition:
+            self.unacked[message.queue] -= 1
+            self.acked += 1
+            self.end_to_end.append(time.monotonic() - message.published_at)
+            self.condition.notify_all()
+
+    def _next_deliveries(self, consumers):
+        deliveries = []
+        for job_class, queue in consumers.items():
+            pending = self.queues[queue]
+            while pending and self.unacked[queue] < self.prefetch:
+                self.unacked[queue] += 1
+                deliveries.append((job_class, pending.popleft()))
+        return deliveries
+
+    def run(self, pool, consumers):
+        """Livre les messages de consumers ({classe de job: file}) au pool jusqu'à ce que tout soit acquitté."""
+        while True:
+            with self.condition:
+                deliveries = self._next_deliveries(consumers)
+                if not deliveries:
+                    if all(not self.queues[queue] and self.unacked[queue] <= 0 for queue in consumers.values()):
+                        return
+                    self.condition.wait(timeout=0.5)
+                    continue
+            for job_class, message in deliveries:
+                pool.on_message(job_class, message)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Benchmarks hors ligne du pipeline téléchargement → tag → déplacement (sans Spotify, RabbitMQ ni bibliothèque réelle).
+
+Le vrai pool de queue_consumer.py et le vrai tag_rename_move.py tournent contre un broker en mémoire et un provider
+factice (fake_provider.py) qui écrit des MP3 synthétiques. Les résultats (jobs/min, morceaux/s, p50/p95 par étape)
+sont écrits en JSON pour comparer les exécutions :
+
+    python3 bench/run_bench.py singles --jobs 50 --workers 4
+    python3 bench/run_bench.py mixed --jobs 10 --singles 20 --tracks 30 --track-seconds 0.05
+    python3 bench/run_bench.py tag --files 500 --output /tmp/tag.json
+    python3 bench/run_bench.py tag --files 500 --unknown-genre-rate 0.5 --ai-latency 0.5
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from fake_genre_api import FakeGenreApi
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+CLI_DIR = os.path.join(REPO_DIR, 'cli')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+SCENARIOS = ('singles', 'playlists', 'fanout', 'mixed', 'tag')
+
+def summarize(values):
+    """count / moyenne / p50 / p95 / max (rang le plus proche) d'une liste de mesures."""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def rank(percent):
+        return ordered[min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered) + 0.5) - 1))]
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 4),
+        'p50': round(rank(50), 4),
+        'p95': round(rank(95), 4),
+        'max': round(ordered[-1], 4)
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def prepare_environment(workdir, args):
+    """Crée config.json, le faux venv (lanceurs spotdl/zotify) et les dossiers du benchmark ; exporte les variables."""
+    with open(os.path.join(REPO_DIR, 'etc', 'config.json.sample'), 'r') as f:
+        config = json.load(f)
+    config['paths'].update({'downloads': os.path.join(workdir, 'downloads') + '/', 'music': os.path.join(workdir, 'music') + '/'})
+    config['playlist_download']['provider'] = args.provider
+    config['playlist_download']['job-timeout'] = 0
+    config['spotify'].update({'client_id': 'bench', 'client_secret': 'bench'})
+    config['consumer']['workers'] = args.workers
+    config['consumer']['provider-concurrency'] = {args.provider: args.provider_concurrency or args.workers}
+    config['consumer']['bulk-share-percent'] = args.bulk_share
+    config['events']['enabled'] = args.events
+    config['dedup'] = {'enabled': True, 'window-seconds': 0}
+    config['metrics'] = {'enabled': False}
+    config['tag'] = {'genre-tagging-mode': 'ai' if args.ai_endpoint else 'mapping', 'workers': args.tag_workers}
+    if args.ai_endpoint:
+        config['grok_api'].update({'api_key': 'bench', 'endpoint': args.ai_endpoint})
+    config['fanout'] = {'enabled': args.scenario == 'fanout', 'resolver': 'stub', 'stub-file': os.path.join(workdir, 'fanout.json'), 'min-tracks': 2}
+    config_path = os.path.join(workdir, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+    bin_dir = os.path.join(workdir, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    for provider in ('spotdl', 'zotify'):
+        launcher = os.path.join(bin_dir, provider)
+        with open(launcher, 'w') as f:
+            f.write(f"#!/bin/bash\nexec {sys.executable} {os.path.join(BENCH_DIR, 'fake_provider.py')} {provider} \"$@\"\n")
+        os.chmod(launcher, 0o755)
+    activate = os.path.join(workdir, 'activate')
+    with open(activate, 'w') as f:
+        f.write(f"export PATH={bin_dir}:$PATH\n")
+
+    os.environ.update({
+        'NAVIDROME_TOOL_CONFIG': config_path,
+        'NAVIDROME_TOOL_LOG_DIR': os.path.join(workdir, 'log'),
+        'FAKE_PROVIDER_TRACKS': str(args.tracks),
+        'FAKE_PROVIDER_TRACK_BYTES': str(args.track_bytes),
+        'FAKE_PROVIDER_TRACK_SECONDS': str(args.track_seconds),
+        'FAKE_PROVIDER_FAIL_RATE': str(args.fail_rate),
+        'FAKE_PROVIDER_STDERR_RATE': str(args.stderr_rate)
+    })
+    # Les modules de cli/ lisent ces variables à l'import : ils ne sont importés qu'à partir d'ici
+    sys.path.insert(0, CLI_DIR)
+    return activate
+
+def build_messages(args, workdir):
+    """Retourne [(classe de job, message)] du scénario ; écrit le fichier du résolveur factice pour 'fanout'."""
+    messages = []
+    playlists = [f"https://open.spotify.com/playlist/benchpl{index:05d}" for index in range(args.jobs)]
+    singles = [f"https://open.spotify.com/track/benchtr{index:05d}" for index in range(args.singles if args.scenario == 'mixed' else args.jobs)]
+    if args.scenario in ('playlists', 'fanout', 'mixed'):
+        messages.extend(('bulk', url) for url in playlists)
+    if args.scenario in ('singles', 'mixed'):
+        messages.extend(('interactive', url) for url in singles)
+    if args.scenario == 'fanout':
+        stub = {url: [f"https://open.spotify.com/track/{url.rsplit('/', 1)[1]}x{index}" for index in range(args.tracks)] for url in playlists}
+        with open(os.path.join(workdir, 'fanout.json'), 'w') as f:
+            json.dump(stub, f)
+    # Scénario mixed : les morceaux isolés sont publiés après le bulk, leur attente mesure l'effet de l'ordonnancement
+    return [(job_class, {'url': url, 'sync': False, 'job_class': job_class}) for job_class, url in messages]
+
+def run_pipeline(args, workdir, activate):
+    import queue_consumer
+    import metrics
+    from job_store import JobStore
+    from memory_broker import MemoryBroker
+
+    queue_consumer.VENV_PATH = activate
+    config = queue_consumer.get_config()
+    samples = {}
+
+    def observe(name, labels, value):
+        samples.setdefault(name, []).append((labels, value))
+
+    metrics.add_observer(observe)
+    pool = queue_consumer.create_pool(config, JobStore(os.path.join(workdir, 'jobs.sqlite')))
+    broker = MemoryBroker(prefetch=config.consumer.workers)
+    pool.attach(broker)
+    for job_class, message in build_messages(args, workdir):
+        message['enqueued_at'] = time.time()
+        broker.publish(queue_consumer.JOB_QUEUES[job_class], json.dumps(message))
+
+    start = time.monotonic()
+    broker.run(pool, queue_consumer.JOB_QUEUES)
+    wall = time.monotonic() - start
+    pool.shutdown()
+    metrics.remove_observer(observe)
+
+    def values(name, **labels):
+        return [value for sample_labels, value in samples.get(name, []) if all(sample_labels.get(k) == v for k, v in labels.items())]
+
+    jobs = len(values('spotdl_download_duration_seconds'))
+    tracks = int(sum(values('spotdl_job_tracks')))
+    return {
+        'wall_seconds': round(wall, 3),
+        'jobs': jobs,
+        'messages_acked': broker.acked,
+        'tracks': tracks,
+        'bytes': int(sum(values('spotdl_job_bytes'))),
+        'jobs_per_min': round(jobs / wall * 60, 2) if wall else None,
+        'tracks_per_s': round(tracks / wall, 2) if wall else None,
+        'retries': sum(count for queue, count in broker.published.items() if '.retry.' in queue),
+        'dead_letters': sum(count for queue, count in broker.published.items() if queue.endswith('.dead')),
+        'stages': {
+            'queue_wait_interactive': summarize(values('spotdl_queue_wait_seconds', job_class='interactive')),
+            'queue_wait_bulk': summarize(values('spotdl_queue_wait_seconds', job_class='bulk')),
+            'download': summarize(values('spotdl_download_duration_seconds')),
+            'tagging': summarize(values('spotdl_tagging_duration_seconds')),
+            'end_to_end': summarize(broker.end_to_end)
+        }
+    }
+
+def run_tagging(args, workdir):
+    import tag_rename_move
+    from synthetic import generate_downloads
+
+    downloads = os.path.join(workdir, 'downloads')
+    start = time.monotonic()
+    paths = generate_downloads(downloads, args.files, size=args.track_bytes, compilation_rate=args.compilation_rate,
+                               unknown_genre_rate=args.unknown_genre_rate)
+    generation = time.monotonic() - start
+
+    config = tag_rename_move.get_config()
+    start = time.monotonic()
+    results = tag_rename_move.tag_files(paths, config)
+    wall = time.monotonic() - start
+    errors = [result for result in results if result.status == tag_rename_move.STATUS_ERROR]
+    return {
+        'wall_seconds': round(wall, 3),
+        'generation_seconds': round(generation, 3),
+        'tracks': len(results),
+        'errors': len(errors),
+        'tracks_per_s': round(len(results) / wall, 2) if wall else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne de queue_consumer.py et tag_rename_move.py.")
+    parser.add_argument('scenario', choices=SCENARIOS, help="singles : morceaux isolés, playlists : playlists entières, fanout : playlists éclatées en morceaux, mixed : bulk puis morceaux isolés, tag : tagging seul.")
+    parser.add_argument('--jobs', type=int, default=20, help="Nombre de messages (playlists pour playlists/fanout/mixed, morceaux pour singles).")
+    parser.add_argument('--singles', type=int, default=10, help="Morceaux isolés publiés après le bulk (scénario mixed).")
+    parser.add_argument('--tracks', type=int, default=10, help="Morceaux par playlist.")
+    parser.add_argument('--files', type=int, default=200, help="Fichiers synthétiques à taguer (scénario tag).")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--provider', choices=['spotdl', 'zotify'], default='spotdl')
+    parser.add_argument('--provider-concurrency', type=int, default=0, help="Jobs simultanés du provider (0 : nombre de workers).")
+    parser.add_argument('--bulk-share', type=int, default=50, help="Part maximale des workers pour le bulk, en pourcentage.")
+    parser.add_argument('--track-bytes', type=int, default=4 * 1024 * 1024, help="Taille des MP3 synthétiques.")
+    parser.add_argument('--track-seconds', type=float, default=0.0, help="Durée de téléchargement simulée par morceau.")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Part des URLs en échec (entre 0 et 1).")
+    parser.add_argument('--stderr-rate', type=float, default=0.1, help="Part des morceaux avec un avertissement sur stderr.")
+    parser.add_argument('--compilation-rate', type=float, default=0.0, help="Part des fichiers de compilations (scénario tag).")
+    parser.add_argument('--tag-workers', type=int, default=1, help="Fichiers tagués en parallèle (tag.workers).")
+    parser.add_argument('--unknown-genre-rate', type=float, default=0.0, help="Part des albums sans genre, classés par l'endpoint IA factice (scénario tag).")
+    parser.add_argument('--ai-latency', type=float, default=0.2, help="Durée simulée d'une requête à l'endpoint IA factice.")
+    parser.add_argument('--ai-fail-rate', type=float, default=0.0, help="Part des requêtes IA en erreur 503.")
+    parser.add_argument('--events', action='store_true', help="Activer la publication des événements de progression.")
+    parser.add_argument('--output', help="Fichier JSON des résultats (défaut : bench/results/<scénario>-<date>.json).")
+    parser.add_argument('--keep', action='store_true', help="Conserver le dossier de travail temporaire.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='navidrome-bench-')
+    genre_api = None
+    args.ai_endpoint = None
+    if args.scenario == 'tag' and args.unknown_genre_rate > 0:
+        genre_api = FakeGenreApi(latency=args.ai_latency, fail_rate=args.ai_fail_rate)
+        args.ai_endpoint = genre_api.endpoint
+    try:
+        activate = prepare_environment(workdir, args)
+        if args.scenario == 'tag':
+            results = run_tagging(args, workdir)
+            if genre_api is not None:
+                results['ai_requests'] = genre_api.requests
+                results['ai_albums'] = genre_api.albums
+                results['ai_failures'] = genre_api.failures
+        else:
+            results = run_pipeline(args, workdir, activate)
+    finally:
+        if genre_api is not None:
+            genre_api.close()
+        if args.keep:
+            print(f"Dossier de travail conservé : {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'scenario': args.scenario,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'keep', 'ai_endpoint')},
+        'results': results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.scenario}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Résultats écrits dans {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import zlib
+from mutagen.easyid3 import EasyID3
+
+# En-tête de trame MPEG-1 Layer III, 128 kbit/s, 44,1 kHz, sans CRC ni padding : trames de 417 octets
+FRAME_HEADER = b'\xff\xfb\x90\x00'
+FRAME_SIZE = 417
+
+GENRES = ('rock', 'hip hop', 'french pop', 'deep house', 'trip hop', 'soul', 'punk', 'lo-fi', 'chanson', 'synthwave')
+
+def write_mp3(path, size, tags):
+    """Écrit un MP3 synthétique d'environ size octets (trames MPEG valides) puis ses tags ID3 (dict EasyID3)."""
+    frames = max(1, size // FRAME_SIZE)
+    payload = zlib.crc32(path.encode()).to_bytes(4, 'big') * ((FRAME_SIZE - len(FRAME_HEADER)) // 4 + 1)
+    frame = FRAME_HEADER + payload[:FRAME_SIZE - len(FRAME_HEADER)]
+    with open(path, 'wb') as f:
+        for _ in range(frames):
+            f.write(frame)
+    audio = EasyID3()
+    for key, value in tags.items():
+        if value:
+            audio[key] = value
+    audio.save(path)
+
+def track_tags(seed, index, artists=50, albums_per_artist=4, tracks_per_album=12, compilation_rate=0, unknown_genre_rate=0):
+    """Métadonnées déterministes d'un morceau : mêmes seed et index, mêmes artiste/album/genre."""
+    key = zlib.crc32(f"{seed}:{index}".encode())
+    artist_number = key % artists
+    album_number = (key // artists) % albums_per_artist
+    artist = f"Bench Artist {artist_number:03d}"
+    tags = {
+        'artist': artist,
+        'albumartist': artist,
+        'album': f"Bench Album {artist_number:03d}-{album_number}",
+        'title': f"Bench Track {seed} {index:05d}",
+        'tracknumber': str(index % tracks_per_album + 1),
+        'genre': GENRES[(artist_number + album_number) % len(GENRES)],
+        'date': str(1990 + artist_number % 30),
+        'originaldate': str(1990 + artist_number % 30)
+    }
+    if compilation_rate and key % 100 < compilation_rate * 100:
+        tags['albumartist'] = 'Various Artists'
+        tags['artist'] = f"{artist}, Bench Guest {key % 7}"
+    if unknown_genre_rate and (artist_number * albums_per_artist + album_number) % 100 < unknown_genre_rate * 100:
+        del tags['genre']  # Album entier sans genre : candidat à la détection par l'IA
+    return tags
+
+def generate_downloads(directory, count, size=4 * 1024 * 1024, seed='bench', compilation_rate=0, unknown_genre_rate=0):
+    """Remplit directory de count MP3 synthétiques taggés ; retourne leurs chemins."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(count):
+        tags = track_tags(seed, index, compilation_rate=compilation_rate, unknown_genre_rate=unknown_genre_rate)
+        path = os.path.join(directory, f"{tags['artist']} - {tags['album']} - {tags['title']}.mp3")
+        write_mp3(path, size, tags)
+        paths.append(path)
+    return paths
@@ -0,0 +1,396 @@
+import os
+import re
+import json
+import threading
+from dataclasses import dataclass, field
+
+# Répertoires
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Chemins surchargeables par variables d'environnement (benchmarks, instances de test)
+CONFIG_PATH = os.environ.get('NAVIDROME_TOOL_CONFIG') or os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'etc', 'config.json'))
+TAG_CONFIG_PATH = os.environ.get('NAVIDROME_TOOL_TAG_CONFIG') or os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'etc', 'tag_config.json'))
+
+class ConfigError(ValueError):
+    """Configuration absente ou invalide."""
+
+@dataclass(frozen=True)
+class RabbitMQConfig:
+    host: str = 'localhost'
+    port: int = 5672
+    username: str = 'gautard'
+    password: str = 'gautard'
+    virtual_host: str = '/'
+    heartbeat: int = 60  # Secondes ; une connexion morte est détectée en deux intervalles
+
+@dataclass(frozen=True)
+class SpotifyConfig:
+    client_id: str = None
+    client_secret: str = None
+    username: str = None
+    password: str = None
+
+@dataclass(frozen=True)
+class DownloadConfig:
+    provider: str = 'spotdl'
+    download_lyrics: bool = True
+    download_format: str = 'mp3'
+    download_quality: str = 'very_high'
+    credentials_location: str = ''
+    song_archive: str = ''
+    skip_previously_downloaded: bool = True
+    print_download_progress: bool = True
+    print_progress_info: bool = True
+    print_downloads: bool = True
+    retry_attempts: int = 3
+    download_real_time: bool = True
+    job_timeout: int = 0  # Durée max d'un job en secondes (0 = illimitée)
+    output: str = '{artist} - {album} - {song_name}.{ext}'
+
+@dataclass(frozen=True)
+class PathsConfig:
+    downloads: str = '/downloads/'
+    music: str = '/music/downloads/'
+    itunes_library_file: str = ''
+
+@dataclass(frozen=True)
+class ConsumerConfig:
+    workers: int = 1
+    provider_concurrency: dict = field(default_factory=dict)
+    bulk_share: float = 0.5        # Part maximale des workers occupée par la file bulk
+    interactive_weight: int = 3    # Poids du round-robin entre les files interactive et bulk
+    bulk_weight: int = 1
+    shutdown_timeout: int = 60     # Attente des jobs en cours à l'arrêt avant de les interrompre (secondes)
+
+@dataclass(frozen=True)
+class LoggingConfig:
+    flush_lines: int = 50
+    flush_interval: float = 0.5
+    max_bytes: int = 5 * 1024 * 1024
+    backup_count: int = 5
+    max_pending: int = 10000  # Lignes en attente d'écriture au-delà desquelles les producteurs sont bloqués
+
+@dataclass(frozen=True)
+class EventsConfig:
+    enabled: bool = True
+    flush_interval: float = 1.0
+    max_batch: int = 100
+    max_pending: int = 1000
+    ttl: int = 600  # Durée de vie des messages dans spotdl_status_queue, en secondes
+
+@dataclass(frozen=True)
+class DedupConfig:
+    enabled: bool = True
+    window: int = 21600  # Un succès récent (en secondes) suffit à ignorer un doublon
+    library_check: bool = True  # Un morceau déjà présent dans la bibliothèque (index audio) n'est pas retéléchargé
+
+@dataclass(frozen=True)
+class FanoutConfig:
+    enabled: bool = False
+    resolver: str = 'spotify'  # 'spotify' (API, client credentials) ou 'stub' (fichier JSON local)
+    stub_file: str = ''
+    min_tracks: int = 2
+
+@dataclass(frozen=True)
+class RetryConfig:
+    max_attempts: int = 5
+    base_delay: int = 60    # Délai avant la 2e tentative, doublé à chaque échec
+    max_delay: int = 3600
+
+@dataclass(frozen=True)
+class MetricsConfig:
+    enabled: bool = False
+    bind: str = '127.0.0.1'
+    port: int = 9464        # Endpoint HTTP /metrics (0 pour le désactiver)
+    prom_file: str = ''     # Fichier .prom réécrit périodiquement (collecteur textfile de node_exporter)
+    write_interval: int = 15
+
+@dataclass(frozen=True)
+class WatchConfig:
+    enabled: bool = False      # Tagging au fil de l'eau (inotify) dans le consommateur, y compris pendant le téléchargement des jobs
+    settle: int = 5            # Durée sans modification avant de considérer un fichier comme terminé (secondes)
+    sweep_interval: int = 60   # Parcours complet de secours, pour les événements manqués (secondes)
+    max_batch: int = 50        # Fichiers tagués ensemble au maximum
+
+@dataclass(frozen=True)
+class GrokConfig:
+    api_key: str = ''
+    endpoint: str = ''
+    model: str = ''
+    cache_ttl: int = 180 * 86400         # Durée de validité d'un genre détecté par l'IA (secondes, 0 pour illimitée)
+    negative_cache_ttl: int = 7 * 86400  # Idem pour une réponse 'Unknown', redemandée plus tôt
+    batch_size: int = 20                 # Albums classés par requête
+    concurrency: int = 4                 # Requêtes simultanées
+    timeout: int = 30                    # Délai maximum d'une requête (secondes)
+    retries: int = 2                     # Nouvelles tentatives sur timeout, erreur réseau, 429 ou 5xx
+
+@dataclass(frozen=True)
+class NavidromeConfig:
+    url: str = ''
+    username: str = ''
+    password: str = ''
+
+@dataclass(frozen=True)
+class TagSettings:
+    genre_tagging_mode: str = 'mapping'
+    workers: int = 1  # Fichiers traités en parallèle par tag_rename_move
+    genre_memo: bool = True  # Mémo du mapping des genres persisté entre deux exécutions (log/genre_memo.json)
+    journal: bool = True     # Journal d'écriture anticipée des opérations, rejoué après un arrêt brutal (log/tag_journal/)
+    audio_index: bool = True # Indexe l'audio des fichiers classés ; un doublon du même audio ne met à jour que les tags
+
+@dataclass(frozen=True)
+class AppConfig:
+    """Contenu validé de config.json ; raw conserve le JSON brut pour les sections non typées (lyrics...)."""
+    raw: dict
+    rabbitmq: RabbitMQConfig
+    spotify: SpotifyConfig
+    download: DownloadConfig
+    paths: PathsConfig
+    consumer: ConsumerConfig
+    logging: LoggingConfig
+    events: EventsConfig
+    dedup: DedupConfig
+    fanout: FanoutConfig
+    retry: RetryConfig
+    metrics: MetricsConfig
+    watch: WatchConfig
+    grok: GrokConfig
+    navidrome: NavidromeConfig
+    tag: TagSettings
+
+@dataclass(frozen=True)
+class GenrePattern:
+    pattern: str
+    regex: re.Pattern
+    genre: str
+
+@dataclass(frozen=True)
+class TagConfig:
+    """Règles de mapping de tag_config.json, compilées une fois ; errors liste les problèmes rencontrés."""
+    genre_patterns: tuple = ()
+    errors: tuple = ()
+
+def _section(raw, name):
+    section = raw.get(name, {})
+    if section is None:
+        return {}
+    if not isinstance(section, dict):
+        raise ConfigError(f"La section '{name}' de config.json doit être un objet")
+    return section
+
+def _int(section, key, default, minimum=None):
+    value = section.get(key, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ConfigError(f"La clé '{key}' doit être un entier (valeur : {value!r})")
+    if minimum is not None:
+        value = max(minimum, value)
+    return value
+
+def _bool(section, key, default):
+    value = section.get(key, default)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    raise ConfigError(f"La clé '{key}' doit être un booléen (valeur : {value!r})")
+
+def _str(section, key, default):
+    value = section.get(key, default)
+    if value is not None and not isinstance(value, str):
+        raise ConfigError(f"La clé '{key}' doit être une chaîne (valeur : {value!r})")
+    return value
+
+def parse_app_config(raw):
+    """Valide le JSON de config.json et le convertit en AppConfig."""
+    if not isinstance(raw, dict):
+        raise ConfigError("Le contenu de config.json n'est pas un objet JSON")
+    rabbitmq = _section(raw, 'rabbitmq')
+    spotify = _section(raw, 'spotify')
+    download = _section(raw, 'playlist_download')
+    paths = _section(raw, 'paths')
+    consumer = _section(raw, 'consumer')
+    log = _section(raw, 'logging')
+    events = _section(raw, 'events')
+    dedup = _section(raw, 'dedup')
+    fanout = _section(raw, 'fanout')
+    retry = _section(raw, 'retry')
+    metrics = _section(raw, 'metrics')
+    watch = _section(raw, 'watch')
+    grok = _section(raw, 'grok_api')
+    navidrome = _section(raw, 'navidrome')
+    tag = _section(raw, 'tag')
+
+    provider_concurrency = consumer.get('provider-concurrency', {})
+    if not isinstance(provider_concurrency, dict):
+        raise ConfigError("La clé 'provider-concurrency' doit être un objet {provider: limite}")
+
+    return AppConfig(
+        raw=raw,
+        rabbitmq=RabbitMQConfig(
+            host=_str(rabbitmq, 'host', 'localhost'),
+            port=_int(rabbitmq, 'port', 5672),
+            username=_str(rabbitmq, 'username', 'gautard'),
+            password=_str(rabbitmq, 'password', 'gautard'),
+            virtual_host=_str(rabbitmq, 'virtual_host', '/'),
+            heartbeat=_int(rabbitmq, 'heartbeat', 60, minimum=0)
+        ),
+        spotify=SpotifyConfig(
+            client_id=_str(spotify, 'client_id', None),
+            client_secret=_str(spotify, 'client_secret', None),
+            username=_str(spotify, 'username', None),
+            password=_str(spotify, 'password', None)
+        ),
+        download=DownloadConfig(
+            provider=_str(download, 'provider', 'spotdl'),
+            download_lyrics=_bool(download, 'download-lyrics', True),
+            download_format=_str(download, 'download-format', 'mp3'),
+            download_quality=_str(download, 'download-quality', 'very_high'),
+            credentials_location=_str(download, 'credentials-location', ''),
+            song_archive=_str(download, 'song-archive', ''),
+            skip_previously_downloaded=_bool(download, 'skip-previously-downloaded', True),
+            print_download_progress=_bool(download, 'print-download-progress', True),
+            print_progress_info=_bool(download, 'print-progress-info', True),
+            print_downloads=_bool(download, 'print-downloads', True),
+            retry_attempts=_int(download, 'retry-attempts', 3, minimum=0),
+            download_real_time=_bool(download, 'download-real-time', True),
+            job_timeout=_int(download, 'job-timeout', 0, minimum=0),
+            output=_str(download, 'output', '{artist} - {album} - {song_name}.{ext}')
+        ),
+        paths=PathsConfig(
+            downloads=_str(paths, 'downloads', '/downloads/'),
+            music=_str(paths, 'music', '/music/downloads/'),
+            itunes_library_file=_str(paths, 'itunes_library_file', '')
+        ),
+        consumer=ConsumerConfig(
+            workers=_int(consumer, 'workers', 1, minimum=1),
+            provider_concurrency={
+                provider.lower(): _int(provider_concurrency, provider, 1, minimum=1)
+                for provider in provider_concurrency
+            },
+            bulk_share=min(100, _int(consumer, 'bulk-share-percent', 50, minimum=1)) / 100,
+            interactive_weight=_int(consumer, 'interactive-weight', 3, minimum=1),
+            bulk_weight=_int(consumer, 'bulk-weight', 1, minimum=1),
+            shutdown_timeout=_int(consumer, 'shutdown-timeout-seconds', 60, minimum=0)
+        ),
+        logging=LoggingConfig(
+            flush_lines=_int(log, 'flush-lines', 50, minimum=1),
+            flush_interval=max(0.01, _int(log, 'flush-interval-ms', 500) / 1000),
+            max_bytes=_int(log, 'max-bytes', 5 * 1024 * 1024, minimum=0),
+            backup_count=_int(log, 'backup-count', 5, minimum=0),
+            max_pending=_int(log, 'max-pending', 10000, minimum=1)
+        ),
+        events=EventsConfig(
+            enabled=_bool(events, 'enabled', True),
+            flush_interval=max(0.05, _int(events, 'flush-interval-ms', 1000) / 1000),
+            max_batch=_int(events, 'max-batch', 100, minimum=1),
+            max_pending=_int(events, 'max-pending', 1000, minimum=1),
+            ttl=_int(events, 'ttl-seconds', 600, minimum=1)
+        ),
+        dedup=DedupConfig(
+            enabled=_bool(dedup, 'enabled', True),
+            window=_int(dedup, 'window-seconds', 21600, minimum=0),
+            library_check=_bool(dedup, 'library-check', True)
+        ),
+        fanout=FanoutConfig(
+            enabled=_bool(fanout, 'enabled', False),
+            resolver=_str(fanout, 'resolver', 'spotify'),
+            stub_file=_str(fanout, 'stub-file', ''),
+            min_tracks=_int(fanout, 'min-tracks', 2, minimum=1)
+        ),
+        retry=RetryConfig(
+            max_attempts=_int(retry, 'max-attempts', 5, minimum=1),
+            base_delay=_int(retry, 'base-delay-seconds', 60, minimum=1),
+            max_delay=_int(retry, 'max-delay-seconds', 3600, minimum=1)
+        ),
+        metrics=MetricsConfig(
+            enabled=_bool(metrics, 'enabled', False),
+            bind=_str(metrics, 'bind', '127.0.0.1'),
+            port=_int(metrics, 'port', 9464, minimum=0),
+            prom_file=_str(metrics, 'prom-file', ''),
+            write_interval=_int(metrics, 'write-interval-seconds', 15, minimum=1)
+        ),
+        watch=WatchConfig(
+            enabled=_bool(watch, 'enabled', False),
+            settle=_int(watch, 'settle-seconds', 5, minimum=1),
+            sweep_interval=_int(watch, 'sweep-interval-seconds', 60, minimum=1),
+            max_batch=_int(watch, 'max-batch', 50, minimum=1)
+        ),
+        grok=GrokConfig(
+            api_key=_str(grok, 'api_key', ''),
+            endpoint=_str(grok, 'endpoint', ''),
+            model=_str(grok, 'model', ''),
+            cache_ttl=_int(grok, 'cache-ttl-seconds', 180 * 86400, minimum=0),
+            negative_cache_ttl=_int(grok, 'negative-cache-ttl-seconds', 7 * 86400, minimum=0),
+            batch_size=_int(grok, 'batch-size', 20, minimum=1),
+            concurrency=_int(grok, 'concurrency', 4, minimum=1),
+            timeout=_int(grok, 'timeout-seconds', 30, minimum=1),
+            retries=_int(grok, 'retries', 2, minimum=0)
+        ),
+        navidrome=NavidromeConfig(
+            url=_str(navidrome, 'url', ''),
+            username=_str(navidrome, 'username', ''),
+            password=_str(navidrome, 'password', '')
+        ),
+        tag=TagSettings(
+            genre_tagging_mode=_str(tag, 'genre-tagging-mode', 'mapping'),
+            workers=_int(tag, 'workers', 1, minimum=1),
+            genre_memo=_bool(tag, 'genre-memo', True),
+            journal=_bool(tag, 'journal', True),
+            audio_index=_bool(tag, 'audio-index', True)
+        )
+    )
+
+def parse_tag_config(raw):
+    """Compile les patterns de genre dans l'ordre du fichier (le premier qui matche l'emporte)."""
+    if not isinstance(raw, dict):
+        raise ConfigError("Le contenu de tag_config.json n'est pas un objet JSON")
+    patterns = raw.get('genre_patterns', {})
+    if not isinstance(patterns, dict):
+        raise ConfigError("La clé 'genre_patterns' doit être un objet {pattern: genre}")
+    compiled = []
+    errors = []
+    for pattern, genre in patterns.items():
+        try:
+            compiled.append(GenrePattern(pattern, re.compile(pattern), genre))
+        except re.error as e:
+            errors.append(f"Pattern regex invalide {pattern!r} ignoré : {str(e)}")
+    return TagConfig(tuple(compiled), tuple(errors))
+
+class CachedConfigFile:
+    """Fichier JSON parsé une seule fois, puis rechargé uniquement quand son mtime change."""
+
+    def __init__(self, path, parser):
+        self.path = path
+        self.parser = parser
+        self.lock = threading.Lock()
+        self.signature = None
+        self.value = None
+
+    def get(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Le fichier de configuration {self.path} est introuvable")
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if signature != self.signature:
+                try:
+                    with open(self.path, 'r') as f:
+                        raw = json.load(f)
+                except json.JSONDecodeError as e:
+                    raise ConfigError(f"Le fichier {self.path} n'est pas un JSON valide : {str(e)}")
+                self.value = self.parser(raw)
+                self.signature = signature
+            return self.value
+
+_app_config = CachedConfigFile(CONFIG_PATH, parse_app_config)
+_tag_config = CachedConfigFile(TAG_CONFIG_PATH, parse_tag_config)
+
+def get_config():
+    """Retourne la configuration de config.json (rechargée si le fichier a été modifié)."""
+    return _app_config.get()
+
+def get_tag_config():
+    """Retourne les règles de tag_config.json, patterns déjà compilés (rechargées si le fichier a été modifié)."""
+    return _tag_config.get()
@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import status_log
+from job_store import normalize_url
+from app_config import get_config, ConfigError
+
+AUDIO_INDEX_FILE = os.path.join(status_log.LOG_DIR, 'audio_index.sqlite')
+HASH_CHUNK = 1024 * 1024
+
+def audio_span(f, size):
+    """(début, fin) des données audio d'un MP3 ouvert : sans l'en-tête ID3v2, ni les tags ID3v1/APEv2 de fin."""
+    start = 0
+    f.seek(0)
+    header = f.read(10)
+    if len(header) == 10 and header[:3] == b'ID3':
+        # Taille "syncsafe" (4 × 7 bits), hors en-tête, plus le pied de page éventuel (drapeau 0x10)
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        start = min(size, 10 + tag_size + (10 if header[5] & 0x10 else 0))
+    end = size
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b'APETAGEX':
+            ape_size = int.from_bytes(footer[12:16], 'little') + (32 if footer[23] & 0x80 else 0)
+            end = max(start, end - ape_size)
+    return start, end
+
+def audio_hash(path):
+    """Empreinte (BLAKE2b) des seules trames audio : deux fichiers aux tags différents mais au même son ont la même."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        start, end = audio_span(f, os.fstat(f.fileno()).st_size)
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+class AudioIndex:
+    """Index SQLite de la bibliothèque : empreinte audio de chaque fichier (invalidée par taille et mtime) et
+    chemin de chaque morceau Spotify déjà téléchargé, pour éviter de le redemander au provider."""
+
+    def __init__(self, path=AUDIO_INDEX_FILE):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                audio_hash TEXT NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (audio_hash)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                track_url TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+        """)
+
+    def hash_for(self, path):
+        """Empreinte audio de path, relue depuis l'index si taille et mtime n'ont pas changé, sinon recalculée."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime_ns, audio_hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = audio_hash(path)
+        self.record(path, digest, stat)
+        return digest
+
+    def record(self, path, digest, stat=None):
+        """Enregistre l'empreinte d'un fichier (après un déplacement ou une mise à jour des seuls tags)."""
+        path = os.path.abspath(path)
+        stat = stat or os.stat(path)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, audio_hash, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, digest, time.time())
+            )
+
+    def forget(self, path):
+        with self.lock:
+            self.db.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+
+    def paths_with_hash(self, digest):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT path FROM files WHERE audio_hash = ?", (digest,))]
+
+    def record_track(self, url, path):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO tracks (track_url, path, recorded_at) VALUES (?, ?, ?)",
+                (normalize_url(url), os.path.abspath(path), time.time())
+            )
+
+    def track_path(self, url):
+        """Chemin dans la bibliothèque d'un morceau déjà téléchargé, s'il y est toujours, sinon None."""
+        with self.lock:
+            row = self.db.execute("SELECT path FROM tracks WHERE track_url = ?", (normalize_url(url),)).fetchone()
+        if row is None or not os.path.isfile(row[0]):
+            return None
+        return row[0]
+
+    def scan(self, directory, log=print):
+        """Indexe les MP3 de directory (seuls les fichiers nouveaux ou modifiés sont relus) et oublie les disparus."""
+        directory = os.path.abspath(directory)
+        seen = set()
+        hashed = 0
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if not name.lower().endswith('.mp3'):
+                    continue
+                path = os.path.join(root, name)
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                    with self.lock:
+                        row = self.db.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+                    if row is None or row != (stat.st_size, stat.st_mtime_ns):
+                        self.record(path, audio_hash(path), stat)
+                        hashed += 1
+                except OSError as e:
+                    log(f"Fichier illisible {path} : {e}")
+        prefix = os.path.join(directory, '')
+        with self.lock:
+            known = [row[0] for row in self.db.execute("SELECT path FROM files WHERE path LIKE ?", (prefix + '%',))]
+        removed = [path for path in known if path not in seen]
+        with self.lock:
+            self.db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+        return len(seen), hashed, len(removed)
+
+    def stats(self):
+        with self.lock:
+            files = self.db.execute("SELECT COUNT(*), COUNT(DISTINCT audio_hash) FROM files").fetchone()
+            tracks = self.db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        return files[0], files[1], tracks
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+# Index ouvert une seule fois par processus
+_shared_lock = threading.Lock()
+_shared = None
+
+def get_audio_index():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AudioIndex()
+        return _shared
+
+def main():
+    parser = argparse.ArgumentParser(description="Index des empreintes audio de la bibliothèque (doublons, morceaux déjà téléchargés).")
+    parser.add_argument('action', choices=['scan', 'stats'], help="'scan' : indexer les fichiers nouveaux ou modifiés, 'stats' : résumé de l'index.")
+    parser.add_argument('--directory', help="Avec scan : bibliothèque à parcourir (par défaut : paths.music de config.json).")
+    args = parser.parse_args()
+
+    index = AudioIndex()
+    try:
+        if args.action == 'scan':
+            try:
+                directory = args.directory or get_config().paths.music
+            except (FileNotFoundError, ConfigError) as e:
+                print(f"Erreur : {str(e)}")
+                sys.exit(1)
+            start_time = time.time()
+            files, hashed, removed = index.scan(directory)
+            print(f"{files} fichier(s) dans {directory} : {hashed} empreinte(s) calculée(s), {removed} fichier(s) disparu(s) retiré(s) en {time.time() - start_time:.2f} secondes")
+        else:
+            files, distinct, tracks = index.stats()
+            print(f"{files} fichier(s) indexé(s), {files - distinct} doublon(s) audio, {tracks} morceau(x) Spotify associé(s) à un fichier")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
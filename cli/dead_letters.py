@@ -0,0 +1,96 @@
+import sys
+import json
+import argparse
+import pika
+from app_config import get_config, ConfigError
+from retry_queues import dead_letter_queue_name, ATTEMPT_HEADER, ORIGINAL_QUEUE_HEADER, FAILED_AT_HEADER
+
+QUEUE_NAME = "spotdl_queue"
+
+def connect(rabbitmq_config):
+    credentials = pika.PlainCredentials(rabbitmq_config.username, rabbitmq_config.password)
+    parameters = pika.ConnectionParameters(
+        host=rabbitmq_config.host,
+        port=rabbitmq_config.port,
+        credentials=credentials,
+        virtual_host=rabbitmq_config.virtual_host
+    )
+    return pika.BlockingConnection(parameters)
+
+def describe(body, properties):
+    """Résumé d'un message abandonné : URL, nombre de tentatives et date du dernier échec."""
+    headers = properties.headers or {}
+    try:
+        url = json.loads(body.decode()).get("url")
+    except (ValueError, AttributeError):
+        url = body[:80]
+    return f"{url} - {headers.get(ATTEMPT_HEADER, '?')} tentative(s), dernier échec : {headers.get(FAILED_AT_HEADER, '?')}"
+
+def list_messages(channel, dead_queue, limit):
+    """Affiche les messages sans les consommer : ils sont remis dans la file morte après lecture."""
+    delivery_tags = []
+    count = 0
+    while limit == 0 or count < limit:
+        method, properties, body = channel.basic_get(queue=dead_queue, auto_ack=False)
+        if method is None:
+            break
+        delivery_tags.append(method.delivery_tag)
+        count += 1
+        print(f"{count}. {describe(body, properties)}")
+    # Les messages ne sont rendus qu'une fois la liste terminée, sinon basic_get les relirait en boucle
+    for delivery_tag in delivery_tags:
+        channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+    print(f"{count} message(s) dans {dead_queue}")
+
+def replay_messages(channel, dead_queue, limit):
+    """Republie les messages dans leur file d'origine avec un compteur de tentatives remis à zéro."""
+    count = 0
+    while limit == 0 or count < limit:
+        method, properties, body = channel.basic_get(queue=dead_queue, auto_ack=False)
+        if method is None:
+            break
+        headers = dict(properties.headers or {})
+        target_queue = headers.pop(ORIGINAL_QUEUE_HEADER, QUEUE_NAME)
+        headers.pop(ATTEMPT_HEADER, None)
+        headers.pop(FAILED_AT_HEADER, None)
+        channel.basic_publish(
+            exchange='',
+            routing_key=target_queue,
+            body=body,
+            properties=pika.BasicProperties(content_type=properties.content_type or 'application/json', delivery_mode=2, headers=headers)
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        count += 1
+        print(f"Rejoué vers {target_queue} : {describe(body, properties)}")
+    print(f"{count} message(s) rejoué(s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gère les téléchargements abandonnés après épuisement des tentatives (file morte).")
+    parser.add_argument('action', choices=['list', 'replay', 'purge'], help="'list' : afficher, 'replay' : republier dans la file d'origine, 'purge' : supprimer.")
+    parser.add_argument('--queue', default=QUEUE_NAME, help=f"File d'origine, {QUEUE_NAME} ou spotdl_bulk_queue (défaut : {QUEUE_NAME}).")
+    parser.add_argument('--count', type=int, default=0, help="Nombre maximum de messages à traiter (0 pour aucune limite).")
+    args = parser.parse_args()
+
+    try:
+        config = get_config()
+    except (FileNotFoundError, ConfigError) as e:
+        print(f"Erreur : {str(e)}")
+        sys.exit(1)
+
+    dead_queue = dead_letter_queue_name(args.queue)
+    connection = connect(config.rabbitmq)
+    try:
+        channel = connection.channel()
+        channel.queue_declare(queue=dead_queue, durable=True)
+        if args.action == 'list':
+            list_messages(channel, dead_queue, args.count)
+        elif args.action == 'replay':
+            replay_messages(channel, dead_queue, args.count)
+        else:
+            result = channel.queue_purge(queue=dead_queue)
+            print(f"{result.method.message_count} message(s) supprimé(s) de {dead_queue}")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
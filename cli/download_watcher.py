@@ -0,0 +1,245 @@
+import os
+import time
+import queue
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+# Un fichier sans en-tête ID3 est en général encore entre la conversion et l'écriture des tags par le provider :
+# on attend ces tags au plus NO_TAG_GRACE secondes avant de le traiter quand même
+NO_TAG_GRACE = 60
+
+class Inotify:
+    """Accès minimal à inotify via ctypes (Linux) ; lève OSError si inotify n'est pas disponible."""
+
+    def __init__(self):
+        library = ctypes.util.find_library('c') or 'libc.so.6'
+        self.libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError("inotify n'est pas disponible sur ce système")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.paths = {}  # {wd: dossier surveillé}
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch({path}) : {os.strerror(errno)}")
+        self.paths[wd] = path
+        return wd
+
+    def read(self, timeout):
+        """Événements disponibles [(chemin complet, masque)], en attendant au plus timeout secondes."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            directory = self.paths.get(wd)
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            if directory is None:
+                continue
+            events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def has_id3_header(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(3) == b'ID3'
+    except OSError:
+        return False
+
+class DownloadWatcher:
+    """Tague les MP3 au fil de leur arrivée dans un dossier de téléchargement (et ses sous-dossiers).
+
+    Les événements inotify (écriture terminée, fichier déplacé dans le dossier) signalent les candidats ; un fichier
+    n'est traité qu'après settle secondes sans changement de taille ni de date. Un parcours complet toutes les
+    sweep_interval secondes rattrape les événements manqués (débordement de la file inotify, limite de watches,
+    système sans inotify). Les fichiers prêts sont passés par lots (max_batch) à process_files, dans un thread dédié :
+    le parallélisme reste celui de process_files (tag.workers pour tag_files).
+    skip_dir(chemin) permet d'ignorer des sous-dossiers (ceux des jobs du consommateur pour le mode autonome).
+    """
+
+    def __init__(self, directory, process_files, settle=5, sweep_interval=60, max_batch=50, skip_dir=None, log=print):
+        self.directory = os.path.abspath(directory)
+        self.process_files = process_files
+        self.settle = settle
+        self.sweep_interval = sweep_interval
+        self.max_batch = max_batch
+        self.skip_dir = skip_dir or (lambda path: False)
+        self.log = log
+        self.pending = {}      # {chemin: (taille, mtime, dernier changement, première détection)}
+        self.queued = set()    # Chemins transmis au thread de traitement, pas encore terminés
+        self.lock = threading.Lock()
+        self.ready = queue.Queue()
+        self.stopped = threading.Event()
+        self.inotify = None
+        try:
+            self.inotify = Inotify()
+        except OSError as e:
+            self.log(f"inotify indisponible ({e}), parcours périodique seulement")
+        self.watch_thread = threading.Thread(target=self._watch, name='download-watch', daemon=True)
+        self.process_thread = threading.Thread(target=self._process, name='download-tag', daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._add_tree(self.directory)
+        self.watch_thread.start()
+        self.process_thread.start()
+        return self
+
+    def _add_tree(self, directory):
+        """Surveille directory et ses sous-dossiers, et relève les MP3 déjà présents (arrivés avant le watch)."""
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if not self.skip_dir(os.path.join(root, name))]
+            if self.inotify is not None:
+                try:
+                    self.inotify.add_watch(root)
+                except OSError as e:
+                    self.log(f"Surveillance impossible de {root} : {e}")
+            for name in files:
+                self._touch(os.path.join(root, name))
+
+    def _touch(self, path):
+        """Note une activité sur path : le délai de stabilité repart de zéro."""
+        if not path.lower().endswith('.mp3'):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if path in self.queued:
+                return
+            first_seen = self.pending.get(path, (None, None, None, now))[3]
+            self.pending[path] = (stat.st_size, stat.st_mtime_ns, now, first_seen)
+
+    def _collect_ready(self):
+        """Transmet au traitement les fichiers stables depuis settle secondes."""
+        now = time.monotonic()
+        ready = []
+        with self.lock:
+            candidates = list(self.pending.items())
+        for path, (size, mtime, changed_at, first_seen) in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                with self.lock:
+                    self.pending.pop(path, None)  # Fichier déjà traité ou supprimé
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                with self.lock:
+                    self.pending[path] = (stat.st_size, stat.st_mtime_ns, now, first_seen)
+                continue
+            if now - changed_at < self.settle:
+                continue
+            if not has_id3_header(path) and now - first_seen < NO_TAG_GRACE:
+                continue
+            ready.append(path)
+        if ready:
+            with self.lock:
+                for path in ready:
+                    self.pending.pop(path, None)
+                    self.queued.add(path)
+            for path in ready:
+                self.ready.put(path)
+
+    def _watch(self):
+        next_sweep = time.monotonic() + self.sweep_interval
+        while not self.stopped.is_set():
+            if self.inotify is not None:
+                for path, mask in self.inotify.read(min(1.0, self.settle / 2)):
+                    if path is None:
+                        self.log("File d'événements inotify saturée, parcours complet anticipé")
+                        next_sweep = 0
+                    elif mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO) and not self.skip_dir(path):
+                            self._add_tree(path)
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        self._touch(path)
+            else:
+                self.stopped.wait(min(1.0, self.settle / 2))
+            if time.monotonic() >= next_sweep:
+                self._sweep()
+                next_sweep = time.monotonic() + self.sweep_interval
+            self._collect_ready()
+
+    def _sweep(self):
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [name for name in dirs if not self.skip_dir(os.path.join(root, name))]
+            for name in files:
+                path = os.path.join(root, name)
+                with self.lock:
+                    known = path in self.pending or path in self.queued
+                if not known:
+                    self._touch(path)
+
+    def _process(self):
+        while True:
+            path = self.ready.get()
+            if path is None:
+                return
+            batch = [path]
+            while len(batch) < self.max_batch:
+                try:
+                    path = self.ready.get_nowait()
+                except queue.Empty:
+                    break
+                if path is None:
+                    self.ready.put(None)
+                    break
+                batch.append(path)
+            try:
+                self.process_files(batch)
+            except Exception as e:
+                self.log(f"Erreur lors du traitement de {len(batch)} fichier(s) : {e}")
+            finally:
+                with self.lock:
+                    self.queued.difference_update(batch)
+
+    def stop(self):
+        """Arrête la surveillance ; les fichiers déjà transmis au traitement sont terminés avant de rendre la main."""
+        self.stopped.set()
+        if self.watch_thread.is_alive():
+            self.watch_thread.join()
+        self.ready.put(None)
+        if self.process_thread.is_alive():
+            self.process_thread.join()
+        if self.inotify is not None:
+            self.inotify.close()
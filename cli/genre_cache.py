@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+import status_log
+from tag_edit import TagEdit
+from app_config import get_config, ConfigError
+
+GENRE_CACHE_FILE = os.path.join(status_log.LOG_DIR, 'genre_cache.sqlite')
+UNKNOWN_GENRE = "Unknown"
+
+def cache_key(artist, album):
+    """Clé artiste|album normalisée : minuscules, espaces multiples réduits."""
+    return f"{' '.join(str(artist).lower().split())}|{' '.join(str(album).lower().split())}"
+
+class GenreCache:
+    """Cache SQLite des genres détectés par l'IA, partagé entre les exécutions et les jobs du consommateur.
+
+    Chaque entrée est rattachée à une version (empreinte du modèle et du prompt) : changer l'un ou l'autre rend
+    les anciennes réponses invisibles. Une réponse 'Unknown' est conservée moins longtemps (negative_ttl) qu'un
+    genre reconnu (ttl), pour redemander plus tôt les albums que le modèle ne connaissait pas encore.
+    """
+
+    def __init__(self, path=GENRE_CACHE_FILE):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS genres (
+                version TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                artist TEXT,
+                album TEXT,
+                genre TEXT NOT NULL,
+                source TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (version, cache_key)
+            )
+        """)
+
+    def get(self, artist, album, version, ttl, negative_ttl):
+        """Genre en cache encore valide pour cette version, sinon None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT genre, created_at FROM genres WHERE version = ? AND cache_key = ?",
+                (version, cache_key(artist, album))
+            ).fetchone()
+        if row is None:
+            return None
+        genre, created_at = row
+        max_age = negative_ttl if genre == UNKNOWN_GENRE else ttl
+        if max_age > 0 and time.time() - created_at > max_age:
+            return None
+        return genre
+
+    def put(self, artist, album, version, genre, source='api'):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO genres (version, cache_key, artist, album, genre, source, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (version, cache_key(artist, album), artist, album, genre, source, time.time())
+            )
+
+    def entries(self, version=None, pattern=None, limit=0):
+        """Entrées (version, artist, album, genre, source, created_at), les plus récentes d'abord."""
+        query = "SELECT version, artist, album, genre, source, created_at FROM genres WHERE 1 = 1"
+        params = []
+        if version is not None:
+            query += " AND version = ?"
+            params.append(version)
+        if pattern:
+            query += " AND cache_key LIKE ?"
+            params.append(f"%{pattern.lower()}%")
+        query += " ORDER BY created_at DESC"
+        if limit > 0:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            return self.db.execute(query, params).fetchall()
+
+    def purge(self, version=None, ttl=0, negative_ttl=0, everything=False):
+        """Supprime tout (everything), ou les entrées d'autres versions et celles expirées ; retourne le nombre supprimé."""
+        with self.lock:
+            if everything:
+                return self.db.execute("DELETE FROM genres").rowcount
+            now = time.time()
+            deleted = 0
+            if version is not None:
+                deleted += self.db.execute("DELETE FROM genres WHERE version != ?", (version,)).rowcount
+            if ttl > 0:
+                deleted += self.db.execute(
+                    "DELETE FROM genres WHERE genre != ? AND created_at < ?", (UNKNOWN_GENRE, now - ttl)
+                ).rowcount
+            if negative_ttl > 0:
+                deleted += self.db.execute(
+                    "DELETE FROM genres WHERE genre = ? AND created_at < ?", (UNKNOWN_GENRE, now - negative_ttl)
+                ).rowcount
+            return deleted
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+# Cache ouvert une seule fois par processus, à la première détection de genre
+_shared_lock = threading.Lock()
+_shared = None
+
+def get_genre_cache():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = GenreCache()
+        return _shared
+
+def warm_from_library(cache, directory, version):
+    """Enregistre le genre déjà présent dans la bibliothèque pour chaque album, un fichier par album.
+
+    La clé est celle du classement (artiste principal et album nettoyés, voir tag_rename_move.album_key), pour que
+    les entrées préremplies soient retrouvées lors de la détection de genre.
+    """
+    # Import tardif : tag_rename_move importe ce module (via genre_classifier)
+    from tag_rename_move import album_key
+
+    stored = 0
+    seen = set()
+    for root, _, files in os.walk(directory):
+        for filename in sorted(files):
+            if not filename.lower().endswith('.mp3'):
+                continue
+            try:
+                audio = TagEdit(os.path.join(root, filename))
+            except Exception as e:
+                print(f"Tags illisibles pour {os.path.join(root, filename)} : {str(e)}", file=sys.stderr)
+                continue
+            has_artist = audio.first("albumartist") or audio.first("artist")
+            genre = audio.first("genre")
+            if not has_artist or not audio.first("album") or not genre or genre == UNKNOWN_GENRE:
+                continue
+            artist, album = album_key(audio)
+            key = cache_key(artist, album)
+            if key in seen:
+                continue
+            seen.add(key)
+            cache.put(artist, album, version, genre, source='library')
+            stored += 1
+    return stored
+
+def main():
+    # Import tardif : genre_classifier importe ce module
+    from genre_classifier import genre_prompt_version
+
+    parser = argparse.ArgumentParser(description="Inspecte, préremplit ou purge le cache des genres détectés par l'IA.")
+    parser.add_argument('action', choices=['list', 'warm', 'purge'], help="'list' : afficher, 'warm' : préremplir depuis la bibliothèque, 'purge' : supprimer.")
+    parser.add_argument('--search', help="Avec list : ne garder que les clés artiste|album contenant ce texte.")
+    parser.add_argument('--count', type=int, default=50, help="Avec list : nombre maximum d'entrées (0 pour aucune limite).")
+    parser.add_argument('--all-versions', action='store_true', help="Avec list : inclure les entrées d'un ancien modèle ou prompt.")
+    parser.add_argument('--directory', help="Avec warm : bibliothèque à parcourir (par défaut : paths.music de config.json).")
+    parser.add_argument('--everything', action='store_true', help="Avec purge : tout supprimer au lieu des seules entrées expirées ou obsolètes.")
+    args = parser.parse_args()
+
+    try:
+        config = get_config()
+    except (FileNotFoundError, ConfigError) as e:
+        print(f"Erreur : {str(e)}")
+        sys.exit(1)
+
+    version = genre_prompt_version(config)
+    cache = GenreCache()
+    try:
+        if args.action == 'list':
+            rows = cache.entries(None if args.all_versions else version, args.search, args.count)
+            for row_version, artist, album, genre, source, created_at in rows:
+                date = datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M:%S')
+                marker = "" if row_version == version else f" (version {row_version})"
+                print(f"{artist} - {album} : {genre} [{source}, {date}]{marker}")
+            print(f"{len(rows)} entrée(s) affichée(s)")
+        elif args.action == 'warm':
+            directory = args.directory or config.paths.music
+            print(f"{warm_from_library(cache, directory, version)} album(s) ajouté(s) au cache depuis {directory}")
+        else:
+            deleted = cache.purge(version, config.grok.cache_ttl, config.grok.negative_cache_ttl, args.everything)
+            print(f"{deleted} entrée(s) supprimée(s)")
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import status_log
+from genre_cache import get_genre_cache, cache_key, UNKNOWN_GENRE
+
+# Prompt système de la détection de genre par l'IA ; le modifier invalide les réponses en cache (voir genre_prompt_version)
+GENRE_SYSTEM_PROMPT = """
+            Tu es un expert en classification musicale. Ton objectif est de déterminer le genre musical de chaque album à partir de son artiste et de son titre, en respectant strictement une catégorisation spécifique. 
+            Les genres peuvent être cumulables : si un morceau appartient à plusieurs catégories, sépare les genres par le caractère ' / '. 
+            Rap & Hip-Hop n'est cumulable qu'avec Latin sinon il est dominant
+            
+            Voici les règles précises que tu dois suivre :
+            - "Rap & Hip-Hop" : Pour tous les morceaux de rap et hip-hop avec des paroles dans une langue autre que le français.
+            - "Rap Français" : Pour tous les morceaux de rap avec des paroles en français.
+            - "Electro" : Pour tous les morceaux de musique électronique (techno, trance, EDM, etc.), sauf la house.
+            - "House" : Pour tous les types de house (deep house, progressive house, tech house, etc.).
+            - "Reggaeton" : Pour tous les morceaux de reggaeton.
+            - "Variété Américaine" : Pour tous les morceaux de chanson (hors rap, hip-hop, electro, house, reggaeton, pop, rock) d'artistes américains ou avec des paroles en anglais américain.
+            - "Variété Internationale" : Pour tous les morceaux de chanson (hors rap, hip-hop, electro, house, reggaeton, pop, rock) dans une langue autre que le français ou l'anglais américain.
+            - "Variété Française" : Pour tous les morceaux de chanson (hors rap, hip-hop, electro, house, reggaeton, pop, rock) avec des paroles en français.
+            - "Pop" : Pour tous les morceaux de pop, quelle que soit la langue.
+            - "Rock" : Pour tous les morceaux de rock ou apparentés (rock alternatif, punk, metal, grunge, etc.).
+            - "Latin" : Pour tous les morceaux de musique latine (salsa, bachata, cumbia, etc.), hors reggaeton.
+            - "Instrumental / Trip-Hop" : Pour tous les morceaux sans paroles d'abstract hip-hop, trip-hop ou instrumentaux dans ce style.
+            - "Ambiance" : Pour tous les morceaux d'ambiance (chill, downtempo, lounge, etc.).
+            - "Classical" : Pour tous les morceaux orchestraux ou de musique classique.
+            - "Funk" : Pour tous les morceaux de funk ou genres apparentés
+            - "Jazz" : Pour tous les morceaux de jazz ou genres apparentés
+            - "Soul" : Pour tous les morceaux de soul ou genres apparentés
+
+            Instructions :
+            - Si tu as un doute sur la langue ou le style, base-toi sur les informations typiquement associées à l'artiste ou à l'album.
+            - Tu reçois une liste JSON d'albums {"id", "artist", "album"} : classe chacun d'eux indépendamment.
+            - Réponds UNIQUEMENT par un objet JSON, sans aucun autre texte, commentaire ou explication : {"albums": [{"id": 1, "genre": "Pop / Rock"}, ...]}, avec un élément par album reçu.
+            """
+
+# Codes HTTP pour lesquels un lot est renvoyé (limitation de débit, indisponibilité passagère)
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+def log_action(action, message=""):
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    status_log.write_line(status_log.STATUS_HISTORY_FILE, f"[{timestamp}] Fichier:  - {action} - {message}")
+
+def genre_prompt_version(config):
+    """Version des réponses de l'IA : empreinte du modèle et du prompt, incluse dans la clé du cache des genres."""
+    return hashlib.sha256(f"{config.grok.model}\n{GENRE_SYSTEM_PROMPT}".encode()).hexdigest()[:16]
+
+def build_payload(batch, model):
+    """Requête chat-completions pour un lot [(artist, album)] : les albums sont numérotés dans l'ordre du lot."""
+    albums = [{"id": index, "artist": artist, "album": album} for index, (artist, album) in enumerate(batch, 1)]
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": GENRE_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Analyse les albums suivants. Quelle est ta réponse ?\n{json.dumps(albums, ensure_ascii=False)}"}
+        ],
+        "response_format": {"type": "json_object"},
+        "max_tokens": 50 + 30 * len(batch),
+        "temperature": 0.3
+    }
+
+def parse_answer(content, batch):
+    """Associe la réponse JSON du modèle au lot : {index dans le lot: genre} pour les albums effectivement classés."""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        content = content[content.find("{"):]  # Bloc de code ```json ... ``` malgré la consigne
+    answer = json.loads(content)
+    entries = answer.get("albums", []) if isinstance(answer, dict) else []
+    genres = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        genre = str(entry.get("genre") or "").strip()
+        if 0 <= index < len(batch) and genre:
+            genres[index] = genre
+    return genres
+
+def request_batch(session, batch, config):
+    """Envoie un lot avec timeout, en réessayant (backoff exponentiel) sur timeout, erreur réseau, 429 ou 5xx.
+
+    Retourne {index dans le lot: genre} ; un lot en échec définitif retourne {} (rien n'est mis en cache).
+    """
+    headers = {
+        "Authorization": f"Bearer {config.grok.api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = json.dumps(build_payload(batch, config.grok.model))
+    for attempt in range(config.grok.retries + 1):
+        if attempt:
+            time.sleep(min(2 ** (attempt - 1), 30))
+        try:
+            response = session.post(config.grok.endpoint, headers=headers, data=payload, timeout=config.grok.timeout)
+            if response.status_code in RETRYABLE_STATUS:
+                log_action("Erreur HTTP temporaire lors de l'appel à l'API xAI", f"Statut {response.status_code}, tentative {attempt + 1}")
+                continue
+            response.raise_for_status()
+            result = response.json()
+            content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+            return parse_answer(content, batch)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 401:
+                log_action("Erreur 401 Unauthorized lors de l'appel à l'API xAI", f"Détails : {str(e)} - Vérifiez la clé API dans config.json")
+            else:
+                log_action("Erreur HTTP lors de l'appel à l'API xAI", f"Détails : {str(e)}")
+            return {}
+        except requests.exceptions.RequestException as e:
+            log_action("Erreur réseau ou autre lors de l'appel à l'API xAI", f"Détails : {str(e)}, tentative {attempt + 1}")
+        except (ValueError, AttributeError, IndexError) as e:
+            log_action("Réponse de l'API xAI illisible", f"Détails : {str(e)}, tentative {attempt + 1}")
+    return {}
+
+def classify_albums(pairs, config):
+    """Détecte le genre de plusieurs albums [(artist, album)] ; retourne {cache_key(artist, album): genre}.
+
+    Les albums déjà en cache ne sont pas redemandés. Les autres sont envoyés par lots de grok.batch-size albums,
+    au plus grok.concurrency requêtes simultanées. Un album sans réponse (lot en échec, album omis par le modèle)
+    vaut 'Unknown' pour ce traitement, sans être mis en cache.
+    """
+    version = genre_prompt_version(config)
+    cache = get_genre_cache()
+    genres = {}
+    missing = []
+    seen = set()
+    for artist, album in pairs:
+        key = cache_key(artist, album)
+        if key in seen:
+            continue
+        seen.add(key)
+        cached_genre = cache.get(artist, album, version, config.grok.cache_ttl, config.grok.negative_cache_ttl)
+        if cached_genre is not None:
+            genres[key] = cached_genre
+        else:
+            missing.append((artist, album))
+    if not missing:
+        return genres
+
+    batch_size = max(1, config.grok.batch_size)
+    batches = [missing[start:start + batch_size] for start in range(0, len(missing), batch_size)]
+    local = threading.local()
+    sessions = []
+
+    def run(batch):
+        # Une session HTTP par thread : connexions réutilisées d'un lot à l'autre, fermées à la fin du traitement
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            sessions.append(local.session)
+        return batch, request_batch(local.session, batch, config)
+
+    start_time = time.monotonic()
+    workers = max(1, min(config.grok.concurrency, len(batches)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='genre-ai') as executor:
+            for batch, answers in executor.map(run, batches):
+                for index, (artist, album) in enumerate(batch):
+                    genre = answers.get(index)
+                    if genre is None:
+                        genres[cache_key(artist, album)] = UNKNOWN_GENRE
+                        continue
+                    cache.put(artist, album, version, genre)
+                    genres[cache_key(artist, album)] = genre
+    finally:
+        for session in sessions:
+            session.close()
+    log_action("Genres détectés par lots via l'API xAI", f"{len(missing)} album(s) en {len(batches)} requête(s), {time.monotonic() - start_time:.2f} s")
+    return genres
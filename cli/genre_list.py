@@ -1,20 +1,20 @@
 import os
-import mutagen.easyid3
-from mutagen.easyid3 import EasyID3
 import mutagen.id3
-from mutagen.id3 import ID3, TCON
 import json
 import argparse
-import re
 import sys
 import colorama
+from app_config import get_tag_config, ConfigError, TAG_CONFIG_PATH
+from genre_mapper import get_mapper, GENRE_MEMO_FILE
+from tag_edit import TagEdit
+from tag_writer import WRITE_STATS
 
 # Initialisation de colorama pour les couleurs dans le terminal
 colorama.init()
 
 # Répertoires
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-CONFIG_PATH = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'etc', 'tag_config.json'))
+CONFIG_PATH = TAG_CONFIG_PATH
 
 def sanitize_name(name):
     """Gère les encodages et normalise les espaces, sans modifier les '/'."""
@@ -28,208 +28,94 @@ def sanitize_name(name):
     return name  # Ne remplace pas "/" par ","
 
 def load_mapping_config():
-    """Charge les règles de mapping des genres depuis tag_config.json, avec débogage minimal sur stderr."""
+    """Retourne les règles de mapping des genres de tag_config.json, déjà compilées, avec débogage minimal sur stderr."""
     try:
-        with open(CONFIG_PATH, 'r') as f:
-            config = json.load(f)
-        patterns = config.get('genre_patterns', {})
-        if not patterns:
-            print(f"Avertissement : Aucun pattern de mapping trouvé dans {CONFIG_PATH}. Mapping désactivé.", file=sys.stderr)
-        return patterns
+        tag_config = get_tag_config()
     except FileNotFoundError:
         print(f"Erreur : Le fichier de configuration {CONFIG_PATH} est introuvable. Mapping désactivé.", file=sys.stderr)
-        return {}
-    except json.JSONDecodeError:
-        print(f"Erreur : Le fichier {CONFIG_PATH} n'est pas un JSON valide. Mapping désactivé.", file=sys.stderr)
-        return {}
-    except Exception as e:
-        print(f"Erreur lors du chargement de {CONFIG_PATH} : {str(e)}. Mapping désactivé.", file=sys.stderr)
-        return {}
-
-def map_genre(genre, mapping_patterns):
-    """Mappe un genre vers une valeur standardisée en utilisant les patterns configurables, en convertissant en minuscules, avec débogage minimal sur stderr."""
-    if not genre:
-        print(f"Avertissement : Genre vide détecté, retour 'Unknown'.", file=sys.stderr)
-        return "Unknown"
-    genre_lower = genre.lower().strip().replace("\u200b", "").replace("\u00a0", "")  # Nettoyage des caractères invisibles
-    if genre_lower == "west coast hip hop":
-        print(f"Débogage - Tentative de mapping pour 'West Coast Hip Hop' ({genre_lower})", file=sys.stderr)
-    for pattern, mapped_genre in mapping_patterns.items():
-        try:
-            if re.search(pattern, genre_lower):
-                if genre_lower == "west coast hip hop":
-                    print(f"Débogage - Match trouvé avec pattern {pattern!r} pour 'West Coast Hip Hop', résultat : {mapped_genre!r}", file=sys.stderr)
-                return mapped_genre
-        except re.error:
-            print(f"Avertissement : Pattern regex invalide {pattern!r} ignoré.", file=sys.stderr)
-            continue
-    if genre_lower == "west coast hip hop":
-        print(f"Débogage - Aucun match trouvé pour 'West Coast Hip Hop' ({genre_lower})", file=sys.stderr)
-    return genre  # Retourne le genre original si aucun mapping n'est trouvé
-
-def extract_genres_from_mp3(directory, recursive=False):
-    """Extrait les genres uniques (ou inventaire) des fichiers MP3 dans le répertoire donné, avec option récursive, en évitant les doublons."""
+        return ()
+    except ConfigError as e:
+        print(f"Erreur : {str(e)}. Mapping désactivé.", file=sys.stderr)
+        return ()
+    for error in tag_config.errors:
+        print(f"Avertissement : {error}", file=sys.stderr)
+    if not tag_config.genre_patterns:
+        print(f"Avertissement : Aucun pattern de mapping trouvé dans {CONFIG_PATH}. Mapping désactivé.", file=sys.stderr)
+    return tag_config.genre_patterns
+
+def list_mp3_files(directory, recursive=False):
+    """Chemins complets des fichiers MP3 du répertoire (et de ses sous-dossiers si recursive), en un seul parcours."""
     if recursive:
         for root, _, files in os.walk(directory):
             for filename in files:
-                if filename.lower().endswith(('.mp3', '.MP3')):
-                    file_path = os.path.join(root, filename)
-                    try:
-                        genre_found = False
-                        # Essayer d'abord avec EasyID3
-                        try:
-                            audio = EasyID3(file_path)
-                            if "genre" in audio:
-                                raw_genre = audio["genre"][0].strip()
-                                sanitized_genre = sanitize_name(raw_genre)
-                                if sanitized_genre:
-                                    genre_found = True
-                                    yield sanitized_genre, os.path.basename(file_path)
-                        except mutagen.easyid3.EasyID3KeyError:
-                            pass
-
-                        # Essayer ensuite avec ID3 seulement si aucun genre n’a été trouvé avec EasyID3
-                        if not genre_found:
-                            try:
-                                audio_id3 = ID3(file_path)
-                                if 'TCON' in audio_id3:
-                                    raw_genre = audio_id3['TCON'].text[0].strip()
-                                    sanitized_genre = sanitize_name(raw_genre)
-                                    if sanitized_genre:
-                                        yield sanitized_genre, os.path.basename(file_path)
-                            except mutagen.id3.ID3NoHeaderError:
-                                pass
-                    except Exception as e:
-                        print(f"Erreur pour {file_path} : {str(e)}", file=sys.stderr)
-                        continue
+                if filename.lower().endswith('.mp3'):
+                    yield os.path.join(root, filename)
     else:
         for filename in os.listdir(directory):
-            if filename.lower().endswith(('.mp3', '.MP3')):
-                file_path = os.path.join(directory, filename)
-                try:
-                    genre_found = False
-                    # Essayer d'abord avec EasyID3
-                    try:
-                        audio = EasyID3(file_path)
-                        if "genre" in audio:
-                            raw_genre = audio["genre"][0].strip()
-                            sanitized_genre = sanitize_name(raw_genre)
-                            if sanitized_genre:
-                                genre_found = True
-                                yield sanitized_genre, os.path.basename(file_path)
-                    except mutagen.easyid3.EasyID3KeyError:
-                        pass
+            if filename.lower().endswith('.mp3'):
+                yield os.path.join(directory, filename)
 
-                    # Essayer ensuite avec ID3 seulement si aucun genre n’a été trouvé avec EasyID3
-                    if not genre_found:
-                        try:
-                            audio_id3 = ID3(file_path)
-                            if 'TCON' in audio_id3:
-                                raw_genre = audio_id3['TCON'].text[0].strip()
-                                sanitized_genre = sanitize_name(raw_genre)
-                                if sanitized_genre:
-                                    yield sanitized_genre, os.path.basename(file_path)
-                        except mutagen.id3.ID3NoHeaderError:
-                            pass
-                except Exception as e:
-                    print(f"Erreur pour {file_path} : {str(e)}", file=sys.stderr)
-                    continue
-
-def build_inventory(genres_with_titles, recursive=False):
-    """Construit un inventaire à partir des genres et titres générés par extract_genres_from_mp3."""
-    genre_inventory = {}  # Dictionnaire {genre: set(titres)} pour éviter les doublons
-    for genre, title in genres_with_titles:
-        if genre in genre_inventory:
-            genre_inventory[genre].add(title)
-        else:
-            genre_inventory[genre] = {title}
-    # Convertir les sets en listes triées et retourner une liste triée de tuples (genre, titres)
-    return sorted([(genre, sorted(list(titres))) for genre, titres in genre_inventory.items()], key=lambda x: x[0])
-
-def update_genre_in_file(file_path, old_genre, new_genre):
-    """Met à jour le tag 'genre' (TCON) d'un fichier MP3."""
-    try:
-        # Essayer d'abord avec EasyID3 pour ID3v2
-        try:
-            audio = EasyID3(file_path)
-            if "genre" in audio and audio["genre"][0].strip() == old_genre:
-                audio["genre"] = new_genre
-                audio.save()
-                print(f"Mise à jour : {os.path.basename(file_path)} - Ancien genre : {old_genre}, Nouveau genre : {new_genre}")
-        except mutagen.easyid3.EasyID3KeyError:
-            pass
+def extract_genres_from_mp3(directory, recursive=False):
+    """Extrait (genre normalisé, chemin complet, genre brut) pour chaque fichier MP3 ayant un genre, avec option récursive.
 
-        # Essayer ensuite avec ID3 pour ID3v1/ID3v2 si nécessaire
+    Chaque fichier n'est ouvert qu'une fois : le genre brut sert ensuite à l'aperçu et à l'application du mapping.
+    """
+    for file_path in list_mp3_files(directory, recursive):
         try:
-            audio_id3 = ID3(file_path)
-            if 'TCON' in audio_id3 and audio_id3['TCON'].text[0].strip() == old_genre:
-                audio_id3['TCON'] = TCON(encoding=3, text=[new_genre])  # UTF-8 encoding
-                audio_id3.save()
-                print(f"Mise à jour : {os.path.basename(file_path)} - Ancien genre : {old_genre}, Nouveau genre : {new_genre}")
+            raw_genre = TagEdit(file_path).first("genre")
         except mutagen.id3.ID3NoHeaderError:
-            pass
-    except Exception as e:
-        print(f"Erreur lors de la mise à jour de {file_path} : {str(e)}", file=sys.stderr)
+            continue
+        except Exception as e:
+            print(f"Erreur pour {file_path} : {str(e)}", file=sys.stderr)
+            continue
+        raw_genre = raw_genre.strip() if raw_genre else ""
+        sanitized_genre = sanitize_name(raw_genre)
+        if sanitized_genre:
+            yield sanitized_genre, file_path, raw_genre
+
+def build_inventory(genres_with_files):
+    """Construit un inventaire [(genre, [(chemin, genre brut), ...])] trié, à partir de extract_genres_from_mp3.
+
+    Les fichiers sont identifiés par leur chemin complet : deux titres de même nom dans des dossiers différents
+    restent deux entrées distinctes.
+    """
+    genre_inventory = {}  # Dictionnaire {genre: {chemin: genre brut}}
+    for genre, file_path, raw_genre in genres_with_files:
+        genre_inventory.setdefault(genre, {})[file_path] = raw_genre
+    return sorted(
+        [(genre, sorted(files.items(), key=lambda item: (os.path.basename(item[0]), item[0]))) for genre, files in genre_inventory.items()],
+        key=lambda x: x[0]
+    )
 
 def print_inventory_to_screen(inventory, apply_mapping=False, args=None):
     """Affiche l’inventaire des genres et leurs titres associés, avec option de mapping, en jaune et avec séparateurs, en regroupant par genre mappé, et colore les chansons modifiées en rouge avec l’ancien genre."""
-    mapping_patterns = load_mapping_config() if apply_mapping else {}
+    mapping_patterns = load_mapping_config() if apply_mapping else ()
     if inventory:
-        # Regrouper les titres par genre mappé et suivre les changements
-        mapped_inventory = {}  # Dictionnaire temporaire {genre_mappé: set(titres)}
+        # Regrouper les fichiers par genre mappé et suivre les changements, sans relire les fichiers
+        mapped_inventory = {}  # Dictionnaire temporaire {genre_mappé: [chemins]}
         genre_changes = {}  # Suivre les changements de genre pour le prompt : {file_path: (old_genre, new_genre)}
-        title_changes = {}  # Suivre les titres modifiés : {title: old_genre}
-        for genre, titles in inventory:
-            mapped_genre = map_genre(genre, mapping_patterns) if apply_mapping else genre
-            for title in titles:
-                file_path = None
-                # Rechercher le fichier correspondant au titre dans le répertoire
-                for root, _, files in os.walk(args.directory if not args.recursive else args.directory):
-                    for f in files:
-                        if os.path.basename(f) == title and f.lower().endswith(('.mp3', '.MP3')):
-                            file_path = os.path.join(root, f)
-                            break
-                    if file_path:
-                        break
-                if file_path:
-                    try:
-                        # Vérifier le genre actuel dans le fichier
-                        current_genre = None
-                        try:
-                            audio = EasyID3(file_path)
-                            if "genre" in audio:
-                                current_genre = audio["genre"][0].strip()
-                        except mutagen.easyid3.EasyID3KeyError:
-                            pass
-                        if not current_genre:
-                            try:
-                                audio_id3 = ID3(file_path)
-                                if 'TCON' in audio_id3:
-                                    current_genre = audio_id3['TCON'].text[0].strip()
-                            except mutagen.id3.ID3NoHeaderError:
-                                pass
-                        if current_genre and current_genre != mapped_genre:
-                            genre_changes[file_path] = (current_genre, mapped_genre)
-                            title_changes[title] = current_genre
-                    except Exception as e:
-                        print(f"Erreur lors de la vérification de {file_path} : {str(e)}", file=sys.stderr)
-                        continue
-                if mapped_genre in mapped_inventory:
-                    mapped_inventory[mapped_genre].add(title)
-                else:
-                    mapped_inventory[mapped_genre] = {title}
-        
-        # Convertir en liste triée de tuples (genre, titres triés) pour une sortie claire
-        sorted_inventory = sorted([(genre, sorted(list(titles))) for genre, titles in mapped_inventory.items()], key=lambda x: x[0])
-        
-        for i, (genre, titles) in enumerate(sorted_inventory, 1):
+        for genre, files in inventory:
+            mapped_genre = get_mapper(mapping_patterns, GENRE_MEMO_FILE).map(genre) if apply_mapping else genre
+            for file_path, current_genre in files:
+                if current_genre and current_genre != mapped_genre:
+                    genre_changes[file_path] = (current_genre, mapped_genre)
+                mapped_inventory.setdefault(mapped_genre, []).append(file_path)
+
+        # Convertir en liste triée de tuples (genre, fichiers triés par titre) pour une sortie claire
+        sorted_inventory = sorted(
+            [(genre, sorted(paths, key=lambda path: (os.path.basename(path), path))) for genre, paths in mapped_inventory.items()],
+            key=lambda x: x[0]
+        )
+
+        for i, (genre, paths) in enumerate(sorted_inventory, 1):
             # Utiliser colorama pour colorer le genre en jaune
             colored_genre = f"{colorama.Fore.YELLOW}{genre}{colorama.Style.RESET_ALL}"
             print(f"{colored_genre}:")
-            for title in titles:
-                if title in title_changes and apply_mapping:  # Si le titre a changé de genre et que --map est utilisé
+            for file_path in paths:
+                title = os.path.basename(file_path)
+                if file_path in genre_changes and apply_mapping:  # Si le titre a changé de genre et que --map est utilisé
                     # Colorer en rouge et ajouter l’ancien genre
-                    colored_title = f"{colorama.Fore.RED}{title} (Ancien genre : {title_changes[title]}){colorama.Style.RESET_ALL}"
+                    colored_title = f"{colorama.Fore.RED}{title} (Ancien genre : {genre_changes[file_path][0]}){colorama.Style.RESET_ALL}"
                     print(f"  - {colored_title}")
                 else:
                     print(f"  - {title}")
@@ -245,14 +131,16 @@ def print_inventory_to_screen(inventory, apply_mapping=False, args=None):
             if response == "oui":
                 for file_path, (old_genre, new_genre) in genre_changes.items():
                     update_genre_in_file(file_path, old_genre, new_genre)
+                print(f"Écritures de tags : {WRITE_STATS.summary()}")
     else:
         print("Aucun genre ou titre trouvé.", file=sys.stderr)
 
 def print_genres_to_screen(genres, apply_mapping=False):
     """Affiche les genres au format JSON { "genre1": "", "genre2": "", ... } à l’écran, avec option de mapping."""
-    mapping_patterns = load_mapping_config() if apply_mapping else {}
+    mapping_patterns = load_mapping_config() if apply_mapping else ()
     if mapping_patterns:
-        mapped_genres = {map_genre(genre, mapping_patterns): "" for genre in genres if genre != "Unknown"}
+        mapper = get_mapper(mapping_patterns, GENRE_MEMO_FILE)
+        mapped_genres = {mapper.map(genre): "" for genre in genres if genre != "Unknown"}
         if not mapped_genres:
             mapped_genres = {"Unknown": ""}
     else:
@@ -262,27 +150,16 @@ def print_genres_to_screen(genres, apply_mapping=False):
     print(json.dumps(mapped_genres, indent=2, ensure_ascii=False))
 
 def update_genre_in_file(file_path, old_genre, new_genre):
-    """Met à jour le tag 'genre' (TCON) d'un fichier MP3."""
+    """Met à jour le tag 'genre' (TCON) d'un fichier MP3, sur place dans la marge ID3 quand elle suffit."""
     try:
-        # Essayer d'abord avec EasyID3 pour ID3v2
-        try:
-            audio = EasyID3(file_path)
-            if "genre" in audio and audio["genre"][0].strip() == old_genre:
-                audio["genre"] = new_genre
-                audio.save()
+        audio = TagEdit(file_path)
+        genre = audio.first("genre")
+        if genre is not None and genre.strip() == old_genre:
+            audio["genre"] = new_genre
+            if audio.save():
                 print(f"Mise à jour : {os.path.basename(file_path)} - Ancien genre : {old_genre}, Nouveau genre : {new_genre}")
-        except mutagen.easyid3.EasyID3KeyError:
-            pass
-
-        # Essayer ensuite avec ID3 pour ID3v1/ID3v2 si nécessaire
-        try:
-            audio_id3 = ID3(file_path)
-            if 'TCON' in audio_id3 and audio_id3['TCON'].text[0].strip() == old_genre:
-                audio_id3['TCON'] = TCON(encoding=3, text=[new_genre])  # UTF-8 encoding
-                audio_id3.save()
-                print(f"Mise à jour : {os.path.basename(file_path)} - Ancien genre : {old_genre}, Nouveau genre : {new_genre}")
-        except mutagen.id3.ID3NoHeaderError:
-            pass
+    except mutagen.id3.ID3NoHeaderError:
+        pass
     except Exception as e:
         print(f"Erreur lors de la mise à jour de {file_path} : {str(e)}", file=sys.stderr)
 
@@ -294,6 +171,7 @@ def main():
     parser.add_argument("--map", action="store_true", help="Appliquer le mapping des genres depuis tag_config.json.")
     parser.add_argument("--inventory", action="store_true", help="Afficher un inventaire des genres et des titres associés au lieu du JSON.")
     parser.add_argument("--dry", action="store_true", help="Mode sec (ne pas appliquer de modifications, même avec --map).")
+    parser.add_argument("--rule-stats", action="store_true", help="Avec --map, afficher sur stderr le nombre de matchs et le temps passé par pattern.")
     args = parser.parse_args()
 
     directory = os.path.abspath(args.directory)
@@ -310,13 +188,23 @@ def main():
     
     # Extraire les genres uniques ou l’inventaire
     if args.inventory:
-        inventory = build_inventory(extract_genres_from_mp3(directory, args.recursive), args.recursive)
+        inventory = build_inventory(extract_genres_from_mp3(directory, args.recursive))
         print_inventory_to_screen(inventory, args.map, args)
     else:
-        genres = sorted({genre for genre, _ in extract_genres_from_mp3(directory, args.recursive)})
+        genres = sorted({genre for genre, _, _ in extract_genres_from_mp3(directory, args.recursive)})
         if not genres:
             print("Aucun genre trouvé.", file=sys.stderr)
         print_genres_to_screen(genres, args.map)
 
+    if args.map:
+        mapper = get_mapper(load_mapping_config(), GENRE_MEMO_FILE)
+        if args.rule_stats:
+            for line in mapper.stats_lines():
+                print(line, file=sys.stderr)
+        try:
+            mapper.save()
+        except OSError as e:
+            print(f"Avertissement : mémo des genres non enregistré dans {GENRE_MEMO_FILE} : {str(e)}", file=sys.stderr)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
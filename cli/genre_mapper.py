@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import status_log
+
+# Taille du cache des genres déjà mappés : une bibliothèque compte quelques centaines de genres distincts
+MEMO_SIZE = 4096
+# Mémo persisté, partagé par tag_rename_move et genre_list
+GENRE_MEMO_FILE = os.path.join(status_log.LOG_DIR, 'genre_memo.json')
+
+def normalize_genre(genre):
+    """Forme comparée aux patterns : minuscules, sans espaces de bord ni caractères invisibles."""
+    return str(genre).lower().strip().replace("\u200b", "").replace("\u00a0", "")
+
+def patterns_hash(genre_patterns):
+    """Empreinte de l'ensemble ordonné des règles : un mémo persisté n'est réutilisé que pour les mêmes règles."""
+    digest = hashlib.sha256()
+    for rule in genre_patterns:
+        digest.update(json.dumps([rule.pattern, rule.genre], ensure_ascii=False).encode())
+    return digest.hexdigest()
+
+class RuleStats:
+    """Compteurs d'une règle : évaluations, matchs et temps passé dans regex.search."""
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.evaluations = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+class GenreMapper:
+    """Mapping des genres par les règles précompilées de tag_config.json (la première qui matche l'emporte).
+
+    Le résultat de chaque genre normalisé est mémorisé (LRU de memo_size entrées) : les regex ne sont évaluées
+    qu'une fois par genre distinct. Si memo_path est renseigné, le mémo est rechargé au démarrage tant que les
+    règles n'ont pas changé, et save() le réécrit.
+    """
+
+    def __init__(self, genre_patterns, memo_size=MEMO_SIZE, memo_path=''):
+        self.genre_patterns = tuple(genre_patterns)
+        self.memo_size = memo_size
+        self.memo_path = memo_path
+        self.hash = patterns_hash(self.genre_patterns)
+        self.lock = threading.Lock()
+        self.memo = OrderedDict()  # {genre normalisé: genre mappé, ou None si aucune règle ne matche}
+        self.rule_stats = [RuleStats(rule) for rule in self.genre_patterns]
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.dirty = False
+        if memo_path:
+            self._load()
+
+    def map(self, genre):
+        """Retourne le genre mappé, le genre d'origine si aucune règle ne matche, 'Unknown' s'il est vide."""
+        if not genre:
+            return "Unknown"
+        key = normalize_genre(genre)
+        with self.lock:
+            if key in self.memo:
+                self.memo.move_to_end(key)
+                self.memo_hits += 1
+                mapped = self.memo[key]
+                return genre if mapped is None else mapped
+        mapped = self._match(key)
+        with self.lock:
+            self.memo_misses += 1
+            self.memo[key] = mapped
+            self.memo.move_to_end(key)
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+            self.dirty = True
+        return genre if mapped is None else mapped
+
+    def _match(self, key):
+        for stats in self.rule_stats:
+            start = time.perf_counter()
+            matched = stats.rule.regex.search(key)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stats.evaluations += 1
+                stats.seconds += elapsed
+                if matched:
+                    stats.hits += 1
+            if matched:
+                return stats.rule.genre
+        return None
+
+    def _load(self):
+        try:
+            with open(self.memo_path, 'r') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Avertissement : mémo des genres {self.memo_path} illisible, ignoré : {str(e)}")
+            return
+        if not isinstance(raw, dict) or raw.get('patterns') != self.hash or not isinstance(raw.get('genres'), dict):
+            return  # Règles modifiées depuis l'écriture du mémo : tout est recalculé
+        for key, mapped in list(raw['genres'].items())[-self.memo_size:]:
+            self.memo[key] = mapped
+
+    def save(self):
+        """Réécrit le mémo persisté (de façon atomique) s'il a changé depuis le dernier enregistrement."""
+        if not self.memo_path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            genres = dict(self.memo)
+            self.dirty = False
+        directory = os.path.dirname(self.memo_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.memo_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump({'patterns': self.hash, 'genres': genres}, f, ensure_ascii=False)
+        os.replace(temporary_path, self.memo_path)
+
+    def stats_lines(self):
+        """Rapport lisible : efficacité du mémo puis règles triées par temps cumulé (les plus coûteuses d'abord)."""
+        with self.lock:
+            lookups = self.memo_hits + self.memo_misses
+            lines = [f"Mémo : {self.memo_hits}/{lookups} genre(s) servis depuis le cache, {len(self.memo)} genre(s) distinct(s) mémorisé(s)"]
+            for stats in sorted(self.rule_stats, key=lambda item: item.seconds, reverse=True):
+                average = stats.seconds / stats.evaluations * 1e6 if stats.evaluations else 0.0
+                lines.append(f"{stats.seconds * 1000:9.3f} ms  {stats.evaluations:6d} éval.  {stats.hits:6d} match(s)  {average:7.2f} µs/éval.  {stats.rule.pattern!r} -> {stats.rule.genre!r}")
+        return lines
+
+# Mapper partagé par les threads du processus, reconstruit quand tag_config.json est rechargé
+_shared_lock = threading.Lock()
+_shared = None  # (genre_patterns, memo_path, GenreMapper)
+
+def get_mapper(genre_patterns, memo_path=''):
+    """Retourne le mapper des règles données (même tuple que get_tag_config().genre_patterns), créé une seule fois."""
+    global _shared
+    shared = _shared
+    if shared is not None and shared[0] is genre_patterns and shared[1] == memo_path:
+        return shared[2]
+    with _shared_lock:
+        if _shared is None or _shared[0] is not genre_patterns or _shared[1] != memo_path:
+            if _shared is not None:
+                _shared[2].save()
+            _shared = (genre_patterns, memo_path, GenreMapper(genre_patterns, memo_path=memo_path))
+        return _shared[2]
+
+def map_genre(genre, genre_patterns, memo_path=''):
+    """Mappe un genre vers une valeur standardisée avec le mapper partagé des règles données."""
+    return get_mapper(genre_patterns, memo_path).map(genre)
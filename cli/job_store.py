@@ -0,0 +1,138 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from urllib.parse import urlsplit, urlunsplit
+import status_log
+
+JOB_STORE_FILE = os.path.join(status_log.LOG_DIR, 'jobs.sqlite')
+
+STATUS_RUNNING = 'running'
+STATUS_SUCCESS = 'success'
+STATUS_FAILED = 'failed'
+
+SPOTIFY_URI_PATTERN = re.compile(r"^spotify:(track|album|playlist|artist|episode|show):([A-Za-z0-9]+)$")
+SPOTIFY_LOCALE_PREFIX = re.compile(r"^/intl-[a-z]{2}(?:-[a-z]{2})?(?=/)", re.IGNORECASE)
+
+def normalize_url(url):
+    """Normalise une URL Spotify : URI spotify:type:id, préfixe /intl-xx, paramètres (?si=...) et slash final ignorés."""
+    url = (url or "").strip()
+    uri_match = SPOTIFY_URI_PATTERN.match(url)
+    if uri_match:
+        return f"https://open.spotify.com/{uri_match.group(1)}/{uri_match.group(2)}"
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.endswith('spotify.com'):
+        path = SPOTIFY_LOCALE_PREFIX.sub('', parts.path).rstrip('/')
+        return urlunsplit(('https', 'open.spotify.com', path, '', ''))
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip('/'), parts.query, ''))
+
+def job_key(url, sync):
+    """Clé d'idempotence d'un message : URL normalisée + option sync."""
+    return f"{normalize_url(url)}|sync={int(bool(sync))}"
+
+class JobStore:
+    """Historique SQLite des jobs du consommateur, utilisé pour ignorer les URLs déjà téléchargées récemment."""
+
+    def __init__(self, path=JOB_STORE_FILE):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                job_key TEXT NOT NULL,
+                url TEXT,
+                sync INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                message TEXT
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_key_finished ON jobs (job_key, status, finished_at)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS parent_jobs (
+                parent_id TEXT PRIMARY KEY,
+                url TEXT,
+                total INTEGER NOT NULL,
+                succeeded INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+
+    def recent_success(self, key, window):
+        """Retourne (job_id, finished_at) du dernier succès pour cette clé dans la fenêtre (secondes), sinon None."""
+        if window <= 0:
+            return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT job_id, finished_at FROM jobs WHERE job_key = ? AND status = ? AND finished_at >= ? "
+                "ORDER BY finished_at DESC LIMIT 1",
+                (key, STATUS_SUCCESS, time.time() - window)
+            ).fetchone()
+        return row
+
+    def record_start(self, job_id, key, url, sync):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, job_key, url, sync, status, started_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, key, url, int(bool(sync)), STATUS_RUNNING, time.time())
+            )
+
+    def record_outcome(self, job_id, success, message=""):
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE job_id = ?",
+                (STATUS_SUCCESS if success else STATUS_FAILED, time.time(), message, job_id)
+            )
+
+    def last_job(self, key):
+        """Dernier job connu pour une clé : (job_id, status, started_at, finished_at, message) ou None."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT job_id, status, started_at, finished_at, message FROM jobs WHERE job_key = ? "
+                "ORDER BY started_at DESC LIMIT 1",
+                (key,)
+            ).fetchone()
+
+    def create_parent(self, parent_id, url, total):
+        """Enregistre une playlist/album éclaté en total messages de morceaux."""
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO parent_jobs (parent_id, url, total, created_at) VALUES (?, ?, ?, ?)",
+                (parent_id, url, total, time.time())
+            )
+
+    def record_child_outcome(self, parent_id, success):
+        """Compte le résultat d'un morceau ; retourne (url, total, succeeded, failed, terminé) ou None si parent inconnu."""
+        column = 'succeeded' if success else 'failed'
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute(f"UPDATE parent_jobs SET {column} = {column} + 1 WHERE parent_id = ?", (parent_id,))
+                row = self.db.execute(
+                    "SELECT url, total, succeeded, failed, finished_at FROM parent_jobs WHERE parent_id = ?",
+                    (parent_id,)
+                ).fetchone()
+                finished = False
+                if row is not None and row[4] is None and row[2] + row[3] >= row[1]:
+                    self.db.execute("UPDATE parent_jobs SET finished_at = ? WHERE parent_id = ?", (time.time(), parent_id))
+                    finished = True
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], row[1], row[2], row[3], finished
+
+    def close(self):
+        with self.lock:
+            self.db.close()
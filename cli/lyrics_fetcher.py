@@ -2,7 +2,6 @@
 
 import os
 import argparse
-import json
 from mutagen.easyid3 import EasyID3
 from mutagen.id3 import USLT, ID3
 from mutagen.mp4 import MP4, MP4FreeForm
@@ -14,6 +13,8 @@ import sys
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 from bs4 import BeautifulSoup  # Ajout pour parser les pages Genius
+from app_config import get_config
+from tag_writer import save_id3, WRITE_STATS
 
 colorama.init()
 
@@ -43,8 +44,8 @@ class LyricsFetcher:
         ))
 
     def load_config(self):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
+        # JSON brut issu du cache partagé (parsé une seule fois par processus)
+        return get_config().raw
 
     def get_genre(self, file_path):
         try:
@@ -225,7 +226,8 @@ class LyricsFetcher:
                     try:
                         audio = ID3(file_path)
                         audio.add(USLT(encoding=3, lang='eng', text=result['lyrics']))
-                        audio.save()
+                        # Sur place si les paroles tiennent dans la marge réservée au classement dans la bibliothèque
+                        save_id3(audio, file_path)
                     except Exception as e:
                         print(f"Erreur lors de l'enregistrement des paroles dans {file_path}: {e}", file=sys.stderr)
                 elif file_path.lower().endswith('.m4a'):
@@ -258,12 +260,14 @@ def main():
         if args.force_save:
             fetcher.save_lyrics()
             print("Lyrics saved successfully!")
+            print(f"Écritures de tags : {WRITE_STATS.summary()}")
         else:
             print(f"\n{Fore.GREEN}Save lyrics to files? (y/n): {Style.RESET_ALL}", end='')
             choice = input().lower()
             if choice == 'y':
                 fetcher.save_lyrics()
                 print("Lyrics saved successfully!")
+                print(f"Écritures de tags : {WRITE_STATS.summary()}")
             else:
                 print("Lyrics not saved.")
 
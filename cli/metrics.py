@@ -0,0 +1,233 @@
+import os
+import math
+import time
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bornes des histogrammes les plus courants
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+FAST_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(size * 1024 * 1024 for size in (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Fonctions appelées à chaque observation d'histogramme (benchmarks : percentiles exacts sur les valeurs brutes)
+_observers = []
+
+def add_observer(callback):
+    """Enregistre callback(nom, labels, valeur), appelé à chaque observation d'un histogramme."""
+    _observers.append(callback)
+
+def remove_observer(callback):
+    _observers.remove(callback)
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class Metric:
+    """Métrique nommée, déclinée par combinaison de labels ; toutes les mises à jour sont thread-safe."""
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Labels attendus pour {self.name} : {self.labelnames}, reçus : {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Histogramme cumulatif au format Prometheus (_bucket, _sum, _count)."""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+        for observer in _observers:
+            observer(self.name, labels, value)
+
+    def time(self, **labels):
+        """Context manager mesurant la durée du bloc."""
+        return _Timer(self, labels)
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+        return False
+
+class Registry:
+    """Ensemble des métriques d'un processus, rendu au format texte Prometheus."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Registre partagé par les modules du processus
+REGISTRY = Registry()
+
+def start_http_server(port, bind='127.0.0.1', registry=REGISTRY):
+    """Expose /metrics sur bind:port depuis un thread dédié ; retourne le serveur (shutdown() pour l'arrêter)."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Pas de journal par requête : Prometheus interroge toutes les 15 secondes
+
+    server = ThreadingHTTPServer((bind, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+class PromFileWriter:
+    """Réécrit périodiquement un fichier .prom (collecteur textfile de node_exporter), de façon atomique."""
+
+    def __init__(self, path, interval=15, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.stopped = threading.Event()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name='metrics-file', daemon=True)
+        self.thread.start()
+
+    def write(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w') as f:
+            f.write(self.registry.render())
+        os.replace(temporary_path, self.path)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Erreur lors de l'écriture des métriques dans {self.path} : {e}")
+
+    def close(self):
+        """Arrête le thread après une dernière écriture."""
+        self.stopped.set()
+        self.thread.join()
+        try:
+            self.write()
+        except OSError as e:
+            print(f"Erreur lors de l'écriture des métriques dans {self.path} : {e}")
@@ -0,0 +1,98 @@
+import os
+import signal
+import subprocess
+import threading
+import queue
+import time
+from collections import deque, namedtuple
+
+# Résultat d'une exécution : code retour, dépassement du délai, interruption demandée, dernières lignes de chaque flux et durée
+PumpResult = namedtuple('PumpResult', ['return_code', 'timed_out', 'cancelled', 'stdout_tail', 'stderr_tail', 'duration'])
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+_EOF = object()
+
+def _read_stream(stream, name, lines):
+    """Lit un flux ligne par ligne et pousse (horodatage, flux, ligne) dans la file bornée."""
+    try:
+        for line in iter(stream.readline, ''):
+            lines.put((time.time(), name, line.rstrip('\r\n')))
+    except (OSError, ValueError):
+        pass
+    finally:
+        lines.put((time.time(), name, _EOF))
+
+def _kill_process_group(process, grace_period):
+    """Termine le groupe de processus (bash et provider), puis le tue s'il ne s'arrête pas à temps."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+def run_with_pump(cmd, on_line=None, timeout=None, max_buffered_lines=1000, tail_lines=50, grace_period=10, cancel_event=None):
+    """Exécute cmd via bash en vidant stdout et stderr en parallèle.
+
+    Chaque ligne est transmise à on_line(horodatage, flux, ligne) dès sa lecture. Les lecteurs passent par
+    une file bornée à max_buffered_lines, et le processus est tué si timeout (secondes) est dépassé ou si
+    cancel_event (threading.Event) est levé.
+    """
+    start_time = time.time()
+    deadline = start_time + timeout if timeout else None
+    process = subprocess.Popen(
+        ['/bin/bash', '-c', cmd],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+        errors='replace',
+        start_new_session=True  # Groupe de processus dédié pour pouvoir tuer le provider avec bash
+    )
+    lines = queue.Queue(maxsize=max_buffered_lines)
+    tails = {STDOUT: deque(maxlen=tail_lines), STDERR: deque(maxlen=tail_lines)}
+    readers = [
+        threading.Thread(target=_read_stream, args=(process.stdout, STDOUT, lines), daemon=True),
+        threading.Thread(target=_read_stream, args=(process.stderr, STDERR, lines), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = False
+    cancelled = False
+    open_streams = len(readers)
+    while open_streams:
+        wait = 0.5
+        if deadline is not None:
+            wait = max(0.0, min(wait, deadline - time.time()))
+        try:
+            timestamp, name, line = lines.get(timeout=wait)
+        except queue.Empty:
+            line = None
+        if deadline is not None and not timed_out and time.time() >= deadline:
+            timed_out = True
+            _kill_process_group(process, grace_period)
+        if cancel_event is not None and not cancelled and not timed_out and cancel_event.is_set():
+            cancelled = True
+            _kill_process_group(process, grace_period)
+        if line is None:
+            continue
+        if line is _EOF:
+            open_streams -= 1
+            continue
+        tails[name].append(line)
+        if on_line:
+            on_line(timestamp, name, line)
+
+    for reader in readers:
+        reader.join()
+    return_code = process.wait()
+    process.stdout.close()
+    process.stderr.close()
+    return PumpResult(return_code, timed_out, cancelled, list(tails[STDOUT]), list(tails[STDERR]), time.time() - start_time)
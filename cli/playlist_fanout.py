@@ -0,0 +1,80 @@
+import json
+from urllib.parse import urlsplit
+from job_store import normalize_url
+
+# Types d'URL Spotify éclatés en un message par morceau
+EXPANDABLE_TYPES = ('playlist', 'album')
+
+def spotify_url_type(url):
+    """Retourne (type, id) d'une URL Spotify normalisée, par exemple ('playlist', '37i9dQ...'), sinon (None, None)."""
+    parts = [part for part in urlsplit(normalize_url(url)).path.split('/') if part]
+    if len(parts) >= 2:
+        return parts[0], parts[1]
+    return None, None
+
+def track_url(track_id):
+    return f"https://open.spotify.com/track/{track_id}"
+
+class SpotifyResolver:
+    """Résout une playlist ou un album en URLs de morceaux via l'API Spotify (client credentials)."""
+
+    def __init__(self, client_id, client_secret):
+        # Import local : spotipy n'est requis que si l'éclatement des playlists est activé
+        import spotipy
+        from spotipy.oauth2 import SpotifyClientCredentials
+        self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=client_id, client_secret=client_secret))
+
+    def resolve(self, url):
+        url_type, item_id = spotify_url_type(url)
+        if url_type == 'playlist':
+            page = self.sp.playlist_items(item_id, fields='items(track(id,type,is_local)),next', additional_types=('track',))
+            track_ids = []
+            while page:
+                for item in page.get('items', []):
+                    track = item.get('track') or {}
+                    if track.get('type') == 'track' and track.get('id') and not track.get('is_local'):
+                        track_ids.append(track['id'])
+                page = self.sp.next(page) if page.get('next') else None
+            return [track_url(track_id) for track_id in track_ids]
+        if url_type == 'album':
+            page = self.sp.album_tracks(item_id, limit=50)
+            track_ids = []
+            while page:
+                track_ids.extend(track['id'] for track in page.get('items', []) if track.get('id'))
+                page = self.sp.next(page) if page.get('next') else None
+            return [track_url(track_id) for track_id in track_ids]
+        return None
+
+class StubResolver:
+    """Résolveur local pour les tests et benchmarks : fichier JSON {url normalisée: [urls des morceaux]}."""
+
+    def __init__(self, path):
+        with open(path, 'r') as f:
+            self.mapping = {normalize_url(url): tracks for url, tracks in json.load(f).items()}
+
+    def resolve(self, url):
+        return self.mapping.get(normalize_url(url))
+
+def make_resolver(fanout_config, client_id, client_secret):
+    """Construit le résolveur configuré dans la section 'fanout' ('spotify' ou 'stub')."""
+    if fanout_config.resolver == 'stub':
+        return StubResolver(fanout_config.stub_file)
+    if fanout_config.resolver == 'spotify':
+        return SpotifyResolver(client_id, client_secret)
+    raise ValueError(f"Résolveur '{fanout_config.resolver}' non pris en charge")
+
+def expand_url(resolver, url, sync, min_tracks=2):
+    """Retourne la liste des URLs de morceaux à publier, ou None si le message doit être traité tel quel.
+
+    Les synchronisations (--sync) ne sont jamais éclatées : spotdl a besoin de la playlist entière pour
+    supprimer les morceaux retirés.
+    """
+    if sync:
+        return None
+    url_type, _ = spotify_url_type(url)
+    if url_type not in EXPANDABLE_TYPES:
+        return None
+    tracks = resolver.resolve(url)
+    if not tracks or len(tracks) < min_tracks:
+        return None
+    return list(dict.fromkeys(tracks))  # Supprime les doublons en conservant l'ordre
@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+
+# Motifs reconnus dans la sortie des providers (spotdl et zotify)
+TOTAL_PATTERNS = [
+    re.compile(r"Found (\d+) songs?", re.IGNORECASE),                     # spotdl : "Found 42 songs in My Playlist"
+    re.compile(r"Total (?:tracks|songs)\s*:?\s*(\d+)", re.IGNORECASE)
+]
+INDEX_PATTERN = re.compile(r"\((\d+)\s*/\s*(\d+)\)")                       # "(3/42)"
+DONE_PATTERNS = [
+    re.compile(r"Downloaded\s+\"(?P<title>[^\"]+)\"", re.IGNORECASE),      # spotdl et zotify : Downloaded "Titre"
+    re.compile(r"Skipping\s+(?P<title>.+?)\s+\(", re.IGNORECASE),          # spotdl : Skipping X (file already exists)
+    re.compile(r"SKIPPING:\s*(?P<title>.+?)\s+\(", re.IGNORECASE)          # zotify : ###   SKIPPING: X (SONG ALREADY EXISTS)
+]
+
+def make_event(event_type, job_id, **fields):
+    """Construit un événement de progression sérialisable en JSON."""
+    event = {'type': event_type, 'job_id': job_id, 'timestamp': time.time()}
+    event.update(fields)
+    return event
+
+class ProviderOutputParser:
+    """Transforme la sortie texte d'un provider en événements track_progress / track_done."""
+
+    def __init__(self, job_id, staging_dir):
+        self.job_id = job_id
+        self.staging_dir = staging_dir
+        self.total = None
+        self.done = 0
+        self.bytes_written = 0
+        self.last_track_time = time.time()
+        self.seen_files = set()
+
+    def _new_files_size(self):
+        """Taille des fichiers apparus dans le dossier du job depuis le dernier morceau terminé."""
+        size = 0
+        try:
+            with os.scandir(self.staging_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.path not in self.seen_files:
+                        self.seen_files.add(entry.path)
+                        size += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        return size
+
+    def parse(self, line, timestamp=None):
+        """Retourne la liste des événements déduits d'une ligne (souvent vide)."""
+        timestamp = timestamp or time.time()
+        events = []
+        for pattern in TOTAL_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                self.total = int(match.group(1))
+                events.append(make_event('track_progress', self.job_id, index=self.done, total=self.total))
+                break
+        index_match = INDEX_PATTERN.search(line)
+        if index_match:
+            self.total = int(index_match.group(2))
+            events.append(make_event('track_progress', self.job_id, index=int(index_match.group(1)), total=self.total))
+        for pattern in DONE_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                self.done += 1
+                size = self._new_files_size()
+                self.bytes_written += size
+                events.append(make_event(
+                    'track_done', self.job_id,
+                    title=match.group('title').strip(),
+                    index=self.done,
+                    total=self.total,
+                    bytes=size,
+                    duration=round(timestamp - self.last_track_time, 3)
+                ))
+                self.last_track_time = timestamp
+                break
+        return events
+
+class EventPublisher:
+    """Publie les événements par lots depuis un thread dédié, sans jamais bloquer les workers.
+
+    emit() ne fait qu'ajouter à une file bornée (les plus anciens événements sont abandonnés si elle est pleine) ;
+    le thread publie au plus un lot toutes les flush_interval secondes via publish(corps_json).
+    """
+
+    def __init__(self, publish, flush_interval=1.0, max_batch=100, max_pending=1000):
+        self.publish = publish
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name='progress-events', daemon=True)
+        self.thread.start()
+
+    def emit(self, event):
+        with self.condition:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(event)
+            self.condition.notify()
+
+    def close(self):
+        """Publie les événements restants puis arrête le thread."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+    def _take_batch(self):
+        batch = []
+        while self.pending and len(batch) < self.max_batch:
+            batch.append(self.pending.popleft())
+        return batch
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped and not self.pending:
+                    return
+                batch = self._take_batch()
+                dropped, self.dropped = self.dropped, 0
+            body = {'events': batch}
+            if dropped:
+                body['dropped'] = dropped
+            try:
+                self.publish(json.dumps(body, ensure_ascii=False))
+            except Exception as e:
+                print(f"Erreur lors de la publication des événements : {e}")
+            # Limite le débit : au plus un lot par intervalle, les événements s'accumulent entre-temps
+            deadline = time.monotonic() + self.flush_interval
+            with self.condition:
+                while not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(timeout=remaining)
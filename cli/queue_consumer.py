@@ -1,101 +1,201 @@
-import subprocess
 import os
 import json
 import time
-import pika
+import signal
+import asyncio
+import threading
+import functools
+import shutil
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+import aio_pika
+from output_pump import run_with_pump, STDERR
+import status_log
+import tag_rename_move
+from job_store import JobStore, job_key
+from playlist_fanout import make_resolver, expand_url, spotify_url_type
+from audio_index import get_audio_index
+from retry_queues import declare_retry_queues, plan_retry, message_attempt
+from progress_events import ProviderOutputParser, EventPublisher, make_event
+from app_config import get_config
+from metrics import REGISTRY, start_http_server, PromFileWriter, FAST_DURATION_BUCKETS, BYTES_BUCKETS, COUNT_BUCKETS
 
 # Chemin du virtual environment et chemins relatifs des fichiers d’historique
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 VENV_PATH = os.path.normpath(os.path.join(SCRIPT_DIR, '..', '..', 'spotdl-venv/venv/bin/activate'))
-STATUS_HISTORY_FILE = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'log', 'status_history.txt'))
-COMMAND_HISTORY_FILE = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'log', 'command_history.txt'))
+STATUS_HISTORY_FILE = status_log.STATUS_HISTORY_FILE
+COMMAND_HISTORY_FILE = status_log.COMMAND_HISTORY_FILE
 
-# Chemin du fichier de configuration RabbitMQ
-CONFIG_PATH = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'etc', 'config.json'))
-QUEUE_NAME = "spotdl_queue"
+QUEUE_NAME = "spotdl_queue"             # Jobs interactifs (morceaux isolés)
+BULK_QUEUE_NAME = "spotdl_bulk_queue"    # Playlists, albums, artistes et synchronisations
+STATUS_QUEUE_NAME = "spotdl_status_queue"
 
-def load_rabbitmq_config():
-    """Charge les identifiants RabbitMQ depuis config.json."""
-    try:
-        with open(CONFIG_PATH, 'r') as f:
-            config = json.load(f)
-        rabbitmq_config = config.get('rabbitmq', {})
-        return {
-            'host': rabbitmq_config.get('host', 'localhost'),
-            'port': rabbitmq_config.get('port', 5672),
-            'username': rabbitmq_config.get('username', 'gautard'),
-            'password': rabbitmq_config.get('password', 'gautard'),
-            'virtual_host': rabbitmq_config.get('virtual_host', '/')
-        }
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Le fichier de configuration {CONFIG_PATH} est introuvable")
-    except json.JSONDecodeError:
-        raise ValueError(f"Le fichier {CONFIG_PATH} n'est pas un JSON valide")
-    except Exception as e:
-        raise Exception(f"Erreur lors du chargement de {CONFIG_PATH} : {str(e)}")
+JOB_CLASS_INTERACTIVE = 'interactive'
+JOB_CLASS_BULK = 'bulk'
+JOB_QUEUES = {JOB_CLASS_INTERACTIVE: QUEUE_NAME, JOB_CLASS_BULK: BULK_QUEUE_NAME}
 
-def load_download_config():
-    """Charge les paramètres de téléchargement depuis config.json."""
-    try:
-        with open(CONFIG_PATH, 'r') as f:
-            config = json.load(f)
-        download_config = config.get('playlist_download', {})
-        spotify_config = config.get('spotify', {})
-        paths_config = config.get('paths', {})
-        return {
-            'provider': download_config.get('provider', 'spotdl'),  # Par défaut "spotdl"
-            'download_lyrics': download_config.get('download-lyrics', True),
-            'download_format': download_config.get('download-format', 'mp3'),
-            'download_quality': download_config.get('download-quality', 'very_high'),
-            'credentials_location': download_config.get('credentials-location', ''),
-            'song_archive': download_config.get('song-archive', '/archive.txt'),
-            'skip_previously_downloaded': download_config.get('skip-previously-downloaded', True),
-            'print_download_progress':download_config.get('print-download-progress', True),
-            'print_progress_info':download_config.get('print-progress-info', True),
-            'print_downloads':download_config.get('print-downloads', True),
-            'retry_attempts': download_config.get('retry-attempts', 3),
-            'download_real_time': download_config.get('download-real-time', True),
-            'root_path': paths_config.get('downloads', ''),  # Chemin de sortie
-            'client_id': spotify_config.get('client_id'),
-            'client_secret': spotify_config.get('client_secret'),
-            'output': download_config.get('output', 3),
-            'song_archive': download_config.get('song-archive', ''),
-            'username': spotify_config.get('username'),
-            'password': spotify_config.get('password')
-        }
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Le fichier de configuration {CONFIG_PATH} est introuvable")
-    except json.JSONDecodeError:
-        raise ValueError(f"Le fichier {CONFIG_PATH} n'est pas un JSON valide")
-    except Exception as e:
-        raise Exception(f"Erreur lors du chargement de {CONFIG_PATH} : {str(e)}")
+# Délais de reconnexion à RabbitMQ (secondes), doublés à chaque échec
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
 
-def ensure_directory(path):
-    """Assure que le répertoire existe avec les permissions correctes."""
-    directory = os.path.dirname(path)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    #os.chown(directory, 1000, 33)  # UID de gautard (1000), GID de www-data (33)
-    #os.chmod(directory, 0o775)
+# Métriques exposées au format Prometheus (section "metrics" de config.json)
+QUEUE_WAIT = REGISTRY.histogram('spotdl_queue_wait_seconds', "Attente entre la mise en file d'un message et le début de son job (première tentative)", ('job_class',))
+DOWNLOAD_DURATION = REGISTRY.histogram('spotdl_download_duration_seconds', "Durée du téléchargement par le provider", ('provider',))
+TAGGING_DURATION = REGISTRY.histogram('spotdl_tagging_duration_seconds', "Durée du tagging et du déplacement des fichiers d'un job", ('provider',), FAST_DURATION_BUCKETS)
+JOB_BYTES = REGISTRY.histogram('spotdl_job_bytes', "Octets téléchargés par job", ('provider',), BYTES_BUCKETS)
+JOB_TRACKS = REGISTRY.histogram('spotdl_job_tracks', "Fichiers traités par job", ('provider',), COUNT_BUCKETS)
+BYTES_WRITTEN = REGISTRY.counter('spotdl_bytes_written_total', "Octets téléchargés", ('provider',))
+JOBS_TOTAL = REGISTRY.counter('spotdl_jobs_total', "Jobs terminés par provider et résultat", ('provider', 'result'))
+RETRIES_TOTAL = REGISTRY.counter('spotdl_job_retries_total', "Messages en échec réessayés ou envoyés dans la file morte", ('job_class', 'outcome'))
+JOBS_IN_FLIGHT = REGISTRY.gauge('spotdl_jobs_in_flight', "Jobs en cours d'exécution", ('job_class',))
+JOBS_PENDING = REGISTRY.gauge('spotdl_jobs_pending', "Messages reçus en attente d'un worker", ('job_class',))
 
 def log_command(command, url):
-    """Journalise la commande exécutée dans command_history.txt."""
-    ensure_directory(COMMAND_HISTORY_FILE)
-    with open(COMMAND_HISTORY_FILE, 'a') as f:
-        f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] URL: {url} - Commande: {command}\n")
-    #os.chown(COMMAND_HISTORY_FILE, 1000, 33)  # UID de gautard (1000), GID de www-data (33)
-    #os.chmod(COMMAND_HISTORY_FILE, 0o664)
-
-def log_status(url, message):
-    """Journalise les statuts dans status_history.txt."""
-    ensure_directory(STATUS_HISTORY_FILE)
-    with open(STATUS_HISTORY_FILE, 'a') as f:
-        f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {url} - {message}\n")
-    #os.chown(STATUS_HISTORY_FILE, 1000, 33)  # UID de gautard (1000), GID de www-data (33)
-    #os.chmod(STATUS_HISTORY_FILE, 0o664)
-
-def callback(ch, method, properties, body):
+    """Journalise la commande exécutée dans command_history.txt (écriture groupée en arrière-plan)."""
+    status_log.write_line(COMMAND_HISTORY_FILE, f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] URL: {url} - Commande: {command}")
+
+def log_status(url, message, timestamp=None):
+    """Journalise les statuts dans status_history.txt (horodatage courant ou celui de la ligne lue)."""
+    status_log.write_line(STATUS_HISTORY_FILE, f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}] {url} - {message}")
+
+class StagingFiles:
+    """Fichiers d'un dossier de staging déjà tagués par le mode watch pendant le téléchargement du job."""
+
+    def __init__(self):
+        self.results = []   # TagResult des fichiers traités par le mode watch
+        self.bytes = 0      # Taille de ces fichiers avant traitement
+        self.in_flight = 0  # Fichiers en cours de traitement par le mode watch
+        self.closing = False
+
+class StagingDirs:
+    """Dossiers de staging des jobs en cours, partagés entre les jobs et le mode watch du consommateur.
+
+    Le mode watch tague les MP3 stables d'un job pendant que le provider télécharge les suivants (claim/release,
+    appelés par tag_rename_move.start_watch). En fin de job, finish() ferme le dossier au mode watch, attend ses
+    fichiers en cours et retourne ce qu'il a déjà classé : le job l'ajoute à sa mesure (octets, morceaux) et ne
+    tague ou ne supprime lui-même que les fichiers restants.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.dirs = {}  # {dossier: StagingFiles}
+
+    def register(self, path):
+        with self.condition:
+            self.dirs[os.path.abspath(path)] = StagingFiles()
+
+    def unregister(self, path):
+        with self.condition:
+            self.dirs.pop(os.path.abspath(path), None)
+
+    def is_job_subdir(self, path):
+        """Sous-dossier d'un dossier de job : jamais tagué par le job, donc ignoré par le mode watch."""
+        with self.condition:
+            return os.path.dirname(os.path.abspath(path)) in self.dirs
+
+    def claim(self, file_paths):
+        """Fichiers que le mode watch peut traiter maintenant : hors dossier de job, ou dans un job pas encore terminé."""
+        claimed = []
+        with self.condition:
+            for path in file_paths:
+                staging = self.dirs.get(os.path.dirname(os.path.abspath(path)))
+                if staging is not None:
+                    if staging.closing:
+                        continue  # Le job tague lui-même ses fichiers restants
+                    try:
+                        staging.bytes += os.path.getsize(path)
+                    except OSError:
+                        continue
+                    staging.in_flight += 1
+                claimed.append(path)
+        return claimed
+
+    def release(self, file_paths, results):
+        """Rattache à leur job les résultats du mode watch pour les fichiers réservés par claim."""
+        by_source = {result.source: result for result in results}
+        with self.condition:
+            for path in file_paths:
+                staging = self.dirs.get(os.path.dirname(os.path.abspath(path)))
+                if staging is None:
+                    continue
+                staging.in_flight -= 1
+                result = by_source.get(path)
+                if result is not None and result.status != tag_rename_move.STATUS_SKIPPED:
+                    staging.results.append(result)
+            self.condition.notify_all()
+
+    def finish(self, path):
+        """Ferme le dossier au mode watch et attend ses fichiers en cours ; retourne son StagingFiles."""
+        with self.condition:
+            staging = self.dirs.get(os.path.abspath(path))
+            if staging is None:
+                return StagingFiles()
+            staging.closing = True
+            while staging.in_flight:
+                self.condition.wait()
+            return staging
+
+staging_dirs = StagingDirs()
+
+def create_staging_dir(downloads_dir, job_id):
+    """Crée le sous-dossier de téléchargement propre à un job (downloads/job-<id>/)."""
+    staging_dir = os.path.join(downloads_dir, f"job-{job_id}")
+    staging_dirs.register(staging_dir)  # Avant la création : le mode watch ne le voit jamais sans son job
+    os.makedirs(staging_dir, exist_ok=True)
+    return staging_dir
+
+def directory_size(path):
+    """Taille totale des fichiers d'un dossier et de ses sous-dossiers."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+def remove_staging_dir(staging_dir):
+    """Supprime le dossier d'un job et uniquement celui-ci (fichiers restants inclus), après les fichiers en cours du mode watch."""
+    staging_dirs.finish(staging_dir)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    staging_dirs.unregister(staging_dir)
+
+def load_message(body):
+    """Décode le JSON d'un message, ou retourne None s'il est illisible."""
+    try:
+        data = json.loads(body.decode())
+    except (ValueError, AttributeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+def parse_job_key(body):
+    """Retourne (clé d'idempotence, url, sync) d'un message, ou (None, None, False) s'il est illisible."""
+    data = load_message(body)
+    if not data or not data.get("url"):
+        return None, None, False
+    sync = bool(data.get("sync", False))
+    return job_key(data["url"], sync), data["url"], sync
+
+def process_message(body, provider_slot, events=None, job_id=None, cancel_event=None):
+    """Télécharge l'URL d'un message puis tague et déplace les fichiers produits ; retourne True si le message doit être acquitté.
+
+    Si events (EventPublisher) est fourni, la progression est publiée sous forme d'événements structurés.
+    Le téléchargement est interrompu si cancel_event est levé (arrêt du consommateur).
+    """
     start_time = time.time()
+    url = None
+    staging_dir = None
+    job_id = job_id or uuid.uuid4().hex[:12]
+    parser = None
+    provider = 'unknown'
+    success = False
+
+    def emit(event_type, **fields):
+        if events is not None:
+            events.emit(make_event(event_type, job_id, **fields))
+
     try:
         data = json.loads(body.decode())
         url = data.get("url")
@@ -103,142 +203,622 @@ def callback(ch, method, properties, body):
         client_id = data.get("client_id", None)
         client_secret = data.get("client_secret", None)
 
-        # Charger la configuration de téléchargement
-        download_config = load_download_config()
+        # Configuration mise en cache : relue uniquement si config.json a été modifié
+        config = get_config()
+        download_config = config.download
+        downloads_dir = config.paths.downloads
         if not client_id or not client_secret:
-            client_id = download_config['client_id']
-            client_secret = download_config['client_secret']
+            client_id = config.spotify.client_id
+            client_secret = config.spotify.client_secret
         if not client_id or not client_secret:
             raise ValueError("Identifiants Spotify invalides dans le fichier de configuration")
 
-        print(f"Processing URL: {url} with provider: {download_config['provider']}")
+        provider = download_config.provider.lower()
+        # Morceau déjà dans la bibliothèque (index audio) : inutile de le redemander au provider
+        is_track = spotify_url_type(url)[0] == 'track'
+        if is_track and not sync and config.dedup.library_check:
+            existing_path = get_audio_index().track_path(url)
+            if existing_path:
+                print(f"Track {url} already in library: {existing_path} (job {job_id})")
+                log_status(url, f"Morceau déjà présent dans la bibliothèque ({existing_path}), téléchargement ignoré")
+                success = True
+                return True
+
+        print(f"Processing URL: {url} with provider: {download_config.provider} (job {job_id})")
         log_status(url, "Début du téléchargement...")
-        ensure_directory(STATUS_HISTORY_FILE)
+
+        # Chaque job télécharge dans son propre dossier : les jobs concurrents ne voient jamais les fichiers des autres
+        staging_dir = create_staging_dir(downloads_dir, job_id)
+        parser = ProviderOutputParser(job_id, staging_dir)
+        emit('job_started', url=url, provider=provider, sync=sync)
 
         # Construire la commande en fonction du provider
         escaped_client_id = client_id.replace("{", "{{").replace("}", "}}")
         escaped_client_secret = client_secret.replace("{", "{{").replace("}", "}}")
         cmd = ""
 
-        if download_config['provider'].lower() == 'spotdl':
-            cmd = f"source {VENV_PATH} && spotdl '{url}' {'--sync' if sync else ''} --client-id '{escaped_client_id}' --client-secret '{escaped_client_secret}' --output {download_config['root_path']} --config 2>&1"
+        if provider == 'spotdl':
+            cmd = f"source {VENV_PATH} && spotdl '{url}' {'--sync' if sync else ''} --client-id '{escaped_client_id}' --client-secret '{escaped_client_secret}' --output {staging_dir} --config 2>&1"
             
-        elif download_config['provider'].lower() == 'zotify':
+        elif provider == 'zotify':
             # Ajouter les arguments spécifiques à Zotify (exemple basé sur la doc de zotify)
             cmd = (
                 f"source {VENV_PATH} && zotify '{url}' "
-                f"--output '{download_config['output']}' "
-                f"--download-format '{download_config['download_format']}' "
-                f"--root-path '{download_config['root_path']}' "
-                f"--credentials-location '{download_config['credentials_location']}' "
-                f"--song-archive '{download_config['song_archive']}' "
-                f"--download-quality '{download_config['download_quality']}' "
-                f"--skip-previously-downloaded '{download_config['skip_previously_downloaded']}' "
-                f"--download-lyrics '{download_config['download_lyrics']}' "
-                f"--print-download-progress '{download_config['print_download_progress']}' "
-                f"--print-downloads '{download_config['print_downloads']}' "
-                f"--print-progress-info '{download_config['print_progress_info']}' "
-                f"--retry-attempts {download_config['retry_attempts']} 2>&1"
+                f"--output '{download_config.output}' "
+                f"--download-format '{download_config.download_format}' "
+                f"--root-path '{staging_dir}' "
+                f"--credentials-location '{download_config.credentials_location}' "
+                f"--song-archive '{download_config.song_archive}' "
+                f"--download-quality '{download_config.download_quality}' "
+                f"--skip-previously-downloaded '{download_config.skip_previously_downloaded}' "
+                f"--download-lyrics '{download_config.download_lyrics}' "
+                f"--print-download-progress '{download_config.print_download_progress}' "
+                f"--print-downloads '{download_config.print_downloads}' "
+                f"--print-progress-info '{download_config.print_progress_info}' "
+                f"--retry-attempts {download_config.retry_attempts} 2>&1"
             )
         else:
-            raise ValueError(f"Provider '{download_config['provider']}' non pris en charge")
+            raise ValueError(f"Provider '{download_config.provider}' non pris en charge")
 
-        log_command(cmd, url)
-        process = subprocess.Popen(['/bin/bash', '-c', cmd], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+        # Limiter le nombre de téléchargements simultanés par provider (quotas spotdl/zotify)
+        with provider_slot(provider):
+            log_command(cmd, url)
 
-        while True:
-            output_line = process.stdout.readline()
-            if output_line:
-                log_status(url, output_line.strip())
-            error_line = process.stderr.readline()
-            if error_line:
-                log_status(url, f"ERREUR: {error_line.strip()}")
-            if process.poll() is not None:
-                break
+            def on_line(timestamp, stream, line):
+                if not line.strip():
+                    return
+                if events is not None:
+                    for event in parser.parse(line, timestamp):
+                        events.emit(event)
+                if stream == STDERR:
+                    log_status(url, f"ERREUR: {line.strip()}", timestamp)
+                else:
+                    log_status(url, line.strip(), timestamp)
 
-        return_code = process.returncode
-        output, error = process.communicate()
+            # stdout et stderr sont vidés en parallèle : un flux silencieux ne bloque plus l'autre
+            result = run_with_pump(cmd, on_line=on_line, timeout=download_config.job_timeout or None, cancel_event=cancel_event)
+            DOWNLOAD_DURATION.observe(result.duration, provider=provider)
+            return_code = result.return_code
+            output = "\n".join(result.stdout_tail[-5:])
+            error = "\n".join(result.stderr_tail[-5:]) or output
+            if result.timed_out:
+                error = f"Délai de {download_config.job_timeout} secondes dépassé, processus interrompu"
+            elif result.cancelled:
+                error = "Arrêt du consommateur, processus interrompu"
         end_time = time.time()
         processing_time = end_time - start_time
 
         if return_code == 0:
             print(f"Download completed for {url} in {processing_time:.2f} seconds: {output}")
             log_status(url, f"Téléchargement terminé avec succès en {processing_time:.2f} secondes")
-            # Lancer tag_rename_move.py après un téléchargement réussi (inchangé)
-            tag_rename_path = os.path.join(SCRIPT_DIR, 'tag_rename_move.py')
-            if not os.path.exists(tag_rename_path):
-                print(f"Error: {tag_rename_path} not found")
-                log_status(url, f"Erreur : {tag_rename_path} n'existe pas")
-                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
-                return
-
-            process_cmd = f"source {VENV_PATH} && python3 {tag_rename_path}"
-            process_result = subprocess.run(['/bin/bash', '-c', process_cmd], capture_output=True, text=True)
-            if process_result.returncode == 0:
-                print(f"Processing completed for {url}")
-                log_status(url, "Fichiers traités et déplacés avec succès")
-            else:
-                error_msg = process_result.stderr or "Erreur inconnue"
-                print(f"Error processing files for {url}: {error_msg}")
-                log_status(url, f"Erreur lors du traitement des fichiers : {error_msg}")
-                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
-                return
+            # Fichiers déjà classés par le mode watch pendant le téléchargement : comptés avec ceux qui restent
+            watched = staging_dirs.finish(staging_dir)
+            downloaded_bytes = directory_size(staging_dir) + watched.bytes
+            JOB_BYTES.observe(downloaded_bytes, provider=provider)
+            BYTES_WRITTEN.inc(downloaded_bytes, provider=provider)
+            # Tagging en processus (pas de bash/venv/interpréteur à relancer), limité au dossier de ce job
+            with TAGGING_DURATION.time(provider=provider):
+                tag_results = watched.results + tag_rename_move.tag_directory(staging_dir, config)
+            JOB_TRACKS.observe(len(tag_results), provider=provider)
+            tag_errors = [tag_result for tag_result in tag_results if tag_result.status == tag_rename_move.STATUS_ERROR]
+            for tag_error in tag_errors:
+                log_status(url, f"Erreur lors du traitement de {tag_error.source} : {tag_error.message}")
+            if tag_results and len(tag_errors) == len(tag_results):
+                print(f"Error processing files for {url}: {tag_errors[0].message}")
+                log_status(url, f"Erreur lors du traitement des fichiers : aucun des {len(tag_results)} fichiers n'a pu être traité")
+                return False
+            moved = [tag_result for tag_result in tag_results if tag_result.status == tag_rename_move.STATUS_MOVED]
+            if is_track and len(moved) == 1:
+                get_audio_index().record_track(url, moved[0].destination)
+            print(f"Processing completed for {url}")
+            log_status(url, f"Fichiers traités et déplacés avec succès ({len(tag_results) - len(tag_errors)}/{len(tag_results)})")
 
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            success = True
+            return True
         else:
             print(f"Error downloading {url} in {processing_time:.2f} seconds: {error}")
             log_status(url, f"Échec du téléchargement en {processing_time:.2f} secondes : {error.strip()}")
-            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return False
     except Exception as e:
         end_time = time.time()
         processing_time = end_time - start_time
         print(f"Error processing message for {url} in {processing_time:.2f} seconds: {e}")
         log_status(url, f"Erreur de traitement en {processing_time:.2f} secondes : {str(e)}")
-        ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+        return False
+    finally:
+        JOBS_TOTAL.inc(provider=provider, result='success' if success else 'failure')
+        if staging_dir:
+            if not success:
+                watched = staging_dirs.finish(staging_dir)
+                filed = sum(1 for result in watched.results if result.status == tag_rename_move.STATUS_MOVED)
+                if filed:
+                    log_status(url, f"{filed} fichier(s) déjà classé(s) par le mode watch avant l'échec")
+            remove_staging_dir(staging_dir)
+        emit(
+            'job_finished',
+            url=url,
+            success=success,
+            duration=round(time.time() - start_time, 3),
+            tracks=parser.done if parser else 0,
+            bytes=parser.bytes_written if parser else 0
+        )
 
-def main():
-    # Charger les identifiants RabbitMQ depuis config.json
-    rabbitmq_config = load_rabbitmq_config()
+def observe_queue_wait(message, data, job_class):
+    """Mesure l'attente en file d'un message (champ enqueued_at ou horodatage AMQP).
+
+    Les retentatives sont ignorées : leur attente inclut volontairement le délai de backoff.
+    """
+    if message_attempt(message):
+        return
+    enqueued_at = data.get("enqueued_at") if data else None
+    if enqueued_at is None and getattr(message, 'timestamp', None) is not None:
+        enqueued_at = message.timestamp.timestamp()
+    try:
+        QUEUE_WAIT.observe(max(0.0, time.time() - float(enqueued_at)), job_class=job_class)
+    except (TypeError, ValueError):
+        pass
+
+class AmqpBroker:
+    """Acquittements et publications thread-safe vers un canal aio-pika.
+
+    Les opérations sont transmises à la boucle asyncio et exécutées dans l'ordre d'appel par une seule tâche :
+    la republication d'un message en échec part toujours avant l'acquittement de l'original.
+    """
 
-    # Connexion à RabbitMQ pour les URLs, avec un délai pour attendre RabbitMQ et un heartbeat personnalisé
-    max_attempts = 5
-    delay = 10  # Augmente le délai à 10 secondes pour éviter des connexions trop rapides
-    for attempt in range(max_attempts):
+    def __init__(self, loop, channel):
+        self.loop = loop
+        self.channel = channel
+        self.operations = asyncio.Queue()
+        self.task = loop.create_task(self._run())
+
+    def submit(self, operation):
+        """Planifie operation (fonction coroutine sans argument) depuis n'importe quel thread."""
+        self.loop.call_soon_threadsafe(self.operations.put_nowait, operation)
+
+    def ack(self, message):
+        self.submit(message.ack)
+
+    def publish(self, queue, body, headers=None, content_type='application/json', expiration=None, persistent=True):
+        message = aio_pika.Message(
+            body.encode() if isinstance(body, str) else body,
+            headers=headers,
+            content_type=content_type,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT if persistent else aio_pika.DeliveryMode.NOT_PERSISTENT,
+            expiration=expiration
+        )
+        self.submit(functools.partial(self.channel.default_exchange.publish, message, routing_key=queue))
+
+    async def _run(self):
+        while True:
+            operation = await self.operations.get()
+            if operation is None:
+                return
+            try:
+                await operation()
+            except Exception as e:
+                # Canal fermé : les messages non acquittés seront redistribués par RabbitMQ (doublons filtrés par le JobStore)
+                print(f"AMQP operation failed: {e}")
+
+    async def close(self):
+        """Exécute les opérations déjà planifiées puis arrête la tâche."""
+        self.submit(None)  # Même chemin que les opérations : la fin passe après celles déjà planifiées
+        await self.task
+
+class WorkerPool:
+    """Exécute chaque message dans un thread du pool ; acquittements et publications passent par l'AmqpBroker courant.
+
+    Les messages reçus sont mis en attente par classe (interactive / bulk) ; un worker libre prend le suivant selon
+    un round-robin pondéré, et les jobs bulk n'occupent jamais plus de bulk_share des workers.
+    """
+
+    def __init__(self, workers, provider_concurrency, job_store, retry_config, status_ttl=600, dedup=True, dedup_window=0,
+                 bulk_share=0.5, weights=None):
+        self.broker = None
+        self.status_ttl = status_ttl
+        self.events = None
+        self.job_store = job_store
+        self.retry_config = retry_config  # Figée au démarrage : les files temporisées sont déclarées d'après elle
+        self.dedup = dedup
+        self.dedup_window = dedup_window
+        self.inflight = {}  # {clé du job: [messages doublons rattachés]}
+        self.resolvers = {}
+        self.workers = workers
+        self.provider_concurrency = provider_concurrency
+        self.provider_semaphores = {}
+        self.weights = weights or {JOB_CLASS_INTERACTIVE: 3, JOB_CLASS_BULK: 1}
+        self.limits = {
+            JOB_CLASS_INTERACTIVE: workers,
+            # Au moins un worker pour le bulk, et au moins un laissé libre pour l'interactif quand c'est possible
+            JOB_CLASS_BULK: max(1, min(workers - 1, round(workers * bulk_share))) if workers > 1 else 1
+        }
+        self.pending = {job_class: deque() for job_class in JOB_QUEUES}
+        self.running = {job_class: 0 for job_class in JOB_QUEUES}
+        self.credits = {job_class: 0 for job_class in JOB_QUEUES}
+        self.futures = set()
+        self.stopping = False
+        self.cancelled = threading.Event()  # Levé à l'arrêt si les jobs en cours doivent être interrompus
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download-worker')
+
+    def provider_slot(self, provider):
+        """Retourne le sémaphore limitant les jobs simultanés d'un provider (par défaut : nombre de workers)."""
+        with self.lock:
+            semaphore = self.provider_semaphores.get(provider)
+            if semaphore is None:
+                limit = min(self.provider_concurrency.get(provider, self.workers), self.workers)
+                semaphore = threading.BoundedSemaphore(limit)
+                self.provider_semaphores[provider] = semaphore
+            return semaphore
+
+    def attach(self, broker):
+        """Branche le pool sur le canal d'une nouvelle connexion."""
+        self.broker = broker
+
+    def detach(self):
+        """Connexion perdue : les messages en attente seront redistribués par RabbitMQ, on les oublie."""
+        with self.lock:
+            for job_class, pending in self.pending.items():
+                for message, key, url, sync in pending:
+                    if key is not None:
+                        self.inflight.pop(key, None)
+                pending.clear()
+                JOBS_PENDING.set(0, job_class=job_class)
+
+    def ack(self, message):
+        self.broker.ack(message)
+
+    def publish_status(self, body):
+        """Publie un lot d'événements dans spotdl_status_queue depuis n'importe quel thread."""
+        if self.broker is not None:
+            self.broker.publish(STATUS_QUEUE_NAME, body, expiration=self.status_ttl, persistent=False)
+
+    def on_message(self, job_class, message):
+        """Callback du consommateur : met le message en attente dans sa classe sans bloquer la boucle asyncio.
+
+        Un doublon d'un job déjà en cours (même URL normalisée et même option sync) n'est pas relancé :
+        il est rattaché au job en cours et acquitté avec le même résultat.
+        """
+        key, url, sync = parse_job_key(message.body) if self.dedup else (None, None, False)
+        with self.lock:
+            if key is not None:
+                attached = self.inflight.get(key)
+                if attached is not None:
+                    attached.append(message)
+                    log_status(url, "Doublon d'un téléchargement en cours, rattaché au job existant")
+                    return
+                self.inflight[key] = []
+            self.pending[job_class].append((message, key, url, sync))
+            JOBS_PENDING.set(len(self.pending[job_class]), job_class=job_class)
+        self.dispatch()
+
+    def next_job_class(self):
+        """Choisit la classe du prochain job (round-robin pondéré lissé), ou None si aucune n'est éligible.
+
+        Appelé avec self.lock acquis.
+        """
+        eligible = [
+            job_class for job_class in JOB_QUEUES
+            if self.pending[job_class] and self.running[job_class] < self.limits[job_class]
+        ]
+        if not eligible:
+            return None
+        total_weight = sum(self.weights[job_class] for job_class in eligible)
+        for job_class in eligible:
+            self.credits[job_class] += self.weights[job_class]
+        chosen = max(eligible, key=lambda job_class: self.credits[job_class])
+        self.credits[chosen] -= total_weight
+        return chosen
+
+    def dispatch(self):
+        """Confie des jobs en attente aux workers libres."""
+        with self.lock:
+            while not self.stopping and sum(self.running.values()) < self.workers:
+                job_class = self.next_job_class()
+                if job_class is None:
+                    break
+                job = self.pending[job_class].popleft()
+                self.running[job_class] += 1
+                JOBS_PENDING.set(len(self.pending[job_class]), job_class=job_class)
+                JOBS_IN_FLIGHT.set(self.running[job_class], job_class=job_class)
+                future = self.executor.submit(self.run_slot, job_class, *job)
+                self.futures.add(future)
+                future.add_done_callback(self.futures.discard)
+
+    def run_slot(self, job_class, *job):
+        try:
+            self.run_job(*job, job_class=job_class)
+        finally:
+            with self.lock:
+                self.running[job_class] -= 1
+                JOBS_IN_FLIGHT.set(self.running[job_class], job_class=job_class)
+            self.dispatch()
+
+    def run_job(self, message, key=None, url=None, sync=False, job_class=JOB_CLASS_INTERACTIVE):
+        job_id = uuid.uuid4().hex[:12]
+        body = message.body
+        data = load_message(body)
+        url = url or (data or {}).get("url")
+        observe_queue_wait(message, data, job_class)
+        try:
+            previous = self.job_store.recent_success(key, self.dedup_window) if key is not None else None
+            if previous:
+                previous_job_id, finished_at = previous
+                finished = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(finished_at))
+                print(f"Skipping {url}: already downloaded by job {previous_job_id} at {finished}")
+                log_status(url, f"Déjà téléchargé avec succès le {finished} (job {previous_job_id}), message ignoré")
+                success = True
+            else:
+                if key is not None:
+                    self.job_store.record_start(job_id, key, url, sync)
+                tracks = self.expand(data)
+                if tracks:
+                    # Playlist/album éclaté : le message parent est acquitté, chaque morceau devient un job. Le résultat
+                    # du parent n'est enregistré qu'à la fin de son dernier morceau (record_child) : tant qu'il n'a
+                    # pas réussi, il ne masque pas une nouvelle demande de la même playlist
+                    self.publish_tracks(job_id, data, tracks)
+                    success = True
+                else:
+                    success = process_message(body, self.provider_slot, self.events, job_id, self.cancelled)
+                    if key is not None:
+                        self.job_store.record_outcome(job_id, success)
+        except Exception as e:
+            print(f"Unexpected worker error: {e}")
+            success = False
+        attached = []
+        if key is not None:
+            with self.lock:
+                attached = self.inflight.pop(key, [])
+        if not success and self.cancelled.is_set():
+            # Job interrompu par l'arrêt : ni acquitté ni réessayé, RabbitMQ le redistribuera au prochain démarrage
+            log_status(url, "Job interrompu par l'arrêt du consommateur, il sera relancé au redémarrage")
+            return
+        dead_lettered = False
+        if success:
+            self.ack(message)
+        else:
+            dead_lettered = self.retry_later(message, url, JOB_QUEUES[job_class])
+            RETRIES_TOTAL.inc(job_class=job_class, outcome='dead_letter' if dead_lettered else 'retry')
+        # Les doublons rattachés sont acquittés : la demande reste portée par le message principal (ou ses retentatives)
+        for duplicate in attached:
+            self.ack(duplicate)
+        if data and data.get("parent_id") and (success or dead_lettered):
+            self.record_child(data["parent_id"], success)
+
+    def retry_later(self, message, url, queue=QUEUE_NAME):
+        """Republie un message en échec dans sa file temporisée (backoff exponentiel) ou dans la file morte.
+
+        Retourne True si le message a épuisé ses tentatives et a été envoyé dans la file morte.
+        """
+        retry_config = self.retry_config
+        target_queue, headers, attempt, delay = plan_retry(queue, message, retry_config)
+        self.publish(target_queue, message.body, headers=headers, content_type=message.content_type or 'application/json')
+        # L'acquittement est exécuté après la publication (opérations ordonnées) : le message n'est jamais perdu
+        self.ack(message)
+        if delay is None:
+            print(f"Giving up on {url} after {attempt} attempts, moved to {target_queue}")
+            log_status(url, f"Abandon après {attempt} tentatives, message déplacé dans {target_queue}")
+            return True
+        print(f"Retrying {url} in {delay} seconds (attempt {attempt + 1}/{retry_config.max_attempts})")
+        log_status(url, f"Nouvelle tentative dans {delay} secondes ({attempt + 1}/{retry_config.max_attempts})")
+        return False
+
+    def resolver(self, fanout_config, client_id, client_secret):
+        """Retourne le résolveur de playlists (un par jeu d'identifiants Spotify, créé à la demande)."""
+        cache_key = (fanout_config.resolver, fanout_config.stub_file, client_id, client_secret)
+        with self.lock:
+            resolver = self.resolvers.get(cache_key)
+            if resolver is None:
+                resolver = make_resolver(fanout_config, client_id, client_secret)
+                self.resolvers[cache_key] = resolver
+            return resolver
+
+    def expand(self, data):
+        """Retourne les URLs des morceaux d'une playlist/album si l'éclatement est activé, sinon None."""
+        config = get_config()
+        if not config.fanout.enabled or not data or not data.get("url") or data.get("parent_id"):
+            return None
+        url = data["url"]
+        client_id = data.get("client_id") or config.spotify.client_id
+        client_secret = data.get("client_secret") or config.spotify.client_secret
         try:
-            credentials = pika.PlainCredentials(rabbitmq_config['username'], rabbitmq_config['password'])
-            parameters = pika.ConnectionParameters(
-                host=rabbitmq_config['host'],
-                port=rabbitmq_config['port'],
-                credentials=credentials,
-                virtual_host=rabbitmq_config['virtual_host'],
-                heartbeat=36000
+            resolver = self.resolver(config.fanout, client_id, client_secret)
+            return expand_url(resolver, url, data.get("sync", False), config.fanout.min_tracks)
+        except Exception as e:
+            log_status(url, f"Éclatement de la playlist impossible, traitement en un seul job : {str(e)}")
+            return None
+
+    def publish_tracks(self, parent_id, data, tracks):
+        """Publie un message par morceau dans la file bulk, rattaché au job parent."""
+        url = data["url"]
+        self.job_store.create_parent(parent_id, url, len(tracks))
+        for track in tracks:
+            message = dict(data, url=track, sync=False, parent_id=parent_id, job_class=JOB_CLASS_BULK, enqueued_at=time.time())
+            self.publish(BULK_QUEUE_NAME, json.dumps(message))
+        print(f"Expanded {url} into {len(tracks)} track jobs (job {parent_id})")
+        log_status(url, f"Playlist éclatée en {len(tracks)} morceaux (job {parent_id})")
+        if self.events is not None:
+            self.events.emit(make_event('job_expanded', parent_id, url=url, tracks=len(tracks)))
+
+    def record_child(self, parent_id, success):
+        """Comptabilise le résultat d'un morceau dans son job parent et signale la fin de la playlist."""
+        try:
+            outcome = self.job_store.record_child_outcome(parent_id, success)
+        except Exception as e:
+            print(f"Unable to record track outcome for job {parent_id}: {e}")
+            return
+        if outcome is None:
+            return
+        parent_url, total, succeeded, failed, finished = outcome
+        if self.events is not None:
+            self.events.emit(make_event('parent_progress', parent_id, url=parent_url, total=total, succeeded=succeeded, failed=failed))
+        if finished:
+            log_status(parent_url, f"Playlist terminée : {succeeded}/{total} morceaux téléchargés, {failed} en échec")
+            # Succès seulement si tous les morceaux ont réussi : sinon la playlist peut être redemandée aussitôt
+            # (les morceaux déjà réussis restent ignorés grâce à leur propre historique)
+            try:
+                self.job_store.record_outcome(parent_id, failed == 0, f"{succeeded}/{total} morceaux, {failed} en échec")
+            except Exception as e:
+                print(f"Unable to record outcome for job {parent_id}: {e}")
+
+    def publish(self, queue, body, headers=None, content_type='application/json'):
+        """Publie un message persistant dans une file depuis n'importe quel thread."""
+        self.broker.publish(queue, body, headers=headers, content_type=content_type)
+
+    def shutdown(self, timeout=None):
+        """Attend la fin des jobs en cours (au plus timeout secondes, puis les interrompt) et des derniers événements.
+
+        Les messages encore en attente ne sont pas acquittés : RabbitMQ les redistribuera.
+        """
+        with self.lock:
+            self.stopping = True
+        running = list(self.futures)
+        if running:
+            print(f"Waiting for {len(running)} running job(s) to finish")
+            _, not_done = wait(running, timeout=timeout)
+            if not_done:
+                print(f"Cancelling {len(not_done)} job(s) still running after {timeout} seconds")
+                self.cancelled.set()
+        self.executor.shutdown(wait=True)
+        if self.events is not None:
+            self.events.close()
+
+def create_pool(config, job_store):
+    """Construit le pool de workers (et son publieur d'événements) d'après config.json."""
+    consumer_config = config.consumer
+    pool = WorkerPool(
+        consumer_config.workers, consumer_config.provider_concurrency, job_store, config.retry,
+        status_ttl=config.events.ttl, dedup=config.dedup.enabled, dedup_window=config.dedup.window,
+        bulk_share=consumer_config.bulk_share,
+        weights={JOB_CLASS_INTERACTIVE: consumer_config.interactive_weight, JOB_CLASS_BULK: consumer_config.bulk_weight}
+    )
+    if config.events.enabled:
+        pool.events = EventPublisher(
+            pool.publish_status,
+            flush_interval=config.events.flush_interval,
+            max_batch=config.events.max_batch,
+            max_pending=config.events.max_pending
+        )
+    return pool
+
+async def connect(rabbitmq_config, stop):
+    """Se connecte à RabbitMQ en réessayant indéfiniment (backoff exponentiel) ; retourne None si l'arrêt est demandé."""
+    delay = RECONNECT_MIN_DELAY
+    while not stop.is_set():
+        try:
+            return await aio_pika.connect(
+                host=rabbitmq_config.host,
+                port=rabbitmq_config.port,
+                login=rabbitmq_config.username,
+                password=rabbitmq_config.password,
+                virtualhost=rabbitmq_config.virtual_host,
+                heartbeat=rabbitmq_config.heartbeat,
+                client_properties={'connection_name': 'spotdl-consumer'}
             )
-            connection = pika.BlockingConnection(parameters)
-            channel = connection.channel()
-            break
-        except pika.exceptions.AMQPConnectionError:
-            print(f"Tentative {attempt + 1}/{max_attempts} : Attente de RabbitMQ... (délai de {delay} secondes)")
-            time.sleep(delay)
-    else:
-        raise Exception("Impossible de se connecter à RabbitMQ après plusieurs tentatives")
-
-    # Déclarer la file d'attente
-    channel.queue_declare(queue=QUEUE_NAME, durable=True)
-
-    # Configurer le consommateur pour un traitement strictement séquentiel
-    channel.basic_qos(prefetch_count=1)  # Limiter à un message à la fois
-    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
-
-    print("Waiting for messages. To exit press CTRL+C")
+        except (OSError, aio_pika.exceptions.AMQPError) as e:
+            print(f"Attente de RabbitMQ ({e}), nouvelle tentative dans {delay} secondes")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+    return None
+
+async def serve(connection, pool, config, stop):
+    """Consomme les files sur une connexion jusqu'à l'arrêt (retourne True) ou la perte de la connexion (False)."""
+    loop = asyncio.get_running_loop()
+    channel = await connection.channel()
+    # Une file par classe de jobs, chacune pré-chargeant au plus un message par worker : les morceaux isolés
+    # arrivent dans le pool même quand la file bulk contient des milliers de messages
+    await channel.set_qos(prefetch_count=config.consumer.workers)
+
+    # Déclarer les files de jobs, la file des statuts lue par download_status.php et les files de retentative
+    await channel.declare_queue(STATUS_QUEUE_NAME, durable=True)
+    queues = {}
+    for job_class, queue_name in JOB_QUEUES.items():
+        queues[job_class] = await channel.declare_queue(queue_name, durable=True)
+        await declare_retry_queues(channel, queue_name, config.retry)
+
+    pool.attach(AmqpBroker(loop, channel))
+
+    def consumer(job_class):
+        async def on_message(message):
+            pool.on_message(job_class, message)
+        return on_message
+
+    consumer_tags = {job_class: await queue.consume(consumer(job_class)) for job_class, queue in queues.items()}
+    print(f"Waiting for messages with {pool.workers} worker(s), at most {pool.limits[JOB_CLASS_BULK]} for bulk jobs")
+
+    closed = asyncio.ensure_future(connection.closed())
+    stopped = asyncio.ensure_future(stop.wait())
+    await asyncio.wait({closed, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    if stop.is_set():
+        closed.cancel()
+        # Plus de nouveaux messages ; les jobs en cours pourront encore être acquittés sur ce canal
+        for job_class, queue in queues.items():
+            await queue.cancel(consumer_tags[job_class])
+        return True
+    stopped.cancel()
+    pool.detach()
+    await pool.broker.close()
+    return False
+
+async def run_consumer():
+    config = get_config()
+    consumer_config = config.consumer
+    loop = asyncio.get_running_loop()
+
+    # systemd arrête le service par SIGTERM : on termine les jobs en cours avant de sortir
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    pool = create_pool(config, JobStore())
+
+    metrics_server = None
+    metrics_writer = None
+    if config.metrics.enabled:
+        if config.metrics.port:
+            metrics_server = start_http_server(config.metrics.port, config.metrics.bind)
+            print(f"Metrics available on http://{config.metrics.bind}:{config.metrics.port}/metrics")
+        if config.metrics.prom_file:
+            metrics_writer = PromFileWriter(config.metrics.prom_file, config.metrics.write_interval)
+
+    # Mode watch : tague les morceaux des jobs dès qu'ils sont stables, pendant que le provider télécharge les suivants,
+    # ainsi que les fichiers déposés hors des jobs (à la main, ou laissés par un job interrompu)
+    watcher = None
+    if config.watch.enabled:
+        watcher = tag_rename_move.start_watch(config.paths.downloads, config, skip_dir=staging_dirs.is_job_subdir, tracker=staging_dirs)
+        print(f"Watching {config.paths.downloads} for downloaded files")
+
+    connection = None
     try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        print("Consumer stopped by user")
+        while not stop.is_set():
+            connection = await connect(config.rabbitmq, stop)
+            if connection is None:
+                break
+            if not await serve(connection, pool, config, stop):
+                print("Connexion à RabbitMQ perdue, reconnexion...")
     finally:
-        connection.close()
+        print("Consumer stopping")
+        # Les jobs tournent dans des threads : on les attend hors de la boucle, qui continue d'envoyer leurs acquittements
+        await loop.run_in_executor(None, pool.shutdown, consumer_config.shutdown_timeout)
+        if watcher is not None:
+            await loop.run_in_executor(None, watcher.stop)
+        if pool.broker is not None:
+            await pool.broker.close()
+        if connection is not None and not connection.is_closed:
+            await connection.close()
+        if metrics_writer is not None:
+            metrics_writer.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        status_log.close_all()
+
+def main():
+    asyncio.run(run_consumer())
 
 if __name__ == "__main__":
     try:
         main()
     except Exception as e:
-        print(f"Consumer error: {e}")
\ No newline at end of file
+        print(f"Consumer error: {e}")
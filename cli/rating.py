@@ -6,33 +6,26 @@ import xml.etree.ElementTree as ET
 import colorama
 from colorama import Fore, Style
 import argparse
+from app_config import get_config, ConfigError
 
 # Initialisation de colorama pour les couleurs en terminal
 colorama.init()
 
-# Chemin du script pour trouver le dossier etc sibling
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-CONFIG_PATH = os.path.join(SCRIPT_DIR, '..', 'etc', 'config.json')
-
-# Chargement des credentials depuis config.json
+# Chargement des credentials depuis config.json (module de configuration partagé)
 try:
-    with open(CONFIG_PATH, 'r') as config_file:
-        config = json.load(config_file)
-    NAVIDROME_USERNAME = config['navidrome']['username']
-    NAVIDROME_PASSWORD = config['navidrome']['password']
-except FileNotFoundError:
-    print(f"Erreur : Le fichier de configuration {CONFIG_PATH} n'a pas été trouvé.")
-    exit(1)
-except KeyError as e:
-    print(f"Erreur : Clé manquante dans config.json : {e}")
+    config = get_config()
+    NAVIDROME_USERNAME = config.navidrome.username
+    NAVIDROME_PASSWORD = config.navidrome.password
+except FileNotFoundError as e:
+    print(f"Erreur : {e}")
     exit(1)
-except json.JSONDecodeError as e:
+except ConfigError as e:
     print(f"Erreur : Le fichier config.json est invalide : {e}")
     exit(1)
 
 # Configuration
-ITUNES_LIBRARY_PATH = config['paths']['itunes_library_file']
-NAVIDROME_URL = config['navidrome']['url']  # URL de base pour les appels Subsonic
+ITUNES_LIBRARY_PATH = config.paths.itunes_library_file
+NAVIDROME_URL = config.navidrome.url  # URL de base pour les appels Subsonic
 
 def get_navidrome_session(debug=False):
     """Obtient les paramètres d'authentification pour Navidrome avec un mot de passe encodé en hexadécimal."""
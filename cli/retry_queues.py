@@ -0,0 +1,62 @@
+import time
+
+# En-têtes AMQP portés par les messages réessayés
+ATTEMPT_HEADER = 'x-attempt'
+ORIGINAL_QUEUE_HEADER = 'x-original-queue'
+FAILED_AT_HEADER = 'x-failed-at'
+
+def dead_letter_queue_name(queue):
+    """File des messages abandonnés après max-attempts échecs."""
+    return f"{queue}.dead"
+
+def delay_queue_name(queue, delay):
+    """File d'attente temporisée : les messages y expirent après delay secondes puis reviennent dans queue."""
+    return f"{queue}.retry.{delay}s"
+
+def retry_delay(attempt, base_delay, max_delay):
+    """Délai exponentiel avant la tentative suivante : base, 2×base, 4×base... plafonné à max_delay."""
+    return min(base_delay * (2 ** max(0, attempt - 1)), max_delay)
+
+def retry_delays(retry_config):
+    """Délais distincts utilisés pour les tentatives 1 à max-attempts - 1."""
+    return sorted({
+        retry_delay(attempt, retry_config.base_delay, retry_config.max_delay)
+        for attempt in range(1, retry_config.max_attempts)
+    })
+
+async def declare_retry_queues(channel, queue, retry_config):
+    """Déclare (canal aio-pika) la file morte et une file temporisée par palier de délai (TTL + dead-letter vers queue)."""
+    await channel.declare_queue(dead_letter_queue_name(queue), durable=True)
+    for delay in retry_delays(retry_config):
+        await channel.declare_queue(
+            delay_queue_name(queue, delay),
+            durable=True,
+            arguments={
+                'x-message-ttl': delay * 1000,
+                'x-dead-letter-exchange': '',
+                'x-dead-letter-routing-key': queue
+            }
+        )
+
+def message_attempt(properties):
+    """Nombre d'échecs déjà subis par un message (0 pour une première livraison) ; properties expose .headers."""
+    headers = getattr(properties, 'headers', None) or {}
+    try:
+        return int(headers.get(ATTEMPT_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+def plan_retry(queue, properties, retry_config):
+    """Retourne (file de destination, en-têtes, tentative, délai) pour un message en échec.
+
+    Le délai vaut None quand le message a épuisé ses tentatives et part dans la file morte.
+    """
+    attempt = message_attempt(properties) + 1
+    headers = dict(getattr(properties, 'headers', None) or {})
+    headers[ATTEMPT_HEADER] = attempt
+    headers[ORIGINAL_QUEUE_HEADER] = headers.get(ORIGINAL_QUEUE_HEADER, queue)
+    headers[FAILED_AT_HEADER] = int(time.time())
+    if attempt >= retry_config.max_attempts:
+        return dead_letter_queue_name(queue), headers, attempt, None
+    delay = retry_delay(attempt, retry_config.base_delay, retry_config.max_delay)
+    return delay_queue_name(queue, delay), headers, attempt, delay
@@ -0,0 +1,220 @@
+import os
+import time
+import fcntl
+import queue
+import atexit
+import threading
+from app_config import get_config
+
+# Répertoires
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.environ.get('NAVIDROME_TOOL_LOG_DIR') or os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'log'))
+STATUS_HISTORY_FILE = os.path.join(LOG_DIR, 'status_history.txt')
+COMMAND_HISTORY_FILE = os.path.join(LOG_DIR, 'command_history.txt')
+
+DEFAULT_SETTINGS = {
+    'flush_lines': 50,            # Écriture groupée dès que N lignes sont en attente...
+    'flush_interval': 0.5,        # ... ou au plus tard après M secondes
+    'max_bytes': 5 * 1024 * 1024, # Rotation du fichier actif au-delà de cette taille
+    'backup_count': 5,            # Nombre d'archives conservées (status_history.txt.1 ... .N)
+    'max_pending': 10000          # Taille max de la file en mémoire avant blocage des producteurs
+}
+
+_writers = {}
+_writers_lock = threading.Lock()
+_settings = None
+
+def load_log_settings():
+    """Charge la section 'logging' de config.json, avec des valeurs par défaut si elle est absente."""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        log_config = get_config().logging
+        settings['flush_lines'] = log_config.flush_lines
+        settings['flush_interval'] = log_config.flush_interval
+        settings['max_bytes'] = log_config.max_bytes
+        settings['backup_count'] = log_config.backup_count
+        settings['max_pending'] = log_config.max_pending
+    except (OSError, ValueError):
+        pass  # Journalisation toujours disponible, même sans configuration valide
+    return settings
+
+class StatusLogWriter:
+    """Écrit les lignes de journal depuis un thread d'arrière-plan, par lots, avec rotation par taille.
+
+    Plusieurs processus (consommateur, tag_rename_move.py lancé à la main) peuvent écrire dans le même fichier :
+    chaque lot est écrit, et la rotation faite, sous un verrou flock sur le fichier.
+    """
+
+    def __init__(self, path, flush_lines=50, flush_interval=0.5, max_bytes=5 * 1024 * 1024, backup_count=5, max_pending=10000):
+        self.path = path
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.file = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name=f"status-log-{os.path.basename(path)}", daemon=True)
+        self.thread.start()
+
+    def write(self, line):
+        """Ajoute une ligne (sans retour chariot) à la file d'écriture."""
+        if self.closed:
+            return
+        self.pending.put(line + "\n")
+
+    def flush(self):
+        """Bloque jusqu'à ce que toutes les lignes déjà soumises soient écrites sur disque."""
+        if self.closed:
+            return
+        done = threading.Event()
+        self.pending.put(done)
+        done.wait()
+
+    def close(self):
+        """Vide la file, ferme le fichier et arrête le thread d'écriture."""
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.put(None)
+        self.thread.join()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(self.path)
+        self.file = open(self.path, 'a')
+        if is_new:
+            # Permissions ajustées une seule fois, à la création du fichier (lecture par www-data)
+            try:
+                os.chmod(self.path, 0o664)
+            except PermissionError:
+                pass
+
+    def _lock(self):
+        """Verrouille (flock) le fichier actif, partagé avec les autres processus qui journalisent dans le même fichier.
+
+        Si un autre processus l'a renommé entre-temps (rotation), le descripteur pointe sur l'archive : le fichier
+        est rouvert au chemin d'origine avant d'écrire.
+        """
+        while True:
+            if self.file is None:
+                self._open()
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(self.file.fileno()).st_ino:
+                return
+            self.file.close()  # Libère aussi le verrou
+            self.file = None
+
+    def _rotate(self):
+        """Archive le fichier actif ; appelée verrou tenu, le fichier est rouvert par _lock."""
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file.close()
+        self.file = None
+
+    def _write_batch(self, lines):
+        if not lines:
+            return
+        data = "".join(lines)
+        try:
+            self._lock()
+            # Taille lue sur le disque : les autres processus ont pu écrire depuis la dernière écriture de celui-ci
+            size = os.fstat(self.file.fileno()).st_size
+            if self.max_bytes and size > 0 and size + len(data) > self.max_bytes:
+                self._rotate()
+                self._lock()
+            self.file.write(data)
+            self.file.flush()
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        except OSError as e:
+            print(f"Erreur d'écriture dans {self.path} : {str(e)}")
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self.pending.get()
+            batch = []
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            # Regroupe les lignes jusqu'à flush_lines ou flush_interval, puis un seul write()
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.flush_lines:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if stop:
+                # Vide ce qui reste dans la file avant de s'arrêter
+                while True:
+                    try:
+                        item = self.pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif item is not None:
+                        batch.append(item)
+            self._write_batch(batch)
+            for waiter in waiters:
+                waiter.set()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def get_writer(path):
+    """Retourne le writer partagé associé à un fichier de journal (un seul par fichier et par processus)."""
+    global _settings
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            if _settings is None:
+                _settings = load_log_settings()
+            writer = StatusLogWriter(path, **_settings)
+            _writers[path] = writer
+        return writer
+
+def write_line(path, line):
+    """Soumet une ligne au writer du fichier, sans attendre l'écriture disque."""
+    get_writer(path).write(line)
+
+def flush_all():
+    """Force l'écriture de toutes les lignes en attente, pour tous les fichiers."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
+def close_all():
+    """Vide et ferme tous les writers ; appelée automatiquement à la sortie du processus."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+atexit.register(close_all)
@@ -0,0 +1,96 @@
+from mutagen.id3 import ID3, TPE1, TPE2, TALB, TIT2, TRCK, TCON, TDRC, TDOR
+from tag_writer import save_id3
+
+# Clés au format EasyID3 utilisées par les scripts, et les trames ID3v2.4 correspondantes
+FRAMES = {
+    'artist': ('TPE1', TPE1),
+    'albumartist': ('TPE2', TPE2),
+    'album': ('TALB', TALB),
+    'title': ('TIT2', TIT2),
+    'tracknumber': ('TRCK', TRCK),
+    'genre': ('TCON', TCON),
+    'date': ('TDRC', TDRC),
+    'originaldate': ('TDOR', TDOR)
+}
+
+def _frame_values(frame_id, frame):
+    if frame_id == 'TCON':
+        return list(frame.genres)  # Genres numériques ID3v1 "(17)" convertis en noms, comme EasyID3
+    return [str(value) for value in frame.text]
+
+class TagEdit:
+    """Édition des tags ID3 d'un fichier en une seule lecture et au plus une écriture.
+
+    Les valeurs se lisent et s'écrivent comme avec EasyID3 (listes de chaînes) ; changes garde pour chaque clé
+    modifiée sa valeur d'origine et sa nouvelle valeur, et save() n'écrit rien si aucune valeur n'a changé.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.id3 = ID3(path)
+        self.original = {}  # {clé: valeur avant la première modification}
+
+    def get(self, key, default=None):
+        frame_id, _ = FRAMES[key]
+        frame = self.id3.get(frame_id)
+        if frame is None:
+            return default
+        values = _frame_values(frame_id, frame)
+        return values if values else default
+
+    def first(self, key, default=None):
+        values = self.get(key)
+        return values[0] if values else default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        values = self.get(key)
+        if values is None:
+            raise KeyError(key)
+        return values
+
+    def __setitem__(self, key, value):
+        values = [value] if isinstance(value, str) else [str(item) for item in value]
+        current = self.get(key)
+        if current == values:
+            return
+        if key not in self.original:
+            self.original[key] = current
+        frame_id, frame_class = FRAMES[key]
+        self.id3.setall(frame_id, [frame_class(encoding=3, text=values)])
+        if self.original[key] == values:
+            del self.original[key]  # Retour à la valeur d'origine : plus rien à écrire pour cette clé
+
+    @property
+    def changes(self):
+        """{clé: (valeur d'origine, nouvelle valeur)} des tags réellement modifiés."""
+        return {key: (original, self.get(key)) for key, original in self.original.items()}
+
+    @property
+    def changed(self):
+        return bool(self.original)
+
+    def save(self, min_padding=0):
+        """Écrit les tags (ID3v2.4, comme EasyID3) s'ils ont changé ; retourne le mode d'écriture, None si rien n'est écrit.
+
+        L'écriture passe par tag_writer.save_id3 : sur place dans la marge existante si elle suffit, sinon réécriture
+        complète avec une marge généreuse. Avec min_padding, un fichier dont la marge est plus petite est réécrit
+        même si aucun tag n'a changé (réservation de la marge au classement dans la bibliothèque).
+        """
+        if not self.original and (not min_padding or self.padding >= min_padding):
+            return None
+        mode = save_id3(self.id3, self.path, min_padding)
+        self.original = {}
+        return mode
+
+    @property
+    def padding(self):
+        """Marge (octets) libre dans l'en-tête ID3v2 lu."""
+        return getattr(self.id3, '_padding', 0)
+
+def read_genre(path):
+    """Genres d'un fichier déjà classé (liste, éventuellement vide), sans passer par EasyID3."""
+    frame = ID3(path).get('TCON')
+    return list(frame.genres) if frame is not None else []
@@ -0,0 +1,215 @@
+import os
+import json
+import errno
+import atexit
+import fcntl
+import uuid
+import shutil
+import threading
+import status_log
+
+JOURNAL_DIR = os.path.join(status_log.LOG_DIR, 'tag_journal')
+
+# États successifs d'un fichier : planifié → retagué → déplacé (source éventuellement encore présente) → terminé
+STATE_PLANNED = 'planned'
+STATE_TAGGED = 'tagged'
+STATE_MOVED = 'moved'
+STATE_DONE = 'done'
+STATE_ABORTED = 'aborted'
+
+# Taille au-delà de laquelle le journal est vidé dès qu'aucun fichier n'est en cours
+COMPACT_BYTES = 1024 * 1024
+
+def part_path(destination):
+    """Copie temporaire utilisée quand source et destination sont sur des systèmes de fichiers différents."""
+    return f"{destination}.part"
+
+def _fsync_directory(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # Certains systèmes de fichiers réseau ne permettent pas de synchroniser un dossier
+    finally:
+        os.close(fd)
+
+def _remove_if_unlocked(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.remove(path)
+    except OSError:
+        pass  # Journal en cours de création par un processus actif
+    finally:
+        os.close(fd)
+
+class TagJournal:
+    """Journal d'écriture anticipée (JSONL) des opérations de tag_rename_move, un fichier par processus.
+
+    Chaque ligne est synchronisée sur disque (fsync) avant l'étape qu'elle annonce. Le fichier du processus (nommé
+    d'après son pid et un identifiant aléatoire) est verrouillé (flock) pendant toute sa vie : au démarrage,
+    recover() rejoue les journaux des processus disparus (ceux dont le verrou est libre) puis les supprime.
+    """
+
+    def __init__(self, directory=JOURNAL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # Nom unique : un pid réutilisé après un redémarrage ne doit jamais écraser un journal pas encore rejoué
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.in_flight = set()
+        # Créé et verrouillé sous un nom que recover() ignore, puis renommé : un autre processus ne peut jamais
+        # verrouiller (et rejouer) ce journal entre sa création et la prise du verrou
+        temporary_path = os.path.join(directory, f"{name}.new")
+        self.fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o664)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        os.rename(temporary_path, self.path)
+
+    def _append(self, record):
+        os.write(self.fd, (json.dumps(record, ensure_ascii=False) + '\n').encode())
+        os.fsync(self.fd)
+
+    def plan(self, source, destination):
+        """Annonce le traitement de source vers destination ; retourne l'identifiant de l'entrée."""
+        with self.lock:
+            entry = self.next_id
+            self.next_id += 1
+            self.in_flight.add(entry)
+            self._append({'id': entry, 'state': STATE_PLANNED, 'source': source, 'destination': destination})
+        return entry
+
+    def mark(self, entry, state):
+        with self.lock:
+            if entry not in self.in_flight:
+                return
+            self._append({'id': entry, 'state': state})
+            if state in (STATE_DONE, STATE_ABORTED):
+                self.in_flight.discard(entry)
+                if not self.in_flight and os.fstat(self.fd).st_size > COMPACT_BYTES:
+                    os.ftruncate(self.fd, 0)
+
+    def move(self, entry, source, destination):
+        """Déplace source vers destination (remplacement atomique d'un fichier existant) en journalisant l'étape.
+
+        Sur le même système de fichiers, un rename suffit. Sinon la copie est écrite dans destination.part puis
+        renommée : la destination n'est jamais un fichier à moitié copié, et la source n'est supprimée qu'ensuite.
+        """
+        try:
+            os.rename(source, destination)
+            _fsync_directory(os.path.dirname(destination))
+            self.mark(entry, STATE_MOVED)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        temporary_path = part_path(destination)
+        try:
+            with open(source, 'rb') as src, open(temporary_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copystat(source, temporary_path)
+            os.replace(temporary_path, destination)
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            raise
+        _fsync_directory(os.path.dirname(destination))
+        self.mark(entry, STATE_MOVED)
+        os.remove(source)
+
+    def recover(self):
+        """Rejoue les journaux des processus arrêtés brutalement ; retourne (déplacements terminés, annulations).
+
+        Une entrée déplacée dont la source existe encore voit sa source supprimée (le fichier est déjà dans la
+        bibliothèque) ; une entrée planifiée ou retaguée perd sa copie partielle éventuelle, et sa source, restée
+        en place, sera retraitée normalement.
+        """
+        completed = 0
+        rolled_back = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.new'):
+                _remove_if_unlocked(path)  # Processus arrêté entre la création de son journal et son renommage
+                continue
+            if not name.endswith('.jsonl') or path == self.path:
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # Processus toujours actif
+                entries = {}
+                with open(path, 'r', errors='replace') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # Dernière ligne tronquée par l'arrêt brutal : son étape n'a pas eu lieu
+                        entry = entries.setdefault(record.get('id'), {})
+                        entry.update(record)
+                for entry in entries.values():
+                    state = entry.get('state')
+                    source = entry.get('source')
+                    destination = entry.get('destination')
+                    if state == STATE_MOVED and source and destination and os.path.exists(destination):
+                        if os.path.exists(source):
+                            os.remove(source)
+                        completed += 1
+                    elif state in (STATE_PLANNED, STATE_TAGGED) and destination:
+                        if os.path.exists(part_path(destination)):
+                            os.remove(part_path(destination))
+                        rolled_back += 1
+                os.remove(path)
+            finally:
+                os.close(fd)
+        return completed, rolled_back
+
+    def close(self):
+        with self.lock:
+            if self.fd is None:
+                return
+            if not self.in_flight:
+                try:
+                    os.remove(self.path)  # Supprimé avant de relâcher le verrou : rien à rejouer
+                except FileNotFoundError:
+                    pass
+            os.close(self.fd)
+            self.fd = None
+
+# Journal ouvert une seule fois par processus ; les journaux laissés par un arrêt brutal sont rejoués à l'ouverture
+_shared_lock = threading.Lock()
+_shared = None
+
+def get_journal(log=print):
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            journal = TagJournal()
+            completed, rolled_back = journal.recover()
+            if completed or rolled_back:
+                log(f"Journal de tagging rejoué : {completed} déplacement(s) terminé(s), {rolled_back} opération(s) annulée(s)")
+            _shared = journal
+            atexit.register(close_journal)
+        return _shared
+
+def close_journal():
+    global _shared
+    with _shared_lock:
+        if _shared is not None:
+            _shared.close()
+            _shared = None
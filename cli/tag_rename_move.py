@@ -1,39 +1,91 @@
 import os
-import mutagen.easyid3
-from mutagen.easyid3 import EasyID3
 import shutil
 import time
-import re
-import requests
-import json
+import sys
+import argparse
+import signal
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
-from mutagen.id3 import ID3, TDRC  # Ajout pour gérer la date
+import status_log
+from tag_edit import TagEdit, FRAMES, read_genre
+from tag_writer import FILING_MIN_PADDING, WRITE_IN_PLACE, WRITE_REWRITE, write_summary
+from genre_mapper import get_mapper, GENRE_MEMO_FILE
+from genre_cache import cache_key
+from genre_classifier import classify_albums
+from download_watcher import DownloadWatcher
+from audio_index import get_audio_index, audio_hash
+from tag_journal import get_journal, JOURNAL_DIR, STATE_TAGGED, STATE_DONE, STATE_ABORTED
+from app_config import get_config, get_tag_config, ConfigError, TAG_CONFIG_PATH
 
 # Répertoires
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-CONFIG_PATH = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'etc', 'config.json'))
-TAG_CONFIG_PATH = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'etc', 'tag_config.json'))
-STATUS_HISTORY_FILE = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'log', 'status_history.txt'))
-COMMAND_HISTORY_FILE = os.path.normpath(os.path.join(SCRIPT_DIR, '..', 'log', 'command_history.txt'))
+STATUS_HISTORY_FILE = status_log.STATUS_HISTORY_FILE
+COMMAND_HISTORY_FILE = status_log.COMMAND_HISTORY_FILE
+
+STATUS_MOVED = 'moved'
+STATUS_ERROR = 'error'
+STATUS_SKIPPED = 'skipped'  # Fichier déjà traité entre-temps par un autre appelant (mode watch)
+
+@dataclass
+class TagResult:
+    """Résultat du traitement d'un fichier : source, chemin final dans la bibliothèque, statut et message d'erreur."""
+    source: str
+    destination: str
+    status: str
+    message: str = ""
+    tag_write: str = None  # Mode d'écriture des tags (tag_writer.WRITE_IN_PLACE ou WRITE_REWRITE), None sans écriture
+
+class KeyedLocks:
+    """Verrous créés à la demande par clé (chemin), libérés de la table quand plus personne ne les utilise."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}  # {clé: [verrou, nombre d'utilisateurs]}
+
+    @contextmanager
+    def hold(self, key):
+        with self.lock:
+            entry = self.locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
+
+# Partagés par tous les threads du processus (workers de tag_files et jobs simultanés du consommateur).
+# Ordre d'acquisition : destination puis dossier, jamais l'inverse.
+destination_locks = KeyedLocks()
+directory_locks = KeyedLocks()
+# Un fichier source n'est traité que par un appelant à la fois (mode watch et fin de job du consommateur)
+source_locks = KeyedLocks()
 
 def load_tag_config():
-    """Charge les règles de mapping des genres depuis tag_config.json."""
+    """Retourne les règles de mapping des genres de tag_config.json, déjà compilées (cache partagé, rechargé si modifié)."""
     try:
-        with open(TAG_CONFIG_PATH, 'r') as f:
-            config = json.load(f)
-        return config.get('genre_patterns', {})
+        tag_config = get_tag_config()
     except FileNotFoundError:
         log_action("Erreur : Fichier de configuration des tags manquant", TAG_CONFIG_PATH, "")
-        return {}
-    except json.JSONDecodeError:
-        log_action("Erreur : Fichier tag_config.json invalide", TAG_CONFIG_PATH, "Utilisation de règles par défaut")
-        return {}
-    except Exception as e:
-        log_action("Erreur lors du chargement de tag_config.json", TAG_CONFIG_PATH, f"Exception : {str(e)}")
-        return {}
+        return ()
+    except ConfigError as e:
+        log_action("Erreur : Fichier tag_config.json invalide", TAG_CONFIG_PATH, f"Utilisation de règles par défaut : {str(e)}")
+        return ()
+    for error in tag_config.errors:
+        log_action("Erreur dans tag_config.json", TAG_CONFIG_PATH, error)
+    return tag_config.genre_patterns
 
 def ensure_directory(path):
     """Assure que le répertoire existe avec les permissions correctes, avec gestion non bloquante de [Errno 1]."""
+    with directory_locks.hold(os.path.normpath(path)):
+        _ensure_directory(path)
+
+def _ensure_directory(path):
     try:
         if not os.path.exists(path):
             os.makedirs(path)
@@ -51,18 +103,9 @@ def ensure_directory(path):
         raise
 
 def log_action(action, file_path, message=""):
-    """Journalise les actions dans status_history.txt via spotdl-consumer.py."""
+    """Journalise les actions dans status_history.txt via le writer partagé (écriture groupée en arrière-plan)."""
     timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-    with open(STATUS_HISTORY_FILE, 'a') as f:
-        f.write(f"[{timestamp}] Fichier: {file_path} - {action} - {message}\n")
-    try:
-        os.chown(STATUS_HISTORY_FILE, os.getuid(), os.getgid())  # Utilise UID/GID courant
-        os.chmod(STATUS_HISTORY_FILE, 0o664)
-    except PermissionError as e:
-        if e.errno == 1:
-            log_action("Erreur de permission non bloquante pour log - Ignorée", STATUS_HISTORY_FILE, f"Exception : [Errno 1] Operation not permitted")
-        else:
-            log_action("Erreur de permission bloquante pour log", STATUS_HISTORY_FILE, f"Exception : {str(e)}")
+    status_log.write_line(STATUS_HISTORY_FILE, f"[{timestamp}] Fichier: {file_path} - {action} - {message}")
 
 def sanitize_name(name):
     """Remplace les '/' par des ',' dans un nom pour éviter les erreurs de chemin, normalise les espaces, et supprime un '.' uniquement s'il est à la fin."""
@@ -73,94 +116,176 @@ def sanitize_name(name):
         name = name.rstrip('.')  # Supprime le point uniquement s'il est à la fin
     return name.replace("/", ",").replace('"', "").replace(":", "").replace("?", "").replace("¿", "") if name else ""
 
-def map_genre(genre, genre_patterns):
-    """Mappe un genre vers une valeur standardisée en utilisant des expressions régulières configurables, avec journalisation pour débogage."""
-    if not genre:
-        #log_action("Genre manquant (débogage)", "", "Genre vide")
-        return "Unknown"
-    genre_str = str(genre) if not isinstance(genre, str) else genre
-    genre_encoded = genre_str.encode('utf-8', errors='replace').decode('utf-8')
-    genre_bytes = genre_str.encode('utf-8', errors='replace') if isinstance(genre_str, str) else b''
-    genre_lower = genre_str.lower()
-    #log_action("Genre analysé (débogage)", "", f"Genre type : {type(genre_str)}, Genre original : {genre_str!r}, Genre encoded : {genre_encoded!r}, Genre bytes : {genre_bytes!r}, Genre lowercase : {genre_lower!r}")
-    for pattern, mapped_genre in genre_patterns.items():
-        try:
-            if re.search(pattern, genre_lower):
-                #log_action("Genre mappé avec regex (débogage)", "", f"Pattern matché : {pattern}, Nouveau genre : {mapped_genre}")
-                return mapped_genre
-        except re.error as e:
-            #log_action("Erreur dans le pattern regex (débogage)", "", f"Pattern invalide : {pattern}, Exception : {str(e)}")
-            continue
-    #log_action("Genre non mappé (débogage)", "", f"Genre non mappé : {genre_lower!r}")
-    return genre
+def genre_memo_path(config):
+    """Fichier du mémo de mapping des genres, vide si tag.genre-memo est désactivé."""
+    return GENRE_MEMO_FILE if config.tag.genre_memo else ''
 
 def get_processed_dir(main_artist, music_path):
     """Retourne le chemin du dossier processed basé sur l’artiste principal (albumartist) sous /music/downloads/."""
     artist_folder = sanitize_name(main_artist) or "Unknown"
     return os.path.join(music_path, artist_folder)
 
-def process_mp3_file(file_path, music_dir, genre_patterns, config):
-    """Traite un fichier MP3 : modifie les tags ID3, renomme avec tracknum sur 2 digits, utilise albumartist comme artiste principal, et ajuste le titre avec featuring basé sur artist, avec journalisation."""
+def get_main_artist(audio):
+    """Artiste principal : albumartist, sinon le premier des artistes séparés par ','."""
+    if "albumartist" in audio:
+        return sanitize_name(audio["albumartist"][0])
+    if "artist" in audio:
+        artists = [sanitize_name(a.strip()) for a in audio["artist"][0].split(",") if a.strip()]
+        return artists[0] if artists else "Unknown"
+    return "Unknown"
+
+def split_featuring(audio, main_artist):
+    """(artistes du tag artist sans doublons, artistes en featuring) : ceux qui ne sont pas l'artiste principal."""
+    if "artist" not in audio:
+        return [], []
+    all_artists = [a.strip() for a in sanitize_name(audio["artist"][0]).split(",") if a.strip()]
+    all_artists = list(dict.fromkeys(all_artists))  # Supprime les doublons
+    return all_artists, [artist for artist in all_artists if artist != main_artist]
+
+def track_title(audio, featuring_artists):
+    """Titre final : featuring ajoutés s'ils n'y sont pas déjà, 'Untitled' si le titre manque."""
+    if featuring_artists:
+        original_title = audio["title"][0]
+        if "feat. " in sanitize_name(original_title).lower():
+            return original_title
+        return f"{sanitize_name(original_title)} (feat. {', '.join(featuring_artists)})"
+    if "title" in audio:
+        return sanitize_name(audio["title"][0])
+    return "Untitled"
+
+def track_number(audio):
+    """Numéro de piste sur 2 chiffres ('01' si absent ou illisible)."""
+    tracknum = audio.get("tracknumber", ["1"])[0].split("/")[0]
+    try:
+        return str(int(tracknum)).zfill(2)
+    except ValueError:
+        return "01"
+
+def destination_path(audio, file_path, music_dir):
+    """Chemin de classement d'un fichier d'après ses tags actuels (avant traitement)."""
+    main_artist = get_main_artist(audio)
+    album = sanitize_name(audio.first("album", "Unknown"))
+    title = track_title(audio, split_featuring(audio, main_artist)[1])
+    ext = os.path.splitext(file_path)[1].lower()
+    return os.path.join(get_processed_dir(main_artist, music_dir), f"{main_artist} - {album} - {track_number(audio)} - {title}{ext}")
+
+@dataclass
+class AlbumPlan:
+    """Décisions communes aux fichiers d'un même album (artiste principal, album) d'un lot, prises une seule fois."""
+    main_artist: str
+    album: str
+    processed_dir: str
+    date: str = ""          # Date du premier fichier de l'album qui en a une, pour ceux qui n'en ont pas
+    genre: str = None       # Genre détecté par l'IA, pour les fichiers restés 'Unknown' après mapping
+    directory_ready: bool = False
+
+def album_key(audio):
+    """(artiste principal, album) d'un fichier, tels qu'utilisés pour le classement."""
+    return get_main_artist(audio), sanitize_name(audio.first("album", "Unknown"))
+
+def load_tags(file_path):
+    """Tags d'un fichier pour la première passe de tag_files, None s'ils sont illisibles (erreur journalisée ensuite)."""
+    try:
+        return TagEdit(file_path)
+    except Exception:
+        return None
+
+def album_facts(audio, file_path, music_dir, genre_patterns, config):
+    """(clé d'album, date, genre à détecter) d'un fichier déjà lu, pour le regroupement par album.
+
+    Un fichier dont la destination existe déjà hérite du genre de l'ancien fichier : il ne demande pas de détection.
+    """
+    genre = audio.first("genre")
+    needs_genre = not genre or get_mapper(genre_patterns, genre_memo_path(config)).map(genre) == "Unknown"
+    if needs_genre and config.tag.genre_tagging_mode == "ai":
+        try:
+            needs_genre = not os.path.exists(destination_path(audio, file_path, music_dir))
+        except KeyError:
+            pass  # Titre manquant avec featuring : l'erreur sera journalisée par process_mp3_file
+    return album_key(audio), audio.first("originaldate") or audio.first("date") or "", needs_genre
+
+def plan_albums(facts, music_dir, config):
+    """Regroupe les fichiers d'un lot par album et prend les décisions communes ; retourne {clé d'album: AlbumPlan}.
+
+    Le dossier de destination est créé (et ses permissions ajustées) une fois par artiste, et les albums sans genre
+    sont classés par l'IA en requêtes groupées (mode ai).
+    """
+    albums = {}
+    needing_genre = {}  # Ordonné, sans doublon
+    for key, date, needs_genre in facts:
+        plan = albums.get(key)
+        if plan is None:
+            plan = albums[key] = AlbumPlan(key[0], key[1], get_processed_dir(key[0], music_dir))
+        if date and not plan.date:
+            plan.date = date
+        if needs_genre and config.tag.genre_tagging_mode == "ai":
+            needing_genre[key] = True
+    if needing_genre:
+        genres = classify_albums(list(needing_genre), config)
+        for key in needing_genre:
+            albums[key].genre = genres.get(cache_key(*key))
+    for directory in sorted({plan.processed_dir for plan in albums.values()}):
+        try:
+            ensure_directory(directory)
+        except Exception:
+            continue  # Erreur journalisée ; chaque fichier de l'album retentera la création
+        for plan in albums.values():
+            if plan.processed_dir == directory:
+                plan.directory_ready = True
+    return albums
+
+def process_mp3_file(file_path, music_dir, genre_patterns, config, albums=None, audio=None):
+    """Traite un fichier MP3 : modifie les tags ID3, renomme avec tracknum sur 2 digits, utilise albumartist comme artiste principal, et ajuste le titre avec featuring basé sur artist, avec journalisation.
+
+    albums ({clé d'album: AlbumPlan}) contient les décisions déjà prises pour l'album du fichier dans ce lot (dossier
+    créé, genre détecté par l'IA, date) ; un album absent est traité fichier par fichier. audio (TagEdit) évite de
+    relire des tags déjà chargés par la première passe de tag_files. Retourne un TagResult décrivant le résultat
+    (déplacé ou erreur) au lieu de lever l'exception.
+    """
+    journal = get_journal(lambda message: log_action("Reprise après arrêt brutal", JOURNAL_DIR, message)) if config.tag.journal else None
+    entry = None
+    source_hash = None
     try:
         log_action("Début du traitement", file_path)
 
-        # Charge les tags ID3 avec mutagen
+        # Charge les tags ID3 une seule fois : toutes les modifications se font sur cet objet, écrit une seule fois
         try:
-            audio = EasyID3(file_path)
-            # Charge aussi les tags complets pour gérer la date
-            audio_full = ID3(file_path)
+            if audio is None:
+                audio = TagEdit(file_path)
         except Exception as e:
             log_action("Erreur de chargement des tags", file_path, f"Exception : {str(e)}")
-            return
+            return TagResult(file_path, None, STATUS_ERROR, f"Erreur de chargement des tags : {str(e)}")
+
+        # Décisions communes à l'album, prises une fois pour tout le lot
+        plan = (albums or {}).get(album_key(audio))
 
-        # Récupérer la date si elle existe
-        date = audio.get("originaldate", audio_full.get('TDRC', ['0000'])[0])
-        if isinstance(date, list):
-            date = date[0]  # Prendre la première valeur si c'est une liste
+        # Récupérer la date si elle existe (date de sortie originale, sinon date d'enregistrement, sinon celle de l'album)
+        date = audio.first("originaldate") or audio.first("date") or (plan.date if plan else "") or "0000"
         log_action("Date récupérée", file_path, f"Date: {date}")
 
         # Règle 2 : Utiliser albumartist comme artiste principal, et générer featuring à partir de artist
-        if "albumartist" in audio:
-            main_artist = sanitize_name(audio["albumartist"][0])
-        else:
-            if "artist" in audio:
-                artists = [sanitize_name(a.strip()) for a in audio["artist"][0].split(",") if a.strip()]
-                main_artist = artists[0] if artists else "Unknown"
-            else:
-                main_artist = "Unknown"
+        main_artist = get_main_artist(audio)
         log_action("Artiste principal défini", file_path, f"Artiste principal (albumartist) : {main_artist}")
 
         # Générer les featuring en comparant artist avec albumartist, en divisant uniquement sur ',' et supprimant l’albumartist
-        featuring_artists = []
+        all_artists, featuring_artists = split_featuring(audio, main_artist)
         if "artist" in audio:
-            artist_str = sanitize_name(audio["artist"][0])
-            log_action("Artistes analysés (débogage)", file_path, f"Artist original : {artist_str!r}")
-            all_artists = [a.strip() for a in artist_str.split(",") if a.strip()]
-            all_artists = list(dict.fromkeys(all_artists))  # Supprime les doublons
-            for artist in all_artists:
-                if artist and artist != main_artist:
-                    featuring_artists.append(artist)
+            log_action("Artistes analysés (débogage)", file_path, f"Artist original : {sanitize_name(audio['artist'][0])!r}")
             log_action("Artistes extraits (débogage)", file_path, f"Artistes : {all_artists}, Artiste principal : {main_artist}, Featuring : {featuring_artists}")
-        if featuring_artists:
-            original_title = sanitize_name(audio["title"][0])
-            if "feat. " not in original_title.lower():
-                audio["title"] = f"{original_title} (feat. {', '.join(featuring_artists)})"
-                log_action("Featuring ajoutés au titre", file_path, f"Titre : {audio['title'][0]}")
-            else:
-                log_action("Titre conservé sans ajout de featuring", file_path, f"Titre existant : {original_title}")
-        elif "title" in audio:
-            audio["title"] = sanitize_name(audio["title"][0])
-            log_action("Titre conservé sans featuring", file_path, f"Titre : {audio['title'][0]}")
-        else:
-            audio["title"] = "Untitled"
+        original_title = audio.first("title")
+        title = track_title(audio, featuring_artists)
+        audio["title"] = title
+        if original_title is None:
             log_action("Titre manquant, défini à 'Untitled'", file_path)
+        elif not featuring_artists:
+            log_action("Titre conservé sans featuring", file_path, f"Titre : {title}")
+        elif title == original_title:
+            log_action("Titre conservé sans ajout de featuring", file_path, f"Titre existant : {sanitize_name(title)}")
+        else:
+            log_action("Featuring ajoutés au titre", file_path, f"Titre : {title}")
 
         # Obtient les tags nécessaires pour le renommage, avec tracknum sur 2 digits et remplacement des '/'
-        tracknum = audio.get("tracknumber", ["1"])[0].split("/")[0]
-        try:
-            tracknum = str(int(tracknum)).zfill(2)
-        except ValueError:
-            tracknum = "01"
+        tracknum = track_number(audio)
         artist = main_artist
         audio['artist'] = artist  # Remplace l'artiste par l'artiste de l'album
         album = sanitize_name(audio.get("album", ["Unknown"])[0])
@@ -171,12 +296,11 @@ def process_mp3_file(file_path, music_dir, genre_patterns, config):
         audio["date"] = date
 
         # Règle : Mapper les genres musicaux avec des expressions régulières configurables
-        tagging_config = config.get('tag', {})
-        genre_tagging_mode = tagging_config.get('genre-tagging-mode', 'mapping')
+        genre_tagging_mode = config.tag.genre_tagging_mode
         
         if "genre" in audio:
             original_genre = audio["genre"][0]
-            new_genre = map_genre(original_genre, genre_patterns)
+            new_genre = get_mapper(genre_patterns, genre_memo_path(config)).map(original_genre)
             if new_genre != original_genre:
                 audio["genre"] = new_genre
                 log_action("Genre mappé avec regex", file_path, f"Genre original : {original_genre}, Nouveau genre : {new_genre}")
@@ -187,193 +311,270 @@ def process_mp3_file(file_path, music_dir, genre_patterns, config):
             log_action("Genre manquant", file_path, "Défini à 'Unknown'")
 
         # Vérifie si le nouveau nom existe déjà dans /music/downloads/<albumartist>/, et écrase l’ancien fichier
-        processed_dir = get_processed_dir(main_artist, music_dir)
+        processed_dir = plan.processed_dir if plan else get_processed_dir(main_artist, music_dir)
         new_filename = f"{artist} - {album} - {tracknum} - {title}{ext}"
         new_path = os.path.join(processed_dir, new_filename)
-        if os.path.exists(new_path):
-            log_action("Fichier existant détecté, écrasement", file_path, f"Nom existant : {new_filename}")
-            try:
-                OldAudio = EasyID3(new_path)
-                audio["genre"] = OldAudio["genre"]
-                os.remove(new_path)
-                log_action("Ancien fichier supprimé avec succès & ancien genre conservé", new_path, "")
-            except Exception as e:
-                log_action("Erreur lors de la suppression de l’ancien fichier", new_path, f"Exception : {str(e)}")
-                raise
-        else:
-            if genre_tagging_mode == "ai" and audio["genre"][0] == "Unknown":
-                ai_genre = detect_genre_with_grok(artist, album, config)
-                audio["genre"] = ai_genre
-                log_action("Genre détecté par Grok", file_path, f"Genre : {ai_genre}")
+        # Deux fichiers visant la même destination (doublons d'un même morceau) sont traités l'un après l'autre :
+        # détection de l'existant, héritage du genre et déplacement ne doivent pas s'entrelacer
+        with destination_locks.hold(new_path.replace(":", "")):
+            if os.path.exists(new_path):
+                log_action("Fichier existant détecté, écrasement", file_path, f"Nom existant : {new_filename}")
+                try:
+                    old_genre = read_genre(new_path)
+                    if old_genre:
+                        audio["genre"] = old_genre
+                    # L'ancien fichier n'est plus supprimé d'avance : le déplacement le remplace de façon atomique
+                    log_action("Ancien genre conservé, ancien fichier remplacé au déplacement", new_path, "")
+                except Exception as e:
+                    log_action("Erreur lors de la lecture de l’ancien fichier", new_path, f"Exception : {str(e)}")
+                    raise
+                # Même audio que le fichier déjà classé (resynchronisation) : seuls ses tags sont mis à jour, sur place
+                if config.tag.audio_index:
+                    source_hash = audio_hash(file_path)
+                    if get_audio_index().hash_for(new_path) == source_hash:
+                        return update_existing_tags(file_path, new_path, audio, source_hash)
+            else:
+                if genre_tagging_mode == "ai" and audio["genre"][0] == "Unknown":
+                    ai_genre = plan.genre if plan else None
+                    if ai_genre is None:
+                        ai_genre = detect_genre_with_grok(artist, album, config)
+                    audio["genre"] = ai_genre
+                    log_action("Genre détecté par Grok", file_path, f"Genre : {ai_genre}")
         
-        # Sauvegarde les nouveaux tags, y compris la date
-        audio.save(file_path)
-        # Vérification supplémentaire avec ID3 pour garantir la persistance de TDRC
-        audio_full = ID3(file_path)
-        audio_full['TDRC'] = TDRC(encoding=3, text=date)
-        audio_full.save(file_path)
-        log_action("Tags ID3 sauvegardés avec date", file_path, f"Date conservée: {date}")
-
-        # Vérifier les permissions pour le répertoire source et destination
-        source_dir = os.path.dirname(file_path)
-        dest_dir = os.path.dirname(new_path)
-        ensure_directory(dest_dir)
-
-        if not os.access(source_dir, os.W_OK | os.R_OK):
-            log_action(f"Erreur : Pas de permissions pour accéder au répertoire source {source_dir}", file_path, f"Nouvelle position : {new_path}")
-            return
-        if not os.access(dest_dir, os.W_OK | os.R_OK):
-            log_action(f"Erreur : Pas de permissions pour écrire dans {dest_dir}", file_path, f"Nouvelle position : {new_path}")
-            return
-
-        # Déplacer le fichier
-        new_path = new_path.replace(":", "")
-        shutil.move(file_path, new_path)
-        log_action("Fichier déplacé et renommé (ou écrasé)", file_path, f"Nouvelle position : {new_path}")
-
-        # Ajuster les permissions avec l’utilisateur courant
-        try:
-            os.chmod(new_path, 0o664)  # rw-rw-r--
-            log_action("Permissions ajustées avec succès avec permissions courantes", new_path, "")
-        except PermissionError as e:
-            if e.errno == 1:  # Operation not permitted
-                log_action("Erreur de permission non bloquante ignorée", new_path, f"Exception : [Errno 1] Operation not permitted")
+            # Journal : l'opération est annoncée avant la première modification du fichier
+            if journal is not None:
+                entry = journal.plan(file_path, new_path.replace(":", ""))
+
+            # Sauvegarde les nouveaux tags (date comprise) en une seule écriture ; le fichier est encore dans /downloads/ :
+            # c'est le moment de lui réserver la marge des futures modifications sur place, même si aucun tag ne change
+            changes = audio.changes
+            saved = audio.save(FILING_MIN_PADDING)
+            if journal is not None:
+                journal.mark(entry, STATE_TAGGED)
+            if saved and changes:
+                log_action("Tags ID3 sauvegardés avec date", file_path, f"Date conservée: {date}, Tags modifiés : {', '.join(sorted(changes))}")
+            elif saved:
+                log_action("Tags ID3 inchangés, marge ID3 réservée", file_path, f"Date conservée: {date}")
             else:
-                log_action("Erreur de permission bloquante", new_path, f"Exception : {str(e)}")
+                log_action("Tags ID3 inchangés, pas d'écriture", file_path, f"Date conservée: {date}")
+
+            # Vérifier les permissions pour le répertoire source et destination
+            source_dir = os.path.dirname(file_path)
+            dest_dir = os.path.dirname(new_path)
+            if plan is None or not plan.directory_ready:
+                ensure_directory(dest_dir)
+
+            if not os.access(source_dir, os.W_OK | os.R_OK):
+                log_action(f"Erreur : Pas de permissions pour accéder au répertoire source {source_dir}", file_path, f"Nouvelle position : {new_path}")
+                return TagResult(file_path, None, STATUS_ERROR, f"Pas de permissions pour accéder au répertoire source {source_dir}")
+            if not os.access(dest_dir, os.W_OK | os.R_OK):
+                log_action(f"Erreur : Pas de permissions pour écrire dans {dest_dir}", file_path, f"Nouvelle position : {new_path}")
+                return TagResult(file_path, None, STATUS_ERROR, f"Pas de permissions pour écrire dans {dest_dir}")
+
+            # Déplacer le fichier
+            new_path = new_path.replace(":", "")
+            if journal is not None:
+                journal.move(entry, file_path, new_path)
+            else:
+                shutil.move(file_path, new_path)
+            log_action("Fichier déplacé et renommé (ou écrasé)", file_path, f"Nouvelle position : {new_path}")
+
+            # Ajuster les permissions avec l’utilisateur courant
+            try:
+                os.chmod(new_path, 0o664)  # rw-rw-r--
+                log_action("Permissions ajustées avec succès avec permissions courantes", new_path, "")
+            except PermissionError as e:
+                if e.errno == 1:  # Operation not permitted
+                    log_action("Erreur de permission non bloquante ignorée", new_path, f"Exception : [Errno 1] Operation not permitted")
+                else:
+                    log_action("Erreur de permission bloquante", new_path, f"Exception : {str(e)}")
+                    raise
+            except Exception as e:
+                log_action("Erreur générale lors de l’ajustement des permissions", new_path, f"Exception : {str(e)}")
                 raise
-        except Exception as e:
-            log_action("Erreur générale lors de l’ajustement des permissions", new_path, f"Exception : {str(e)}")
-            raise
+            # Tout fichier entré dans la bibliothèque est indexé : une resynchronisation le reconnaîtra sans scan préalable
+            if config.tag.audio_index:
+                try:
+                    get_audio_index().record(new_path, source_hash or audio_hash(new_path))
+                except Exception as e:
+                    log_action("Erreur non bloquante lors de l'indexation audio", new_path, f"Exception : {str(e)}")
+            if journal is not None:
+                journal.mark(entry, STATE_DONE)
+            return TagResult(file_path, new_path, STATUS_MOVED, "", saved)
     except Exception as e:
         log_action("Erreur générale lors du traitement", file_path, f"Exception : {str(e)}")
+        return TagResult(file_path, None, STATUS_ERROR, f"Erreur générale lors du traitement : {str(e)}")
+    finally:
+        if entry is not None:
+            journal.mark(entry, STATE_ABORTED)  # Sans effet si l'entrée est déjà terminée
 
-def detect_genre_with_grok(artist, album, config):
-    grok_config = config.get('grok_api', {})
-    api_key = grok_config.get('api_key', '')
-    url = grok_config.get('endpoint', '')
-    model = grok_config.get('model', '')
+def update_existing_tags(file_path, existing_path, audio, source_hash):
+    """Reporte les tags calculés pour file_path sur existing_path, dont l'audio est identique, puis supprime file_path.
 
+    Seules les trames gérées par TagEdit sont comparées et réécrites (sans écriture si rien n'a changé) : le fichier
+    de la bibliothèque garde ses autres trames (paroles, pochette) et n'est pas recopié.
     """
-    Détecte le genre musical d'une chanson via l'API xAI à https://api.x.ai/v1/chat/completions.
-    
+    existing = TagEdit(existing_path)
+    for key in FRAMES:
+        values = audio.get(key)
+        if values is not None:
+            existing[key] = values
+    changes = existing.changes
+    saved = existing.save()
+    if saved:
+        log_action("Audio identique déjà présent, tags mis à jour sur place", existing_path, f"Tags modifiés : {', '.join(sorted(changes))}")
+    else:
+        log_action("Audio identique déjà présent, tags inchangés", existing_path, "")
+    get_audio_index().record(existing_path, source_hash)
+    os.remove(file_path)
+    return TagResult(file_path, existing_path, STATUS_MOVED, "", saved)
+
+def detect_genre_with_grok(artist, album, config):
+    """Détecte le genre musical d'un album via l'API xAI (cache persistant, timeout et nouvelles tentatives).
+
     Args:
         artist (str): Nom de l'artiste
         album (str): Nom de l'album
-        config (dict): Configuration contenant les informations de l'API
-    
+        config (AppConfig): Configuration contenant les informations de l'API
+
     Returns:
         str: Le ou les genres détectés selon la catégorisation définie, séparés par '/'
     """
-    # Créer une clé unique pour le cache basée sur artist et album
-    cache_key = f"{artist.lower()}|{album.lower()}"
-
-    # Vérifier si le résultat est déjà dans le cache
-    if cache_key in genre_cache:
-        return genre_cache[cache_key]
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    # Structure des messages pour l'API
-    messages = [
-        {
-            "role": "system",
-            "content": """
-            Tu es un expert en classification musicale. Ton objectif est de déterminer le genre musical d'une chanson à partir de son artiste et de son titre, en respectant strictement une catégorisation spécifique. 
-            Les genres peuvent être cumulables : si un morceau appartient à plusieurs catégories, sépare les genres par le caractère ' / '. 
-            Rap & Hip-Hop n'est cumulable qu'avec Latin sinon il est dominant
-            
-            Voici les règles précises que tu dois suivre :
-            - "Rap & Hip-Hop" : Pour tous les morceaux de rap et hip-hop avec des paroles dans une langue autre que le français.
-            - "Rap Français" : Pour tous les morceaux de rap avec des paroles en français.
-            - "Electro" : Pour tous les morceaux de musique électronique (techno, trance, EDM, etc.), sauf la house.
-            - "House" : Pour tous les types de house (deep house, progressive house, tech house, etc.).
-            - "Reggaeton" : Pour tous les morceaux de reggaeton.
-            - "Variété Américaine" : Pour tous les morceaux de chanson (hors rap, hip-hop, electro, house, reggaeton, pop, rock) d'artistes américains ou avec des paroles en anglais américain.
-            - "Variété Internationale" : Pour tous les morceaux de chanson (hors rap, hip-hop, electro, house, reggaeton, pop, rock) dans une langue autre que le français ou l'anglais américain.
-            - "Variété Française" : Pour tous les morceaux de chanson (hors rap, hip-hop, electro, house, reggaeton, pop, rock) avec des paroles en français.
-            - "Pop" : Pour tous les morceaux de pop, quelle que soit la langue.
-            - "Rock" : Pour tous les morceaux de rock ou apparentés (rock alternatif, punk, metal, grunge, etc.).
-            - "Latin" : Pour tous les morceaux de musique latine (salsa, bachata, cumbia, etc.), hors reggaeton.
-            - "Instrumental / Trip-Hop" : Pour tous les morceaux sans paroles d'abstract hip-hop, trip-hop ou instrumentaux dans ce style.
-            - "Ambiance" : Pour tous les morceaux d'ambiance (chill, downtempo, lounge, etc.).
-            - "Classical" : Pour tous les morceaux orchestraux ou de musique classique.
-            - "Funk" : Pour tous les morceaux de funk ou genres apparentés
-            - "Jazz" : Pour tous les morceaux de jazz ou genres apparentés
-            - "Soul" : Pour tous les morceaux de soul ou genres apparentés
-
-            Instructions :
-            - Si tu as un doute sur la langue ou le style, base-toi sur les informations typiquement associées à l'artiste ou à l'album.
-            - Réponds UNIQUEMENT par le nom du ou des genres, sans aucun autre texte, commentaire ou explication (exemple : "Pop / Rock").
-            """
-        },
-        {
-            "role": "user",
-            "content": f"Analyse l'artiste '{artist}' et l'album '{album}'. Quelle est ta réponse ?"
-        }
-    ]
-    
-    payload = {
-        "model": model,
-        "messages": messages,
-        "max_tokens": 50,
-        "temperature": 0.3
-    }
-    
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        result = response.json()
-        genre = result.get("choices", [{}])[0].get("message", {}).get("content", "Unknown").strip()
-        
-        # Stocker le résultat dans le cache avant de le retourner
-        genre_cache[cache_key] = genre
-        return genre
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            log_action("Erreur 401 Unauthorized lors de l'appel à l'API xAI", "", f"Détails : {str(e)} - Vérifiez la clé API dans config.json")
-        else:
-            log_action("Erreur HTTP lors de l'appel à l'API xAI", "", f"Détails : {str(e)}")
-        return "Unknown"
-    except requests.exceptions.RequestException as e:
-        log_action("Erreur réseau ou autre lors de l'appel à l'API xAI", "", f"Détails : {str(e)}")
-        return "Unknown"
+    return classify_albums([(artist, album)], config)[cache_key(artist, album)]
 
-def main():
-    """Scanne et traite tous les fichiers MP3 dans /downloads/, sans supprimer les fichiers restants sauf en cas de succès."""
-    # Charger les règles de mapping des genres
-    genre_patterns = load_tag_config()
-    global genre_cache
-    genre_cache = {}
-
-    with open(CONFIG_PATH, 'r') as f:
-        config = json.load(f)
-    path_config = config.get('paths', {})
-    downloads_dir = path_config.get('downloads', '/downloads/')
-    music_dir = path_config.get('music', '/music/downloads/')
+def tag_files(file_paths, config=None, genre_patterns=None, workers=None):
+    """Traite une liste explicite de fichiers MP3 puis supprime les sources traitées ; retourne la liste des TagResult (même ordre).
+
+    Point d'entrée utilisé en interne par queue_consumer.py (sans relancer d'interpréteur) et par main().
+    Les fichiers sont traités par un pool de workers threads (tag.workers par défaut) : le travail est surtout
+    de l'E/S sur le NAS, et les threads partagent les verrous de destination et le journal. Une première passe
+    relit les tags pour regrouper les fichiers par album (plan_albums) : dossier de destination, genre détecté
+    par l'IA et date sont décidés une fois par album.
+    """
+    if config is None:
+        config = get_config()
+    if genre_patterns is None:
+        genre_patterns = load_tag_config()
+    if workers is None:
+        workers = config.tag.workers
+    music_dir = config.paths.music
 
     # Crée le dossier de base /music/downloads/ s’il n’existe pas
     ensure_directory(music_dir)
 
-    # Liste tous les fichiers dans /downloads/
-    processed_files = []
-    for filename in os.listdir(downloads_dir):
-        if filename.lower().endswith('.mp3'):
-            file_path = os.path.join(downloads_dir, filename)
-            process_mp3_file(file_path, music_dir, genre_patterns, config)
-            processed_files.append(filename)
-
-    # Supprime uniquement les fichiers qui ont été traités avec succès
-    for filename in processed_files:
-        file_path = os.path.join(downloads_dir, filename)
-        if os.path.isfile(file_path):
+
+    def process(index):
+        file_path = file_paths[index]
+        audio, loaded[index] = loaded[index], None  # Tags libérés dès que le fichier est traité
+        with source_locks.hold(os.path.abspath(file_path)):
+            if not os.path.exists(file_path):
+                return TagResult(file_path, None, STATUS_SKIPPED, "Fichier déjà traité")
+            return process_mp3_file(file_path, music_dir, genre_patterns, config, albums, audio)
+
+    workers = max(1, min(workers, len(file_paths)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tag-worker') as executor:
+        # Première passe : tags lus une seule fois (réutilisés par process_mp3_file), regroupement par album et
+        # décisions communes (dossier, genre IA par requêtes groupées, date)
+        loaded = list(executor.map(load_tags, file_paths))
+        facts = [album_facts(audio, file_path, music_dir, genre_patterns, config)
+                 for file_path, audio in zip(file_paths, loaded) if audio is not None]
+        albums = plan_albums(facts, music_dir, config)
+        log_action("Fichiers regroupés par album", music_dir, f"{len(file_paths)} fichier(s), {len(albums)} album(s)")
+        results = list(executor.map(process, range(len(file_paths))))
+    # Écritures de ce lot seulement (d'autres jobs ou le mode watch peuvent écrire en même temps)
+    writes = [result.tag_write for result in results]
+    log_action("Écritures de tags du lot", music_dir, write_summary(writes.count(WRITE_IN_PLACE), writes.count(WRITE_REWRITE)))
+
+    try:
+        get_mapper(genre_patterns, genre_memo_path(config)).save()
+    except OSError as e:
+        log_action("Erreur lors de l'enregistrement du mémo des genres", GENRE_MEMO_FILE, f"Exception : {str(e)}")
+
+    # Supprime uniquement les fichiers qui ont été traités
+    for result in results:
+        if os.path.isfile(result.source):
             try:
-                os.remove(file_path)
-                log_action("Fichier supprimé de /downloads/", file_path, "Après traitement réussi")
+                os.remove(result.source)
+                log_action("Fichier supprimé de /downloads/", result.source, "Après traitement réussi")
             except Exception as e:
-                log_action("Erreur lors de la suppression", file_path, f"Exception : {str(e)}")
+                log_action("Erreur lors de la suppression", result.source, f"Exception : {str(e)}")
+    return results
+
+def list_mp3_files(directory):
+    """Liste les fichiers MP3 présents directement dans un dossier."""
+    return [os.path.join(directory, filename) for filename in os.listdir(directory) if filename.lower().endswith('.mp3')]
+
+def tag_directory(directory, config=None, genre_patterns=None):
+    """Traite les MP3 d'un seul dossier (typiquement le dossier de staging d'un job du consommateur)."""
+    return tag_files(list_mp3_files(directory), config, genre_patterns)
+
+def is_job_directory(path):
+    """Dossier de staging d'un job du consommateur (downloads/job-<id>/), tagué par le consommateur et son mode watch."""
+    return os.path.basename(path).startswith("job-")
+
+def start_watch(directory, config, skip_dir=None, workers=None, tracker=None):
+    """Lance le tagging au fil de l'eau des MP3 arrivant dans directory ; retourne le DownloadWatcher (stop() pour l'arrêter).
+
+    tracker (facultatif, queue_consumer.StagingDirs) partage les fichiers avec leurs jobs : tracker.claim(chemins)
+    retourne ceux à traiter maintenant, tracker.release(chemins, résultats) est appelé une fois le lot terminé.
+    """
+
+    def process_files(file_paths):
+        if tracker is not None:
+            file_paths = tracker.claim(file_paths)
+            if not file_paths:
+                return
+        results = []
+        try:
+            # Configuration relue à chaque lot : une modification de config.json est prise en compte sans redémarrage
+            try:
+                current_config = get_config()
+            except (FileNotFoundError, ConfigError):
+                current_config = config
+            results = tag_files(file_paths, current_config, workers=workers)
+        finally:
+            if tracker is not None:
+                tracker.release(file_paths, results)
+        moved = sum(1 for result in results if result.status == STATUS_MOVED)
+        errors = sum(1 for result in results if result.status == STATUS_ERROR)
+        log_action("Lot tagué en mode watch", directory, f"{moved} déplacé(s), {errors} erreur(s), {len(results) - moved - errors} déjà traité(s)")
+
+    def log(message):
+        log_action("Mode watch", directory, message)
+
+    watch_config = config.watch
+    return DownloadWatcher(directory, process_files, watch_config.settle, watch_config.sweep_interval,
+                           watch_config.max_batch, skip_dir, log).start()
+
+def main():
+    """Scanne et traite tous les fichiers MP3 dans /downloads/ (ou le dossier donné), sans supprimer les fichiers restants sauf en cas de succès."""
+    parser = argparse.ArgumentParser(description="Tague, renomme et déplace les MP3 téléchargés vers la bibliothèque.")
+    parser.add_argument("--directory", help="Dossier à traiter (par défaut : paths.downloads de config.json).")
+    parser.add_argument("--workers", type=int, help="Fichiers traités en parallèle (par défaut : tag.workers de config.json).")
+    parser.add_argument("--watch", action="store_true", help="Rester actif et traiter les fichiers dès leur arrivée. Les dossiers job-* sont ignorés : ils sont tagués au fil de l'eau par le consommateur lui-même avec watch.enabled.")
+    args = parser.parse_args()
+
+    config = get_config()
+    if args.watch:
+        directory = args.directory or config.paths.downloads
+        watcher = start_watch(directory, config, skip_dir=is_job_directory, workers=args.workers)
+        print(f"Surveillance de {directory} (Ctrl+C pour arrêter)")
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            stop.wait()
+        except KeyboardInterrupt:
+            pass
+        watcher.stop()
+        status_log.close_all()
+        return
+    start_time = time.time()
+    directory = args.directory or config.paths.downloads
+    results = tag_files(list_mp3_files(directory), config, workers=args.workers)
+    errors = [result for result in results if result.status == STATUS_ERROR]
+    for result in errors:
+        print(f"Erreur pour {result.source} : {result.message}", file=sys.stderr)
+    print(f"{len(results)} fichier(s) traité(s) en {time.time() - start_time:.2f} secondes : {len(results) - len(errors)} déplacé(s), {len(errors)} erreur(s)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,57 @@
+import threading
+
+# Marge (padding) réservée dans l'en-tête ID3 : paroles synchronisées, genre ou titre plus long s'y écrivent sans
+# décaler les données audio, donc sans réécrire tout le fichier
+LIBRARY_PADDING = 64 * 1024
+# En dessous de cette marge, un fichier qui entre dans la bibliothèque est réécrit avec LIBRARY_PADDING
+FILING_MIN_PADDING = 16 * 1024
+
+# Mode d'une écriture de tags, retourné par save_id3 (et TagEdit.save)
+WRITE_IN_PLACE = 'in_place'
+WRITE_REWRITE = 'rewrite'
+
+def write_summary(in_place, rewrites):
+    return f"{in_place} écriture(s) sur place, {rewrites} réécriture(s) complète(s)"
+
+class WriteStats:
+    """Compteurs des écritures de tags du processus : sur place (dans la marge existante) ou avec réécriture complète."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_place = 0
+        self.rewrites = 0
+
+    def record(self, mode):
+        with self.lock:
+            if mode == WRITE_IN_PLACE:
+                self.in_place += 1
+            else:
+                self.rewrites += 1
+
+    def summary(self):
+        """Bilan depuis le démarrage du processus (scripts en ligne de commande) ; tag_files compte ses propres écritures."""
+        with self.lock:
+            return write_summary(self.in_place, self.rewrites)
+
+WRITE_STATS = WriteStats()
+
+def save_id3(id3, path, min_padding=0):
+    """Écrit les tags ID3 (objet mutagen) de path ; retourne le mode d'écriture (WRITE_IN_PLACE ou WRITE_REWRITE).
+
+    Tant que les nouvelles trames tiennent dans la marge existante (et qu'il reste au moins min_padding octets),
+    seul l'en-tête est réécrit. Sinon le fichier est réécrit une fois avec LIBRARY_PADDING octets de marge, pour
+    que les modifications suivantes se fassent à nouveau sur place.
+    """
+    decision = {}
+
+    def padding(info):
+        if info.padding >= max(min_padding, 0):
+            decision['in_place'] = True
+            return info.padding  # Taille d'en-tête inchangée : mutagen écrit sur place
+        decision['in_place'] = False
+        return max(LIBRARY_PADDING, min_padding)
+
+    id3.save(path, padding=padding)
+    mode = WRITE_IN_PLACE if decision.get('in_place') else WRITE_REWRITE
+    WRITE_STATS.record(mode)
+    return mode
@@ -21,6 +21,26 @@ if (!isset($_POST['urls'])) {
 $urls = explode("\n", trim($_POST['urls']));
 $sync = isset($_POST['sync']) && $_POST['sync'] == 1;
 
+// Classe de job imposée par l'appelant ('interactive' ou 'bulk'), sinon déduite de l'URL
+$forcedJobClass = isset($_POST['job_class']) && in_array($_POST['job_class'], ['interactive', 'bulk'], true) ? $_POST['job_class'] : null;
+
+// Les morceaux isolés passent dans la file interactive ; playlists, albums, artistes et synchronisations dans la file bulk
+function jobClass(string $url, bool $sync): string
+{
+    if ($sync) {
+        return 'bulk';
+    }
+    if (preg_match('#^spotify:(playlist|album|artist|show):#', $url) || preg_match('#spotify\.com/(?:intl-[a-z-]+/)?(playlist|album|artist|show)/#i', $url)) {
+        return 'bulk';
+    }
+    return 'interactive';
+}
+
+$queues = [
+    'interactive' => 'spotdl_queue',
+    'bulk' => 'spotdl_bulk_queue'
+];
+
 // Charger les identifiants Spotify depuis le fichier de configuration
 
 $spotifyConfig = $config->getSpotifyConfig();
@@ -32,18 +52,20 @@ $client_id = $spotifyConfig['client_id'];
 $client_secret = $spotifyConfig['client_secret'];
 
 try {
-    // Envoyer chaque URL à la file spotdl_queue via Handler
-    $queue = 'spotdl_queue';
+    // Envoyer chaque URL dans la file de sa classe (spotdl_queue ou spotdl_bulk_queue) via Handler
     foreach ($urls as $url) {
         $url = trim($url);
         if (!empty($url)) {
+            $class = $forcedJobClass ?? jobClass($url, $sync);
             $messageData = [
                 'url' => $url,
                 'sync' => $sync,
+                'job_class' => $class,
+                'enqueued_at' => microtime(true),
                 'client_id' => $client_id,
                 'client_secret' => $client_secret
             ];
-            $handler->sendMessage($queue, $messageData);
+            $handler->sendMessage($queues[$class], $messageData);
 
             // Journaliser l'ajout dans history.txt avec gestion des permissions
             $log_file = '../log/history.txt';
@@ -52,7 +74,7 @@ try {
                 throw new Exception("Impossible de créer le dossier $log_dir");
             }
             if (is_writable($log_dir)) {
-                file_put_contents($log_file, date('Y-m-d H:i:s') . " - Ajouté à la file : $url\n", FILE_APPEND | LOCK_EX);
+                file_put_contents($log_file, date('Y-m-d H:i:s') . " - Ajouté à la file ($class) : $url\n", FILE_APPEND | LOCK_EX);
             } else {
                 throw new Exception("Pas de permissions d'écriture dans $log_dir");
             }
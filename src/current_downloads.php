@@ -1,17 +1,37 @@
 <?php
 $download_dir = "/downloads/"; // Chemin absolu vers le dossier
 
-if (is_dir($download_dir)) {
-    $files = scandir($download_dir);
-    $output = "<h3>".(count($files) - 2)." fichiers téléchargés</h3><ul class='ui list'>";
-    foreach ($files as $file) {
-        if ($file !== "." && $file !== "..") {
-            $file_path = $download_dir . $file;
-            $file_size = filesize($file_path); // Taille en octets
-            $size_in_mb = round($file_size / (1024 * 1024), 2); // Conversion en Mo
-            $output .= "<li class='item'>$file - $size_in_mb Mo</li>";
+/**
+ * Liste les fichiers du dossier de téléchargement, y compris ceux des dossiers de job (job-<id>/) du consommateur
+ */
+function list_download_files(string $dir): array {
+    $files = [];
+    foreach (scandir($dir) as $entry) {
+        if ($entry === "." || $entry === "..") {
+            continue;
+        }
+        $path = $dir . $entry;
+        if (is_dir($path) && strpos($entry, 'job-') === 0) {
+            foreach (scandir($path) as $job_entry) {
+                if (is_file($path . '/' . $job_entry)) {
+                    $files[$entry . '/' . $job_entry] = $path . '/' . $job_entry;
+                }
+            }
+        } elseif (is_file($path)) {
+            $files[$entry] = $path;
         }
     }
+    return $files;
+}
+
+if (is_dir($download_dir)) {
+    $files = list_download_files($download_dir);
+    $output = "<h3>".count($files)." fichiers téléchargés</h3><ul class='ui list'>";
+    foreach ($files as $file => $file_path) {
+        $file_size = filesize($file_path); // Taille en octets
+        $size_in_mb = round($file_size / (1024 * 1024), 2); // Conversion en Mo
+        $output .= "<li class='item'>$file - $size_in_mb Mo</li>";
+    }
     $output .= "</ul>";
     if ($output === "<ul class='ui list'></ul>") {
         echo "Aucun fichier en cours de téléchargement.";
@@ -3,9 +3,30 @@ header('Content-Type: text/html');
 
 $status_history_file = '../log/status_history.txt';
 
+/**
+ * Lit les dernières lignes d'un fichier en ne parcourant que sa fin (le journal peut atteindre plusieurs Mo avant rotation)
+ */
+function tail_lines(string $file, int $count, int $chunk_size = 8192): array {
+    $handle = fopen($file, 'rb');
+    if ($handle === false) {
+        return [];
+    }
+    fseek($handle, 0, SEEK_END);
+    $position = ftell($handle);
+    $buffer = '';
+    while ($position > 0 && substr_count($buffer, "\n") <= $count) {
+        $read = min($chunk_size, $position);
+        $position -= $read;
+        fseek($handle, $position);
+        $buffer = fread($handle, $read) . $buffer;
+    }
+    fclose($handle);
+    $lines = array_filter(explode("\n", $buffer), 'strlen');
+    return array_slice($lines, -$count);
+}
+
 if (file_exists($status_history_file)) {
-    $lines = file($status_history_file, FILE_SKIP_EMPTY_LINES | FILE_IGNORE_NEW_LINES);
-    $recent_lines = array_slice($lines, -10);  // Les 10 dernières entrées
+    $recent_lines = tail_lines($status_history_file, 10);  // Les 10 dernières entrées
     $current_status = implode("\n", $recent_lines);
     echo htmlspecialchars($current_status ?: 'Aucun traitement en cours...');
 } else {
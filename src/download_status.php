@@ -23,7 +23,13 @@ try {
 
     $messages = [];
     $callback = function ($msg) use (&$messages) {
-        $messages[] = json_decode($msg->body, true);
+        $decoded = json_decode($msg->body, true);
+        // Le consommateur publie les événements de progression par lots : {"events": [...]}
+        if (is_array($decoded) && isset($decoded['events']) && is_array($decoded['events'])) {
+            $messages = array_merge($messages, $decoded['events']);
+        } else {
+            $messages[] = $decoded;
+        }
         $msg->ack();  // Accuse réception pour supprimer le message de la queue
     };
 
@@ -12,15 +12,19 @@ use Model\Amqp\Handler;
 $handler = new Handler();
 
 try {
-    // Récupérer les informations de la file spotdl_queue via Handler
-    $queue = 'spotdl_queue';
-    $queueInfo = $handler->getQueueInfo($queue); // Nouvelle méthode à ajouter dans Handler
-    $messageCount = $queueInfo['message_count'];
-    $consumerCount = $queueInfo['consumer_count'];
+    // Récupérer les informations des files interactive et bulk via Handler
+    $queues = [
+        'Morceaux' => 'spotdl_queue',
+        'Playlists, albums et synchronisations' => 'spotdl_bulk_queue'
+    ];
+    foreach ($queues as $label => $queue) {
+        $queueInfo = $handler->getQueueInfo($queue);
+        $messageCount = $queueInfo['message_count'];
+        $consumerCount = $queueInfo['consumer_count'];
 
-    // Afficher les informations de la file
-    echo "<p>Messages en attente : $messageCount</p>";
-    echo "<p>Consommateurs actifs : $consumerCount</p>";
+        // Afficher les informations de la file
+        echo "<p>" . htmlspecialchars($label) . " - messages en attente : $messageCount, consommateurs actifs : $consumerCount</p>";
+    }
     echo "<p>Derniers messages (limité à 5) :</p>";
     echo "<ul>";
 